@@ -0,0 +1,230 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+CHUNK_SIZE = 5000
+MAX_LEAD_DAYS = 365
+# Statuses that hold a room for revenue reporting
+SOLD_STATUSES = ('confirmed', 'completed')
+# partitions.py moves bookings whose check_out month closed this long ago
+# into bookings_archive; months reaching back that far read both tables
+ARCHIVE_RETAIN_MONTHS = 6
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+def archive_cutoff():
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - ARCHIVE_RETAIN_MONTHS
+    return date(index // 12, index % 12 + 1, 1)
+
+def booking_tables(first_day):
+    # Archived rows all check out before the cutoff, so later days never need it
+    return ('bookings', 'bookings_archive') if first_day < archive_cutoff() else ('bookings',)
+
+def union_all(select, tables, params):
+    # (query, params) running select once per table; select names its table {table}
+    query = ' UNION ALL '.join(select.format(table=table) for table in tables)
+    return query, [value for _ in tables for value in params]
+
+def months_between(start, end):
+    month = month_start(start)
+    while month < end:
+        yield month
+        month = next_month(month)
+
+class MonthlyAnalyticsCache:
+    # Per-month occupancy and revenue matrices, recomputed only when the
+    # month's bookings fingerprint (row count, latest updated_at) changes
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+        self._months = {}
+        self._lock = threading.Lock()
+
+    def hotels(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, rooms FROM hotels ORDER BY id")
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def fingerprint(self, conn, month, hotel_ids):
+        query, params = union_all("""
+            SELECT COUNT(*) as total, MAX(updated_at) as updated FROM {table}
+            WHERE check_out > %s AND check_in < %s
+        """, booking_tables(month), (month, next_month(month)))
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT SUM(total), MAX(updated) FROM ({query}) parts", params)
+        count, updated = cursor.fetchone()
+        cursor.close()
+        return (count, updated, tuple(hotel_ids))
+
+    def compute_month(self, conn, month, hotel_index):
+        end = next_month(month)
+        days = (end - month).days
+        origin = month.toordinal()
+        sold = np.zeros((len(hotel_index), days + 1), dtype=np.int64)
+        revenue = np.zeros((len(hotel_index), days + 1), dtype=np.float64)
+
+        # Unbuffered cursor + fetchmany keeps memory bounded by CHUNK_SIZE
+        placeholders = ', '.join(['%s'] * len(SOLD_STATUSES))
+        query, params = union_all(f"""
+            SELECT hotel_id, check_in, check_out, total_amount, rooms FROM {{table}}
+            WHERE check_out > %s AND check_in < %s AND status IN ({placeholders})
+        """, booking_tables(month), (month, end, *SOLD_STATUSES))
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query, params)
+
+        while True:
+            chunk = cursor.fetchmany(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunk = [row for row in chunk if row[0] in hotel_index]
+            if not chunk:
+                continue
+            count = len(chunk)
+            rows = np.fromiter((hotel_index[r[0]] for r in chunk), dtype=np.intp, count=count)
+            check_in = np.fromiter((r[1].toordinal() for r in chunk), dtype=np.int64, count=count)
+            check_out = np.fromiter((r[2].toordinal() for r in chunk), dtype=np.int64, count=count)
+            amount = np.fromiter((float(r[3]) for r in chunk), dtype=np.float64, count=count)
+            rooms = np.fromiter((r[4] for r in chunk), dtype=np.int64, count=count)
+
+            # A booking made from a multi-room hold sells that many rooms a
+            # night; its total covers all of them, so ADR is per room-night
+            nightly_rate = amount / np.maximum(check_out - check_in, 1)
+            first = np.clip(check_in - origin, 0, days)
+            last = np.clip(check_out - origin, 0, days)
+            np.add.at(sold, (rows, first), rooms)
+            np.add.at(sold, (rows, last), -rooms)
+            np.add.at(revenue, (rows, first), nightly_rate)
+            np.add.at(revenue, (rows, last), -nightly_rate)
+        cursor.close()
+
+        return np.cumsum(sold, axis=1)[:, :days], np.cumsum(revenue, axis=1)[:, :days]
+
+    def month(self, conn, month, hotel_ids):
+        key = month
+        fingerprint = self.fingerprint(conn, month, hotel_ids)
+        with self._lock:
+            cached = self._months.get(key)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        hotel_index = {hotel_id: i for i, hotel_id in enumerate(hotel_ids)}
+        result = self.compute_month(conn, month, hotel_index)
+        with self._lock:
+            self._months[key] = (fingerprint, result)
+        return result
+
+    def occupancy(self, start, end, hotel_filter=None):
+        conn = self.get_connection()
+        try:
+            hotels = self.hotels(conn)
+            hotel_ids = [h[0] for h in hotels]
+            sold_parts, revenue_parts = [], []
+            for month in months_between(start, end):
+                sold, revenue = self.month(conn, month, hotel_ids)
+                sold_parts.append(sold)
+                revenue_parts.append(revenue)
+        finally:
+            conn.close()
+
+        # Trim the first and last month to the requested window
+        offset = (start - month_start(start)).days
+        days = (end - start).days
+        sold = np.concatenate(sold_parts, axis=1)[:, offset:offset + days]
+        revenue = np.concatenate(revenue_parts, axis=1)[:, offset:offset + days]
+        capacity = np.array([h[2] for h in hotels], dtype=np.float64)[:, None]
+
+        if hotel_filter:
+            keep = [i for i, h in enumerate(hotels) if h[0] in hotel_filter]
+            hotels = [hotels[i] for i in keep]
+            sold, revenue, capacity = sold[keep], revenue[keep], capacity[keep]
+
+        return summarize(hotels, start, sold, revenue, capacity)
+
+    def invalidate(self):
+        with self._lock:
+            self._months.clear()
+
+def safe_divide(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator, dtype=np.float64),
+                     where=denominator > 0)
+
+def summarize(hotels, start, sold, revenue, capacity):
+    days = sold.shape[1]
+    available = np.broadcast_to(capacity, sold.shape)
+
+    per_hotel = []
+    for i, (hotel_id, name, rooms) in enumerate(hotels):
+        per_hotel.append({
+            'hotel_id': hotel_id,
+            'name': name,
+            'rooms': rooms,
+            'occupancy': np.round(safe_divide(sold[i], available[i]), 4).tolist(),
+            'adr': np.round(safe_divide(revenue[i], sold[i]), 2).tolist(),
+            'revpar': np.round(safe_divide(revenue[i], available[i]), 2).tolist(),
+            'period': {
+                'occupancy': round(float(safe_divide(sold[i].sum(), available[i].sum())), 4),
+                'adr': round(float(safe_divide(revenue[i].sum(), sold[i].sum())), 2),
+                'revpar': round(float(safe_divide(revenue[i].sum(), available[i].sum())), 2),
+                'revenue': round(float(revenue[i].sum()), 2),
+                'room_nights_sold': int(sold[i].sum())
+            }
+        })
+
+    portfolio_sold = sold.sum(axis=0)
+    portfolio_revenue = revenue.sum(axis=0)
+    portfolio_available = available.sum(axis=0)
+    return {
+        'start': start,
+        'dates': [start + timedelta(days=d) for d in range(days)],
+        'portfolio': {
+            'occupancy': np.round(safe_divide(portfolio_sold, portfolio_available), 4).tolist(),
+            'adr': np.round(safe_divide(portfolio_revenue, portfolio_sold), 2).tolist(),
+            'revpar': np.round(safe_divide(portfolio_revenue, portfolio_available), 2).tolist()
+        },
+        'hotels': per_hotel
+    }
+
+def booking_pace(conn, start, end, hotel_id=None):
+    # Bookings for stays arriving in [start, end) by lead time (days between
+    # booking and arrival); the curve reads "bookings on hand N days out"
+    counts = np.zeros(MAX_LEAD_DAYS + 1, dtype=np.int64)
+    placeholders = ', '.join(['%s'] * len(SOLD_STATUSES))
+    select = f"""
+        SELECT DATEDIFF(check_in, DATE(created_at)) FROM {{table}}
+        WHERE check_in >= %s AND check_in < %s AND status IN ({placeholders})
+    """
+    params = [start, end, *SOLD_STATUSES]
+    if hotel_id:
+        select += " AND hotel_id = %s"
+        params.append(hotel_id)
+    query, params = union_all(select, booking_tables(start), params)
+    cursor = conn.cursor(buffered=False)
+    cursor.execute(query, params)
+
+    while True:
+        chunk = cursor.fetchmany(CHUNK_SIZE)
+        if not chunk:
+            break
+        lead = np.clip(np.fromiter((r[0] for r in chunk), dtype=np.int64, count=len(chunk)), 0, MAX_LEAD_DAYS)
+        counts += np.bincount(lead, minlength=MAX_LEAD_DAYS + 1)
+    cursor.close()
+
+    on_hand = np.cumsum(counts[::-1])[::-1]
+    total = int(counts.sum())
+    return {
+        'start': start,
+        'end': end,
+        'total_bookings': total,
+        'lead_days': list(range(MAX_LEAD_DAYS + 1)),
+        'bookings_by_lead': counts.tolist(),
+        'on_hand': on_hand.tolist(),
+        'median_lead_days': int(np.searchsorted(np.cumsum(counts), total / 2)) if total else None
+    }
@@ -1,21 +1,24 @@
-from flask import Flask, request, jsonify, render_template_string
-from flask_cors import CORS
-import mysql.connector
+from flask import Blueprint, Response, request, jsonify, render_template_string, stream_with_context
 import os
 import requests
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import booking_search
+from live import LiveFeed
+from common.admission import Admission
+from common.deadline import Deadlines
+from common.events import ChangeListener
+from common.service import Lazy, create_service, lazy_import, load_config, mysql_pool, run
+from common.responses import FieldSelectionError, select_fields
 
-app = Flask(__name__)
-CORS(app)
+config = load_config('admin-dashboard', port=8999)
+bp = Blueprint('admin', __name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'mysql-db'),
-    'user': os.getenv('DB_USER', 'hotel_user'),
-    'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
-    'database': os.getenv('DB_NAME', 'hotel_booking'),
-    'port': int(os.getenv('DB_PORT', 3306))
-}
+# numpy / pyarrow backed; loaded on first use (or by warm-up) instead of at import
+analytics = lazy_import('analytics')
+export = lazy_import('export')
 
 # Service URLs
 SERVICE_URLS = {
@@ -26,14 +29,84 @@ SERVICE_URLS = {
     'payment': 'http://payment-service:85'
 }
 
+BOOKING_COLUMNS = (
+    'id', 'booking_ref', 'hotel_id', 'user_id', 'check_in', 'check_out', 'guests',
+    'rooms', 'room_type', 'special_requests', 'total_amount', 'status', 'payment_status',
+    'created_at', 'updated_at'
+)
+
+ADMIN_BOOKING_FIELDS = {
+    **{name: f'b.{name}' for name in BOOKING_COLUMNS},
+    'hotel_name': 'h.name',
+    'username': 'u.username',
+    'guest_email': 'u.email',
+}
+
+ADMIN_USER_FIELDS = {name: name for name in ('id', 'username', 'email', 'phone', 'role', 'created_at')}
+
+# Longest window a single analytics request may cover
+ANALYTICS_MAX_DAYS = 400
+
+# Change events that refresh the live feed before its next tick: hotel
+# writes, booking create/update/cancel and the payment-service sweeps,
+# charges and refunds, and user sign-ups and profile edits
+LIVE_ENTITIES = ('hotel', 'booking', 'payment', 'user')
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/admin', None, 'background', None),
+    ('/api/admin/analytics', None, 'background', 2),
+    ('/api/admin/exports', ('POST',), 'background', 1),
+    ('/api/admin/bookings/export.csv', None, 'background', 2),
+)
+
+# Request budgets in seconds where the REQUEST_BUDGET_MS default does not fit
+DEADLINE_ROUTES = (
+    ('/api/admin/analytics', None, 30),
+    # CSV exports stream for as long as the download takes
+    ('/api/admin/bookings/export.csv', None, 900),
+)
+
+deadlines = Deadlines.from_env(DEADLINE_ROUTES, mysql_pool.connect)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='background')
+
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    # Statements are bounded by the request deadline; their latency drives
+    # the adaptive concurrency limit
+    return admission.connect(deadlines.connect, **config.db)
+
+analytics_cache = Lazy(lambda: analytics.MonthlyAnalyticsCache(get_db_connection))
+
+# Export runs started from the API, by id
+exports = {}
+
+def run_export(export_id, tables, incremental, file_format):
+    exports[export_id]['status'] = 'running'
+    conn = get_db_connection()
+    try:
+        for table in tables:
+            exports[export_id]['results'].append(export.export_table(conn, table, incremental, file_format))
+        exports[export_id]['status'] = 'completed'
+    except Exception as e:
+        exports[export_id]['status'] = 'failed'
+        exports[export_id]['error'] = str(e)
+    finally:
+        conn.close()
+        exports[export_id]['finished_at'] = datetime.now()
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "service": "admin-dashboard"})
+def analytics_window():
+    # Defaults to the current quarter
+    today = datetime.now().date()
+    quarter_start = analytics.month_start(today.replace(month=(today.month - 1) // 3 * 3 + 1))
+    start = request.args.get('start')
+    end = request.args.get('end')
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else quarter_start
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else analytics.next_month(analytics.next_month(analytics.next_month(start)))
+    if end <= start or (end - start).days > ANALYTICS_MAX_DAYS:
+        raise ValueError(f"end must be after start and at most {ANALYTICS_MAX_DAYS} days later")
+    return start, end
 
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def admin_dashboard():
     html_template = """
     <!DOCTYPE html>
@@ -44,6 +117,7 @@ def admin_dashboard():
         <title>Hotel Booking - Admin Dashboard</title>
         <script src="https://cdn.tailwindcss.com"></script>
         <script src="https://unpkg.com/lucide@latest/dist/umd/lucide.js"></script>
+        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
     </head>
     <body class="bg-gray-50">
         <div class="min-h-screen">
@@ -119,6 +193,26 @@ def admin_dashboard():
                     </div>
                 </div>
                 
+                <!-- Analytics -->
+                <div class="grid grid-cols-1 lg:grid-cols-2 gap-6 mb-8">
+                    <div class="bg-white rounded-lg shadow">
+                        <div class="px-6 py-4 border-b">
+                            <h2 class="text-lg font-semibold">Occupancy &amp; RevPAR (this quarter)</h2>
+                        </div>
+                        <div class="p-6">
+                            <canvas id="occupancyChart" height="200"></canvas>
+                        </div>
+                    </div>
+                    <div class="bg-white rounded-lg shadow">
+                        <div class="px-6 py-4 border-b">
+                            <h2 class="text-lg font-semibold">Booking Pace (this quarter)</h2>
+                        </div>
+                        <div class="p-6">
+                            <canvas id="paceChart" height="200"></canvas>
+                        </div>
+                    </div>
+                </div>
+                
                 <!-- Recent Activity -->
                 <div class="bg-white rounded-lg shadow">
                     <div class="px-6 py-4 border-b">
@@ -137,117 +231,187 @@ def admin_dashboard():
             // Initialize Lucide icons
             lucide.createIcons();
             
+            function renderStats(stats) {
+                // Live deltas carry only the fields that changed
+                if ('hotels' in stats) document.getElementById('totalHotels').textContent = stats.hotels || '0';
+                if ('bookings' in stats) document.getElementById('totalBookings').textContent = stats.bookings || '0';
+                if ('users' in stats) document.getElementById('totalUsers').textContent = stats.users || '0';
+                if ('revenue' in stats) document.getElementById('totalRevenue').textContent = '$' + (stats.revenue || '0');
+            }
+            
+            function renderServices(services) {
+                const serviceStatusContainer = document.getElementById('serviceStatus');
+                serviceStatusContainer.innerHTML = '';
+                
+                services.forEach(service => {
+                    const statusColor = service.status === 'healthy' ? 'green' : 'red';
+                    const statusDiv = document.createElement('div');
+                    statusDiv.className = 'flex items-center justify-between p-3 border rounded-lg';
+                    statusDiv.innerHTML = `
+                        <span class="font-medium">${service.name}</span>
+                        <span class="px-2 py-1 text-xs rounded-full bg-${statusColor}-100 text-${statusColor}-800">
+                            ${service.status}
+                        </span>
+                    `;
+                    serviceStatusContainer.appendChild(statusDiv);
+                });
+            }
+            
             // Load dashboard data
             async function loadDashboardData() {
                 try {
-                    // Load stats
-                    const statsResponse = await fetch('/api/admin/stats');
-                    const stats = await statsResponse.json();
-                    
-                    document.getElementById('totalHotels').textContent = stats.hotels || '0';
-                    document.getElementById('totalBookings').textContent = stats.bookings || '0';
-                    document.getElementById('totalUsers').textContent = stats.users || '0';
-                    document.getElementById('totalRevenue').textContent = '$' + (stats.revenue || '0');
-                    
-                    // Load service status
-                    const serviceResponse = await fetch('/api/admin/services');
-                    const services = await serviceResponse.json();
-                    
-                    const serviceStatusContainer = document.getElementById('serviceStatus');
-                    serviceStatusContainer.innerHTML = '';
-                    
-                    services.forEach(service => {
-                        const statusColor = service.status === 'healthy' ? 'green' : 'red';
-                        const statusDiv = document.createElement('div');
-                        statusDiv.className = 'flex items-center justify-between p-3 border rounded-lg';
-                        statusDiv.innerHTML = `
-                            <span class="font-medium">${service.name}</span>
-                            <span class="px-2 py-1 text-xs rounded-full bg-${statusColor}-100 text-${statusColor}-800">
-                                ${service.status}
-                            </span>
-                        `;
-                        serviceStatusContainer.appendChild(statusDiv);
+                    renderStats(await (await fetch('/api/admin/stats')).json());
+                    renderServices(await (await fetch('/api/admin/services')).json());
+                } catch (error) {
+                    console.error('Error loading dashboard data:', error);
+                }
+            }
+            
+            // Stats and service status are pushed by the server; the first
+            // message is a full snapshot, later ones only what changed
+            function connectLive() {
+                const live = new EventSource('/api/admin/live');
+                const apply = event => {
+                    const update = JSON.parse(event.data);
+                    if (update.stats) renderStats(update.stats);
+                    if (update.services) renderServices(update.services);
+                };
+                live.addEventListener('snapshot', apply);
+                live.addEventListener('delta', apply);
+            }
+            
+            // Load analytics charts
+            async function loadAnalytics() {
+                try {
+                    const occupancy = await (await fetch('/api/admin/analytics/occupancy')).json();
+                    new Chart(document.getElementById('occupancyChart'), {
+                        type: 'line',
+                        data: {
+                            labels: occupancy.dates,
+                            datasets: [
+                                { label: 'Occupancy %', data: occupancy.portfolio.occupancy.map(v => v * 100), yAxisID: 'y', borderColor: '#2563eb', pointRadius: 0 },
+                                { label: 'RevPAR $', data: occupancy.portfolio.revpar, yAxisID: 'y1', borderColor: '#ea580c', pointRadius: 0 }
+                            ]
+                        },
+                        options: { scales: { y: { position: 'left', min: 0, max: 100 }, y1: { position: 'right', min: 0, grid: { drawOnChartArea: false } } } }
                     });
                     
+                    const pace = await (await fetch('/api/admin/analytics/pace')).json();
+                    const horizon = 120;
+                    new Chart(document.getElementById('paceChart'), {
+                        type: 'line',
+                        data: {
+                            labels: pace.lead_days.slice(0, horizon + 1),
+                            datasets: [{ label: 'Bookings on hand (days before arrival)', data: pace.on_hand.slice(0, horizon + 1), borderColor: '#16a34a', pointRadius: 0 }]
+                        },
+                        options: { scales: { x: { reverse: true } } }
+                    });
                 } catch (error) {
-                    console.error('Error loading dashboard data:', error);
+                    console.error('Error loading analytics:', error);
                 }
             }
             
             // Load data on page load
-            loadDashboardData();
-            
-            // Refresh data every 30 seconds
-            setInterval(loadDashboardData, 30000);
+            loadAnalytics();
+            if (window.EventSource) {
+                connectLive();
+            } else {
+                // Refresh data every 30 seconds
+                loadDashboardData();
+                setInterval(loadDashboardData, 30000);
+            }
         </script>
     </body>
     </html>
     """
     return render_template_string(html_template)
 
-@app.route('/api/admin/stats', methods=['GET'])
+def collect_stats():
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    # Get counts from different tables
+    stats = {}
+    
+    # Hotels count
+    cursor.execute("SELECT COUNT(*) as count FROM hotels")
+    stats['hotels'] = cursor.fetchone()['count']
+    
+    # Bookings count
+    cursor.execute("SELECT COUNT(*) as count FROM bookings")
+    stats['bookings'] = cursor.fetchone()['count']
+    
+    # Users count
+    cursor.execute("SELECT COUNT(*) as count FROM users")
+    stats['users'] = cursor.fetchone()['count']
+    
+    # Revenue
+    cursor.execute("SELECT SUM(amount) as total FROM payments WHERE amount > 0")
+    result = cursor.fetchone()
+    stats['revenue'] = result['total'] if result['total'] else 0
+    
+    cursor.close()
+    conn.close()
+    return stats
+
+def check_service(service_name, service_url):
+    try:
+        response = requests.get(f"{service_url}/health", timeout=deadlines.timeout(5), headers=deadlines.headers())
+        if response.status_code == 200:
+            status = "healthy"
+        else:
+            status = "unhealthy"
+    except:
+        status = "unreachable"
+    
+    return {
+        "name": service_name.title() + " Service",
+        "status": status,
+        "url": service_url
+    }
+
+def collect_services():
+    # Health checks run side by side, so one slow service costs 5s, not 25s
+    with ThreadPoolExecutor(max_workers=len(SERVICE_URLS)) as pool:
+        return list(pool.map(lambda item: check_service(*item), SERVICE_URLS.items()))
+
+def collect_live():
+    return {"stats": collect_stats(), "services": collect_services()}
+
+# One producer for every open dashboard; change events trigger an early refresh
+live_feed = LiveFeed(collect_live, interval=float(os.getenv('LIVE_INTERVAL', 5)))
+live_events = ChangeListener(get_db_connection, LIVE_ENTITIES, live_feed.notify)
+
+@bp.route('/api/admin/stats', methods=['GET'])
 def get_admin_stats():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get counts from different tables
-        stats = {}
-        
-        # Hotels count
-        cursor.execute("SELECT COUNT(*) as count FROM hotels")
-        stats['hotels'] = cursor.fetchone()['count']
-        
-        # Bookings count
-        cursor.execute("SELECT COUNT(*) as count FROM bookings")
-        stats['bookings'] = cursor.fetchone()['count']
-        
-        # Users count
-        cursor.execute("SELECT COUNT(*) as count FROM users")
-        stats['users'] = cursor.fetchone()['count']
-        
-        # Revenue
-        cursor.execute("SELECT SUM(amount) as total FROM payments WHERE amount > 0")
-        result = cursor.fetchone()
-        stats['revenue'] = result['total'] if result['total'] else 0
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(stats)
+        return jsonify(collect_stats())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/services', methods=['GET'])
+@bp.route('/api/admin/services', methods=['GET'])
 def get_service_status():
-    services = []
-    
-    for service_name, service_url in SERVICE_URLS.items():
-        try:
-            response = requests.get(f"{service_url}/health", timeout=5)
-            if response.status_code == 200:
-                status = "healthy"
-            else:
-                status = "unhealthy"
-        except:
-            status = "unreachable"
-        
-        services.append({
-            "name": service_name.title() + " Service",
-            "status": status,
-            "url": service_url
-        })
-    
-    return jsonify(services)
+    return jsonify(collect_services())
+
+@bp.route('/api/admin/live', methods=['GET'])
+def live_stream():
+    live_events.start()
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(live_feed.stream(request.headers.get('Last-Event-ID')), mimetype='text/event-stream', headers=headers)
+
+@bp.route('/health/live', methods=['GET'])
+def live_stats():
+    return jsonify(live_feed.stats())
 
-@app.route('/api/admin/bookings', methods=['GET'])
+@bp.route('/api/admin/bookings', methods=['GET'])
 def get_admin_bookings():
     try:
+        columns = select_fields(ADMIN_BOOKING_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT b.*, h.name as hotel_name, u.username
+        query = f"""
+        SELECT {columns}
         FROM bookings b
         JOIN hotels h ON b.hotel_id = h.id
         JOIN users u ON b.user_id = u.id
@@ -261,17 +425,67 @@ def get_admin_bookings():
         conn.close()
         
         return jsonify(bookings)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/users', methods=['GET'])
+def booking_search_tables():
+    # ?archive=true also searches stays moved to bookings_archive
+    if request.args.get('archive', 'false').lower() == 'true':
+        return booking_search.ALL_TABLES
+    return booking_search.LIVE_TABLES
+
+@bp.route('/api/admin/bookings/search', methods=['GET'])
+def search_admin_bookings():
+    try:
+        columns = select_fields(ADMIN_BOOKING_FIELDS, required=('id', 'created_at'))
+        limit = int(request.args.get('limit', booking_search.DEFAULT_LIMIT))
+        conn = get_db_connection()
+
+        where, params = booking_search.parse_filters(conn, request.args)
+        result = booking_search.search(
+            conn, where, params, columns, booking_search_tables(), limit, request.args.get('cursor')
+        )
+
+        conn.close()
+
+        return jsonify(result)
+    except (FieldSelectionError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/admin/bookings/export.csv', methods=['GET'])
+def export_admin_bookings():
+    # Same filters as the search, every matching row, streamed as it is read
+    try:
+        columns = select_fields(ADMIN_BOOKING_FIELDS)
+        conn = get_db_connection()
+        where, params = booking_search.parse_filters(conn, request.args)
+    except (FieldSelectionError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    filename = f"bookings-{datetime.now().strftime('%Y%m%dT%H%M%S')}.csv"
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }
+    rows = booking_search.export_csv(conn, where, params, columns, booking_search_tables())
+    return Response(stream_with_context(rows), mimetype='text/csv', headers=headers)
+
+@bp.route('/api/admin/users', methods=['GET'])
 def get_admin_users():
     try:
+        columns = select_fields(ADMIN_USER_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT id, username, email, phone, role, created_at
+        query = f"""
+        SELECT {columns}
         FROM users
         ORDER BY created_at DESC
         """
@@ -282,10 +496,12 @@ def get_admin_users():
         conn.close()
         
         return jsonify(users)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/revenue', methods=['GET'])
+@bp.route('/api/admin/revenue', methods=['GET'])
 def get_revenue_data():
     try:
         conn = get_db_connection()
@@ -309,5 +525,71 @@ def get_revenue_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/api/admin/analytics/occupancy', methods=['GET'])
+def get_occupancy_analytics():
+    try:
+        start, end = analytics_window()
+        hotel_ids = request.args.get('hotel_id', '')
+        hotel_filter = {int(h) for h in hotel_ids.split(',') if h} or None
+        
+        return jsonify(analytics_cache.occupancy(start, end, hotel_filter))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/admin/analytics/pace', methods=['GET'])
+def get_booking_pace():
+    try:
+        start, end = analytics_window()
+        conn = get_db_connection()
+        pace = analytics.booking_pace(conn, start, end, request.args.get('hotel_id', type=int))
+        conn.close()
+        
+        return jsonify(pace)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/admin/exports', methods=['POST'])
+def start_export():
+    data = request.json or {}
+    tables = data.get('tables', list(export.EXPORT_TABLES))
+    file_format = data.get('format', 'parquet')
+    incremental = data.get('mode', 'incremental') == 'incremental'
+    
+    unknown = [table for table in tables if table not in export.EXPORT_TABLES]
+    if unknown:
+        return jsonify({"error": f"Unknown tables: {', '.join(unknown)}"}), 400
+    if file_format not in ('parquet', 'arrow'):
+        return jsonify({"error": f"Unknown format: {file_format}"}), 400
+    
+    export_id = uuid.uuid4().hex
+    exports[export_id] = {
+        "id": export_id,
+        "tables": tables,
+        "mode": 'incremental' if incremental else 'full',
+        "format": file_format,
+        "status": 'queued',
+        "results": [],
+        "started_at": datetime.now()
+    }
+    threading.Thread(target=run_export, args=(export_id, tables, incremental, file_format), daemon=True).start()
+    
+    return jsonify(exports[export_id]), 202
+
+@bp.route('/api/admin/exports/<export_id>', methods=['GET'])
+def get_export(export_id):
+    export = exports.get(export_id)
+    if not export:
+        return jsonify({"error": "Export not found"}), 404
+    return jsonify(export)
+
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8999, debug=True)
\ No newline at end of file
+    run(app, config)
@@ -0,0 +1,209 @@
+import csv
+import io
+from datetime import date, datetime, timedelta
+
+# Admin booking search. Filters combine freely and the leading one picks an
+# index that already yields rows newest first: booking_ref prefix
+# (idx_bookings_ref), guest email resolved to a user (idx_bookings_user_created),
+# hotel (idx_bookings_hotel_created), status (idx_bookings_status_created),
+# else idx_bookings_created. Pages are keyset ranges on (created_at, id), so
+# a deep page costs what the first one does. The first page carries a total:
+# counted exactly up to EXACT_COUNT_LIMIT rows, past that taken from the
+# optimizer's row estimate instead of counting millions of rows. The CSV
+# export writes the same rows straight off an unbuffered cursor.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+EXACT_COUNT_LIMIT = 10000
+CHUNK_SIZE = 5000
+
+STATUSES = ('pending', 'confirmed', 'cancelled', 'completed')
+LIVE_TABLES = ('bookings',)
+ALL_TABLES = ('bookings', 'bookings_archive')
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+class SearchError(ValueError):
+    pass
+
+def parse_date(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f"{name} must be a date (YYYY-MM-DD)")
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def find_user(conn, email):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE email = %s", (email.strip(),))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+def parse_filters(conn, args):
+    # Returns (WHERE clause over alias b, params)
+    conditions, params = [], []
+
+    ref = args.get('ref', '').strip()
+    if ref:
+        conditions.append("b.booking_ref LIKE %s")
+        params.append(escape_like(ref) + '%')
+
+    email = args.get('email', '').strip()
+    if email:
+        user_id = find_user(conn, email)
+        # An unknown guest matches nothing; MySQL answers FALSE without a read
+        conditions.append("b.user_id = %s" if user_id is not None else "FALSE")
+        if user_id is not None:
+            params.append(user_id)
+
+    hotel_id = args.get('hotel_id')
+    if hotel_id:
+        try:
+            params.append(int(hotel_id))
+        except ValueError:
+            raise SearchError("hotel_id must be an integer")
+        conditions.append("b.hotel_id = %s")
+
+    status = [value.strip() for value in args.get('status', '').split(',') if value.strip()]
+    if status:
+        unknown = [value for value in status if value not in STATUSES]
+        if unknown:
+            raise SearchError(f"Unknown status: {', '.join(unknown)}")
+        conditions.append(f"b.status IN ({', '.join(['%s'] * len(status))})")
+        params.extend(status)
+
+    # Date ranges are inclusive on both ends
+    for column, low, high in (('check_in', 'check_in_from', 'check_in_to'),
+                              ('created_at', 'created_from', 'created_to')):
+        start, end = parse_date(args, low), parse_date(args, high)
+        if start and end and end < start:
+            raise SearchError(f"{high} must not be before {low}")
+        if start:
+            conditions.append(f"b.{column} >= %s")
+            params.append(start)
+        if end:
+            conditions.append(f"b.{column} < %s")
+            params.append(end + timedelta(days=1))
+
+    return ' AND '.join(conditions) or 'TRUE', params
+
+def parse_cursor(value):
+    try:
+        created_at, booking_id = value.rsplit(':', 1)
+        return datetime.fromisoformat(created_at), int(booking_id)
+    except ValueError:
+        raise SearchError("cursor must be created_at:id, as returned in next_cursor")
+
+def format_cursor(booking):
+    return f"{booking['created_at'].isoformat()}:{booking['id']}"
+
+def count(conn, table, where, params):
+    # (total, exact). Counting stops one row past the limit; a bigger result
+    # is reported as the plan's estimate, never below what was counted
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(f"""
+        SELECT COUNT(*) as total FROM (SELECT 1 FROM {table} b WHERE {where} LIMIT %s) matched
+    """, (*params, EXACT_COUNT_LIMIT + 1))
+    total = cursor.fetchone()['total']
+    if total <= EXACT_COUNT_LIMIT:
+        cursor.close()
+        return total, True
+    cursor.execute(f"EXPLAIN SELECT 1 FROM {table} b WHERE {where}", params)
+    plan = cursor.fetchall()
+    cursor.close()
+    estimate = int((plan[0]['rows'] or 0) * float(plan[0]['filtered'] or 100) / 100) if plan else 0
+    return max(total, estimate), False
+
+def search(conn, where, params, columns, tables=LIVE_TABLES, limit=DEFAULT_LIMIT, cursor=None):
+    if not 1 <= limit <= MAX_LIMIT:
+        raise SearchError(f"limit must be between 1 and {MAX_LIMIT}")
+    after = parse_cursor(cursor) if cursor else None
+
+    keyset, keyset_params = '', []
+    if after:
+        keyset = "AND (b.created_at < %s OR (b.created_at = %s AND b.id < %s))"
+        keyset_params = [after[0], after[0], after[1]]
+
+    # One bounded range read per table, merged here; limit + 1 rows tell
+    # whether another page exists. STRAIGHT_JOIN keeps bookings as the
+    # driving table so the ordered index read stops at the limit.
+    rows = []
+    db_cursor = conn.cursor(dictionary=True)
+    for table in tables:
+        db_cursor.execute(f"""
+            SELECT {columns}
+            FROM {table} b
+            STRAIGHT_JOIN hotels h ON b.hotel_id = h.id
+            STRAIGHT_JOIN users u ON b.user_id = u.id
+            WHERE {where} {keyset}
+            ORDER BY b.created_at DESC, b.id DESC
+            LIMIT %s
+        """, (*params, *keyset_params, limit + 1))
+        rows.extend(db_cursor.fetchall())
+    db_cursor.close()
+
+    rows.sort(key=lambda row: (row['created_at'], row['id']), reverse=True)
+    page = rows[:limit]
+    result = {
+        "bookings": page,
+        "limit": limit,
+        "next_cursor": format_cursor(page[-1]) if len(rows) > limit else None
+    }
+    # Totals come with the first page only; later pages reuse it
+    if not after:
+        counts = [count(conn, table, where, params) for table in tables]
+        result["total"] = sum(total for total, _ in counts)
+        result["total_exact"] = all(exact for _, exact in counts)
+    return result
+
+def csv_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def export_csv(conn, where, params, columns, tables=LIVE_TABLES):
+    # Generator of CSV text, one chunk per CHUNK_SIZE rows. The unbuffered
+    # cursor pulls rows off the socket as they are written out, so memory
+    # stays flat however many bookings match. Closes conn when done.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    finished = False
+    try:
+        for position, table in enumerate(tables):
+            db_cursor = conn.cursor(buffered=False)
+            db_cursor.execute(f"""
+                SELECT {columns}
+                FROM {table} b
+                STRAIGHT_JOIN hotels h ON b.hotel_id = h.id
+                STRAIGHT_JOIN users u ON b.user_id = u.id
+                WHERE {where}
+                ORDER BY b.created_at DESC, b.id DESC
+            """, params)
+            if position == 0:
+                writer.writerow(db_cursor.column_names)
+            while True:
+                chunk = db_cursor.fetchmany(CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.writerows([csv_safe(value) for value in row] for row in chunk)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            db_cursor.close()
+        if buffer.tell():
+            yield buffer.getvalue()
+        finished = True
+    finally:
+        if finished:
+            conn.close()
+        else:
+            # A client that hung up (or an error) mid-export leaves rows
+            # unread; pooling the connection would read them all first
+            getattr(conn, 'discard', conn.shutdown)()
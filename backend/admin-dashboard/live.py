@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+
+from common.responses import dumps
+
+# Live dashboard feed. One producer thread collects the stats and service
+# status once per interval, or sooner when a change event arrives, and
+# appends what changed to a short shared log. Every open stream waits on the
+# same condition and sends the entries it has not seen yet, so any number of
+# open dashboards costs one query set per interval. The producer idles while
+# nobody is connected.
+
+# Deltas kept for clients that reconnect or fall behind; older ones get a snapshot
+HISTORY = 256
+
+# Reconnect delay suggested to EventSource clients
+RETRY_MS = 5000
+
+def format_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {dumps(data).decode('utf-8')}")
+    return '\n'.join(lines) + '\n\n'
+
+def diff(old, new):
+    # Dict sections are diffed field by field; anything else is replaced whole
+    delta = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            changed = {field: item for field, item in value.items() if previous.get(field) != item}
+            if changed:
+                delta[key] = changed
+        elif previous != value:
+            delta[key] = value
+    return delta
+
+class LiveFeed:
+
+    def __init__(self, collect, interval=5.0, heartbeat=15.0):
+        self.collect = collect
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.state = {}
+        self.sequence = 0
+        self.clients = 0
+        self.refreshes = 0
+        self._log = deque(maxlen=HISTORY)
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._started = False
+
+    def start(self):
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def notify(self, events=None):
+        # ChangeListener handler: refresh now instead of at the next tick
+        self._wake.set()
+
+    def refresh(self):
+        snapshot = self.collect()
+        with self._condition:
+            self.refreshes += 1
+            delta = diff(self.state, snapshot)
+            if delta:
+                self.state = {**self.state, **{key: snapshot[key] for key in delta}}
+                self.sequence += 1
+                self._log.append((self.sequence, delta))
+                self._condition.notify_all()
+        return delta
+
+    def _run(self):
+        while True:
+            if self.clients:
+                try:
+                    self.refresh()
+                except Exception:
+                    pass  # keep serving the last state; retry next tick
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _pending(self, sent):
+        # Entries after `sent`, or one snapshot for new and lagging clients
+        if not self.sequence:
+            return []
+        if sent is None or sent > self.sequence or (self._log and sent + 1 < self._log[0][0]):
+            return [('snapshot', self.sequence, self.state)]
+        return [('delta', sequence, delta) for sequence, delta in self._log if sequence > sent]
+
+    def stream(self, last_event_id=None):
+        try:
+            sent = int(last_event_id) if last_event_id else None
+        except ValueError:
+            sent = None
+
+        with self._condition:
+            self.clients += 1
+            if self.clients == 1:
+                self._wake.set()
+        self.start()
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                with self._condition:
+                    pending = self._pending(sent)
+                    if not pending:
+                        self._condition.wait(self.heartbeat)
+                        pending = self._pending(sent)
+                if not pending:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                for event, sequence, data in pending:
+                    yield format_event(event, data, sequence)
+                    sent = sequence
+        finally:
+            with self._condition:
+                self.clients -= 1
+
+    def stats(self):
+        with self._condition:
+            return {"clients": self.clients, "sequence": self.sequence, "refreshes": self.refreshes}
@@ -0,0 +1,152 @@
+import argparse
+import calendar
+from datetime import date, datetime, timezone
+
+from app import get_db_connection
+
+# Partitioned tables, the column they are ranged on and their cold archive
+PARTITIONED_TABLES = {
+    'bookings': {'column': 'check_out', 'kind': 'date', 'archive': 'bookings_archive'},
+    'payments': {'column': 'created_at', 'kind': 'timestamp', 'archive': 'payments_archive'},
+}
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return month.strftime('p%Y%m')
+
+def bound_expression(kind, upper):
+    # Timestamp bounds are epoch seconds of UTC midnight, written as the
+    # number itself so the session time zone cannot shift them
+    if kind == 'timestamp':
+        return str(calendar.timegm(upper.timetuple()))
+    return f"'{upper.isoformat()}'"
+
+def list_partitions(cursor, table):
+    cursor.execute("""
+        SELECT PARTITION_NAME as name, PARTITION_DESCRIPTION as bound, TABLE_ROWS as row_estimate
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return cursor.fetchall()
+
+def parse_bound(kind, bound):
+    # PARTITION_DESCRIPTION is "'2024-01-01'" for RANGE COLUMNS and an epoch (UTC) for UNIX_TIMESTAMP
+    if bound is None or bound == 'MAXVALUE':
+        return None
+    if kind == 'timestamp':
+        return datetime.fromtimestamp(int(bound), timezone.utc).date()
+    return date.fromisoformat(bound.strip("'"))
+
+def ensure_future_partitions(conn, table, months_ahead=3, dry_run=False):
+    spec = PARTITIONED_TABLES[table]
+    cursor = conn.cursor(dictionary=True)
+    partitions = list_partitions(cursor, table)
+
+    bounds = [parse_bound(spec['kind'], p['bound']) for p in partitions]
+    highest = max(b for b in bounds if b is not None)
+    target = add_months(month_start(date.today()), months_ahead + 1)
+
+    # Split the catch-all partition into one partition per missing month
+    new_partitions = []
+    month = highest
+    while month < target:
+        upper = add_months(month, 1)
+        new_partitions.append(
+            f"PARTITION {partition_name(month)} VALUES LESS THAN ({bound_expression(spec['kind'], upper)})"
+        )
+        month = upper
+
+    if new_partitions and not dry_run:
+        new_partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(new_partitions)})")
+
+    cursor.close()
+    return len(new_partitions)
+
+def flush_stage(cursor, table, stage):
+    # Rows left in the stage table by an interrupted run are moved first
+    cursor.execute(f"INSERT IGNORE INTO {PARTITIONED_TABLES[table]['archive']} SELECT * FROM {stage}")
+    cursor.execute(f"TRUNCATE TABLE {stage}")
+
+def archive_closed_partitions(conn, table, retain_months=6, dry_run=False):
+    spec = PARTITIONED_TABLES[table]
+    stage = f"{table}_archive_stage"
+    cutoff = add_months(month_start(date.today()), -retain_months)
+
+    cursor = conn.cursor(dictionary=True)
+    closed = [
+        p for p in list_partitions(cursor, table)
+        if p['name'] != 'pmax' and parse_bound(spec['kind'], p['bound']) <= cutoff
+    ]
+
+    if dry_run or not closed:
+        cursor.close()
+        return [{'partition': p['name'], 'rows': p['row_estimate']} for p in closed]
+
+    # EXCHANGE PARTITION needs an unpartitioned table with the exact same layout
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {stage} LIKE {table}")
+    cursor.execute(f"SELECT COUNT(*) as partitions FROM information_schema.PARTITIONS "
+                   f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+                   (stage,))
+    if cursor.fetchone()['partitions']:
+        cursor.execute(f"ALTER TABLE {stage} REMOVE PARTITIONING")
+    flush_stage(cursor, table, stage)
+
+    archived = []
+    for partition in closed:
+        cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {partition['name']} WITH TABLE {stage}")
+        cursor.execute(f"SELECT COUNT(*) as count FROM {stage}")
+        rows = cursor.fetchone()['count']
+        flush_stage(cursor, table, stage)
+        conn.commit()
+        # A write that moved a row into this month after the exchange left
+        # it in the emptied partition. With both tables locked, move any
+        # such rows across and drop the partition before writes resume.
+        archive = spec['archive']
+        cursor.execute(f"LOCK TABLES {table} WRITE, {archive} WRITE")
+        try:
+            cursor.execute(f"INSERT IGNORE INTO {archive} SELECT * FROM {table} PARTITION ({partition['name']})")
+            rows += cursor.rowcount
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {partition['name']}")
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        archived.append({'partition': partition['name'], 'rows': rows})
+
+    cursor.close()
+    return archived
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition maintenance for bookings and payments")
+    parser.add_argument('command', choices=['ensure', 'archive', 'status'])
+    parser.add_argument('--table', choices=list(PARTITIONED_TABLES), action='append')
+    parser.add_argument('--months-ahead', type=int, default=3)
+    parser.add_argument('--retain-months', type=int, default=6)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    for table in args.table or list(PARTITIONED_TABLES):
+        if args.command == 'ensure':
+            created = ensure_future_partitions(conn, table, args.months_ahead, args.dry_run)
+            print(f"{table}: {created} partition(s) {'to create' if args.dry_run else 'created'}")
+        elif args.command == 'archive':
+            archived = archive_closed_partitions(conn, table, args.retain_months, args.dry_run)
+            for entry in archived:
+                print(f"{table}: {entry['partition']} ({entry['rows']} rows) "
+                      f"{'to archive' if args.dry_run else 'archived'}")
+        else:
+            cursor = conn.cursor(dictionary=True)
+            for p in list_partitions(cursor, table):
+                print(f"{table}: {p['name']} < {p['bound']} (~{p['row_estimate']} rows)")
+            cursor.close()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
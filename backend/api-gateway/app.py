@@ -0,0 +1,276 @@
+from flask import Blueprint, request, jsonify, Response
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+from common.admission import Admission
+from common.deadline import DEADLINE_HEADER, Deadlines
+from common.service import create_service, load_config, run
+
+config = load_config('api-gateway', port=8080)
+bp = Blueprint('gateway', __name__)
+
+# Service URLs
+SERVICE_URLS = {
+    'hotel': os.getenv('HOTEL_SERVICE_URL', 'http://hotel-service:81'),
+    'booking': os.getenv('BOOKING_SERVICE_URL', 'http://booking-service:82'),
+    'user': os.getenv('USER_SERVICE_URL', 'http://user-service:83'),
+    'review': os.getenv('REVIEW_SERVICE_URL', 'http://review-service:84'),
+    'payment': os.getenv('PAYMENT_SERVICE_URL', 'http://payment-service:85'),
+    'admin': os.getenv('ADMIN_SERVICE_URL', 'http://admin-dashboard:8999'),
+}
+
+# Path prefix -> backend; the longest matching prefix wins
+ROUTES = {
+    '/api/hotels': 'hotel',
+    '/api/admin/hotels': 'hotel',
+    '/api/availability': 'booking',
+    '/api/bookings': 'booking',
+    '/api/quotes': 'booking',
+    '/api/auth': 'user',
+    '/api/users': 'user',
+    '/api/reviews': 'review',
+    '/api/payments': 'payment',
+    '/api/invoices': 'payment',
+    '/api/jobs': 'payment',
+    '/api/admin': 'admin',
+}
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/bookings', ('POST', 'PUT', 'DELETE'), 'critical', None),
+    ('/api/payments', ('POST',), 'critical', None),
+    ('/api/auth', None, 'critical', None),
+    ('/api/hotels', None, 'low', None),
+    ('/api/reviews', ('GET',), 'low', None),
+    ('/api/pages', None, 'low', None),
+    ('/api/availability/calendar', None, 'low', None),
+    ('/api/admin', None, 'background', None),
+    ('/api/payments/stats', None, 'background', None),
+)
+
+# Seconds; proxied calls get the route's budget (GATEWAY_PROXY_TIMEOUT by
+# default), fan-out calls share one deadline
+PROXY_TIMEOUT = float(os.getenv('GATEWAY_PROXY_TIMEOUT', 10))
+PAGE_DEADLINE = float(os.getenv('GATEWAY_PAGE_DEADLINE', 2.0))
+
+# Request budgets started at the edge and propagated downstream
+DEADLINE_ROUTES = (
+    ('/api/admin/hotels/import', ('POST',), 300),
+    ('/api/admin/hotels/inventory', ('POST',), 60),
+    ('/api/admin/analytics', None, 30),
+    ('/api/admin/bookings/export.csv', None, 900),
+    ('/api/payments/stats', None, 15),
+    ('/api/reviews', ('GET',), 3),
+)
+
+deadlines = Deadlines(DEADLINE_ROUTES, default_budget=PROXY_TIMEOUT)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='normal')
+SEARCH_FANOUT_LIMIT = int(os.getenv('GATEWAY_SEARCH_FANOUT_LIMIT', 20))
+
+# Caller identity the services rate limit on, passed on with every call
+IDENTITY_HEADERS = ('X-API-Key', 'Authorization')
+
+# Upstream bodies relayed as they arrive instead of read whole first
+STREAMED_TYPES = ('text/event-stream', 'text/csv')
+
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'content-length',
+    'content-encoding', 'host'
+}
+
+# One keep-alive pool per backend host, shared by all request threads
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=len(SERVICE_URLS), pool_maxsize=int(os.getenv('GATEWAY_POOL_SIZE', 32)))
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+executor = ThreadPoolExecutor(max_workers=int(os.getenv('GATEWAY_FANOUT_WORKERS', 32)))
+
+def resolve_service(path):
+    matches = [prefix for prefix in ROUTES if path == prefix or path.startswith(prefix + '/')]
+    if not matches:
+        return None
+    return ROUTES[max(matches, key=len)]
+
+def client_headers():
+    # The caller's key or token, and X-Forwarded-For with this hop's peer
+    # appended, so a backend's rate limit sees the client and not the gateway
+    headers = {name: request.headers[name] for name in IDENTITY_HEADERS if name in request.headers}
+    forwarded = request.headers.get('X-Forwarded-For')
+    peer = request.remote_addr or 'unknown'
+    headers['X-Forwarded-For'] = f"{forwarded}, {peer}" if forwarded else peer
+    return headers
+
+def call_service(service, method, path, timeout, **kwargs):
+    response = session.request(method, f"{SERVICE_URLS[service]}{path}", timeout=timeout, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+def fan_out(calls, deadline):
+    # calls maps a part name to (service, method, path, kwargs). Every call
+    # runs concurrently and must finish before the shared deadline; parts
+    # that fail or run late are reported in errors instead of failing the page
+    started = time.monotonic()
+    deadline = deadlines.timeout(deadline)
+    headers = {DEADLINE_HEADER: str(int(deadline * 1000)), **client_headers()}
+    futures = {
+        executor.submit(call_service, service, method, path, deadline, headers=headers, **kwargs): name
+        for name, (service, method, path, kwargs) in calls.items()
+    }
+    done, not_done = wait(futures, timeout=deadline)
+
+    results, errors = {}, {}
+    for future in not_done:
+        future.cancel()
+        errors[futures[future]] = "deadline exceeded"
+    for future in done:
+        name = futures[future]
+        try:
+            results[name] = future.result()
+        except requests.HTTPError as e:
+            errors[name] = f"{e.response.status_code} from upstream"
+        except Exception as e:
+            errors[name] = str(e)
+
+    return results, errors, round((time.monotonic() - started) * 1000, 1)
+
+@bp.route('/api/pages/hotel/<int:hotel_id>', methods=['GET'])
+def hotel_page(hotel_id):
+    check_in = request.args.get('check_in')
+    check_out = request.args.get('check_out')
+
+    calls = {
+        'hotel': ('hotel', 'GET', f'/api/hotels/{hotel_id}', {}),
+        'reviews': ('review', 'GET', f'/api/reviews/hotel/{hotel_id}', {}),
+        'review_stats': ('review', 'GET', f'/api/reviews/stats/{hotel_id}', {}),
+    }
+    if check_in and check_out:
+        calls['availability'] = ('booking', 'POST', '/api/availability', {
+            'json': {'hotel_id': hotel_id, 'check_in': check_in, 'check_out': check_out}
+        })
+
+    results, errors, elapsed_ms = fan_out(calls, PAGE_DEADLINE)
+
+    # The page is useless without the hotel itself
+    if 'hotel' not in results:
+        return jsonify({"error": "Hotel unavailable", "errors": errors}), 502
+
+    return jsonify({
+        "hotel": results['hotel'],
+        "reviews": results.get('reviews', []),
+        "review_stats": results.get('review_stats'),
+        "availability": results.get('availability'),
+        "errors": errors,
+        "elapsed_ms": elapsed_ms
+    })
+
+@bp.route('/api/pages/search', methods=['GET'])
+def search_page():
+    check_in = request.args.get('check_in')
+    check_out = request.args.get('check_out')
+
+    params = {key: value for key, value in request.args.items() if key not in ('check_in', 'check_out')}
+    # Results are matched to their ratings and availability by id
+    fields = [field.strip() for field in params.get('fields', '').split(',') if field.strip()]
+    if fields and 'id' not in fields:
+        params['fields'] = ','.join(['id', *fields])
+    try:
+        hotels = call_service('hotel', 'GET', '/api/hotels', deadlines.timeout(PAGE_DEADLINE),
+                              headers={**deadlines.headers(), **client_headers()}, params=params)
+    except requests.HTTPError as e:
+        # A bad query is the caller's to fix; anything else is an upstream failure
+        if e.response.status_code < 500:
+            return Response(e.response.content, status=e.response.status_code, mimetype='application/json')
+        return jsonify({"error": f"Hotel search unavailable: {e.response.status_code} from upstream"}), 502
+    except Exception as e:
+        return jsonify({"error": f"Hotel search unavailable: {e}"}), 502
+    if not isinstance(hotels, list):
+        return jsonify({"error": "Hotel search unavailable: unexpected response", "upstream": hotels}), 502
+
+    # Enrich the first page of results with ratings and availability
+    calls = {}
+    for hotel in hotels[:SEARCH_FANOUT_LIMIT]:
+        calls[f"stats:{hotel['id']}"] = ('review', 'GET', f"/api/reviews/stats/{hotel['id']}", {})
+        if check_in and check_out:
+            calls[f"availability:{hotel['id']}"] = ('booking', 'POST', '/api/availability', {
+                'json': {'hotel_id': hotel['id'], 'check_in': check_in, 'check_out': check_out}
+            })
+
+    results, errors, elapsed_ms = fan_out(calls, PAGE_DEADLINE)
+
+    for hotel in hotels:
+        hotel['review_stats'] = results.get(f"stats:{hotel['id']}")
+        hotel['availability'] = results.get(f"availability:{hotel['id']}")
+
+    return jsonify({
+        "hotels": hotels,
+        "errors": errors,
+        "elapsed_ms": elapsed_ms
+    })
+
+def relay(upstream):
+    try:
+        for chunk in upstream.iter_content(chunk_size=None):
+            yield chunk
+    finally:
+        upstream.close()
+
+@bp.route('/api/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
+def proxy(path):
+    service = resolve_service(request.path)
+    if not service:
+        return jsonify({"error": "No route for path"}), 404
+
+    headers = {key: value for key, value in request.headers if key.lower() not in HOP_BY_HOP_HEADERS}
+    # The client may shorten the budget but never extend it
+    headers.update(deadlines.headers())
+    headers.update(client_headers())
+    # Event streams stay open: the budget only covers getting the response
+    # started. Those, CSV exports and other chunked bodies are passed through
+    # as they arrive; anything else is read whole within the budget.
+    streaming = 'text/event-stream' in request.headers.get('Accept', '')
+    started = time.monotonic()
+    try:
+        upstream = session.request(
+            request.method,
+            f"{SERVICE_URLS[service]}{request.full_path.rstrip('?')}",
+            headers=headers,
+            data=request.get_data(),
+            timeout=(deadlines.timeout(), None) if streaming else deadlines.timeout(),
+            stream=True,
+            allow_redirects=False
+        )
+        relayed = (
+            streaming
+            or upstream.headers.get('Content-Type', '').startswith(STREAMED_TYPES)
+            or 'chunked' in upstream.headers.get('Transfer-Encoding', '').lower()
+        )
+        body = None if relayed else upstream.content
+    except requests.Timeout:
+        admission.limiter.observe(time.monotonic() - started, overloaded=True)
+        deadlines.record('upstream_timeouts')
+        return jsonify({"error": f"{service} service timed out"}), 504
+    except requests.RequestException as e:
+        return jsonify({"error": f"{service} service unreachable: {e}"}), 502
+    # Upstream latency and shedding feed the gateway's own limit
+    admission.limiter.observe(time.monotonic() - started, overloaded=upstream.status_code == 503)
+
+    # CORS headers are added by the gateway itself
+    response_headers = [
+        (key, value) for key, value in upstream.headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS and not key.lower().startswith('access-control-')
+    ]
+    if relayed:
+        return Response(relay(upstream), status=upstream.status_code, headers=response_headers)
+    return Response(body, status=upstream.status_code, headers=response_headers)
+
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
+if __name__ == '__main__':
+    run(app, config)
@@ -1,83 +1,342 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import mysql.connector
+from flask import Blueprint, request, jsonify
 import os
 from datetime import datetime, timedelta
 import random
+from itinerary import ItineraryError, fetch_page
+from common import trips
+from common.admission import Admission
+from common.deadline import Deadlines
+from common.cache import SWRCache
+from common.events import ChangeListener, emit_each
+from common.query import Statement, fetch_one
+from common.service import create_service, lazy_import, load_config, mysql_pool, run
+from common.responses import FieldSelectionError, select_fields
 
-app = Flask(__name__)
-CORS(app)
+config = load_config('booking-service', port=82)
+bp = Blueprint('bookings', __name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'mysql-db'),
-    'user': os.getenv('DB_USER', 'hotel_user'),
-    'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
-    'database': os.getenv('DB_NAME', 'hotel_booking'),
-    'port': int(os.getenv('DB_PORT', 3306))
+# numpy-backed; loaded on first use (or by warm-up) instead of at import
+occupancy = lazy_import('occupancy')
+pricing = lazy_import('pricing')
+holds = lazy_import('holds')
+
+
+# Live table first, then the cold archive filled by partition maintenance
+BOOKING_TABLES = ('bookings', 'bookings_archive')
+
+BOOKING_COLUMNS = (
+    'id', 'booking_ref', 'hotel_id', 'user_id', 'check_in', 'check_out', 'guests', 'rooms',
+    'room_type', 'special_requests', 'total_amount', 'status', 'payment_status',
+    'created_at', 'updated_at'
+)
+
+USER_BOOKING_FIELDS = {
+    **{name: f'b.{name}' for name in BOOKING_COLUMNS},
+    'hotel_name': 'h.name',
+    'hotel_location': 'h.location',
 }
 
+# Bounds for a single calendar request
+CALENDAR_MAX_DAYS = 366
+CALENDAR_MAX_HOTELS = 50
+
+# Largest allowed gap between a client-supplied total and the server quote
+QUOTE_TOLERANCE = float(os.getenv('QUOTE_TOLERANCE', 0.01))
+
+# MySQL duplicate-key error, and how many random refs to try before giving up
+DUPLICATE_KEY = 1062
+BOOKING_REF_ATTEMPTS = 5
+
+# Availability results keyed by (hotel_id, check_in, check_out). Writes on
+# this replica invalidate precisely; the short TTL bounds staleness from
+# writes made through other replicas.
+availability_cache = SWRCache(
+    ttl=float(os.getenv('AVAILABILITY_CACHE_TTL', 2)),
+    stale_ttl=float(os.getenv('AVAILABILITY_CACHE_STALE_TTL', 10)),
+    max_entries=int(os.getenv('AVAILABILITY_CACHE_MAX_ENTRIES', 50000))
+)
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/bookings', ('POST', 'PUT', 'DELETE'), 'critical', None),
+    ('/api/bookings', ('GET',), 'normal', None),
+    ('/api/availability', None, 'normal', None),
+    ('/api/quotes', None, 'normal', None),
+    ('/api/availability/calendar', None, 'low', 8),
+    ('/api/availability/cache/stats', None, 'background', None),
+)
+
+# Request budgets in seconds where the REQUEST_BUDGET_MS default does not fit
+DEADLINE_ROUTES = (
+    ('/api/bookings', ('POST', 'PUT', 'DELETE'), 10),
+)
+
+deadlines = Deadlines.from_env(DEADLINE_ROUTES, mysql_pool.connect)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='normal')
+
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    # Statements are bounded by the request deadline; their latency drives
+    # the adaptive concurrency limit
+    return admission.connect(deadlines.connect, **config.db)
+
+# Hot lookup on every availability check, prepared once per pooled connection
+HOTEL_ROOMS = Statement('hotel_rooms', "SELECT rooms FROM hotels WHERE id = %s", ('rooms',))
+
+def compute_availability(hotel_id, check_in, check_out):
+    conn = get_db_connection()
+    try:
+        # Get hotel room count
+        hotel = fetch_one(conn, HOTEL_ROOMS, (hotel_id,))
+        
+        if not hotel:
+            return None
+        
+        # Rooms booked per night of the stay against that night's allotment;
+        # the tightest night bounds what can be sold
+        start = occupancy.parse_date(check_in)
+        days = max(1, (occupancy.parse_date(check_out) - start).days)
+        end = start + timedelta(days=days)
+        hotel_index = {hotel_id: 0}
+        bookings = occupancy.fetch_overlapping_bookings(conn, [hotel_id], start, end)
+        overrides = occupancy.fetch_inventory(conn, [hotel_id], start, end)
+        booked = occupancy.booked_rooms(bookings, hotel_index, start, days)
+        capacity, _ = occupancy.apply_inventory(overrides, hotel_index, start, days, [hotel.rooms])
+        
+        return {
+            "hotel_id": hotel_id,
+            "available_rooms": max(0, int((capacity - booked).min())),
+            "total_rooms": hotel.rooms
+        }
+    finally:
+        conn.close()
+
+def on_hotel_events(events):
+    # Room counts may have changed; drop every cached range of those hotels.
+    # Inventory updates carry their (inclusive) night range.
+    hotel_ids = {event['entity_id'] for event in events if event['entity'] == 'hotel'}
+    if hotel_ids:
+        availability_cache.invalidate(lambda key: key[0] in hotel_ids)
+    for event in events:
+        if event['entity'] == 'hotel_inventory':
+            end = occupancy.parse_date(event['payload']['end']) + timedelta(days=1)
+            invalidate_availability(event['entity_id'], event['payload']['start'], end)
+        elif event['entity'] == 'booking' and (event['payload'] or {}).get('status') == 'cancelled':
+            # Cancelled bookings (sweeps, or a cancel on another replica) give their rooms back
+            payload = event['payload']
+            invalidate_availability(payload['hotel_id'], payload['check_in'], payload['check_out'])
+
+hotel_events = ChangeListener(get_db_connection, ('hotel', 'hotel_inventory', 'booking'), on_hotel_events)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "service": "booking-service"})
+@bp.before_app_request
+def start_listeners():
+    hotel_events.start()
 
-@app.route('/api/availability', methods=['POST'])
+def cache_date(value):
+    # Cache keys hold the parsed date, so 2027-1-5 and 2027-01-05 are one
+    # entry and range comparisons in invalidate_availability hold
+    return occupancy.parse_date(value).isoformat()
+
+def invalidate_availability(hotel_id, check_in, check_out):
+    # Drop every cached range of this hotel that overlaps [check_in, check_out)
+    hotel_id, check_in, check_out = int(hotel_id), cache_date(check_in), cache_date(check_out)
+    return availability_cache.invalidate(
+        lambda key: key[0] == hotel_id and key[1] < check_out and key[2] > check_in
+    )
+
+@bp.route('/api/availability', methods=['POST'])
 def check_availability():
     try:
         data = request.json
-        hotel_id = data.get('hotel_id')
-        check_in = data.get('check_in')
-        check_out = data.get('check_out')
+        hotel_id = int(data.get('hotel_id'))
+        check_in = cache_date(data.get('check_in'))
+        check_out = cache_date(data.get('check_out'))
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get hotel room count
-        cursor.execute("SELECT rooms FROM hotels WHERE id = %s", (hotel_id,))
-        hotel = cursor.fetchone()
+        availability = availability_cache.get(
+            (hotel_id, check_in, check_out),
+            lambda: compute_availability(hotel_id, check_in, check_out)
+        )
         
-        if not hotel:
+        if not availability:
             return jsonify({"error": "Hotel not found"}), 404
         
-        # Count booked rooms for the period
-        query = """
-        SELECT COUNT(*) as booked_rooms FROM bookings 
-        WHERE hotel_id = %s AND status = 'confirmed'
-        AND ((check_in <= %s AND check_out > %s) OR (check_in < %s AND check_out >= %s))
-        """
-        cursor.execute(query, (hotel_id, check_in, check_in, check_out, check_out))
-        booked = cursor.fetchone()
+        return jsonify(availability)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/availability/calendar', methods=['GET'])
+def get_availability_calendar():
+    try:
+        hotel_ids = [int(h) for h in request.args.get('hotel_ids', request.args.get('hotel_id', '')).split(',') if h]
+        start = occupancy.parse_date(request.args.get('start', datetime.now().strftime('%Y-%m-%d')))
+        days = int(request.args.get('days', 90))
         
-        available_rooms = hotel['rooms'] - booked['booked_rooms']
+        if not hotel_ids or len(hotel_ids) > CALENDAR_MAX_HOTELS:
+            return jsonify({"error": f"Provide between 1 and {CALENDAR_MAX_HOTELS} hotel ids"}), 400
+        if not 1 <= days <= CALENDAR_MAX_DAYS:
+            return jsonify({"error": f"days must be between 1 and {CALENDAR_MAX_DAYS}"}), 400
+        end = start + timedelta(days=days)
         
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        placeholders = ', '.join(['%s'] * len(hotel_ids))
+        cursor.execute(f"SELECT id, rooms FROM hotels WHERE id IN ({placeholders})", hotel_ids)
+        hotels = {row['id']: row['rooms'] for row in cursor.fetchall()}
         cursor.close()
+        
+        # One indexed query for every hotel, then one sweep over the window
+        hotel_index = {hotel_id: i for i, hotel_id in enumerate(hotels)}
+        bookings = occupancy.fetch_overlapping_bookings(conn, list(hotels), start, end)
+        overrides = occupancy.fetch_inventory(conn, list(hotels), start, end)
         conn.close()
+        booked = occupancy.booked_rooms(bookings, hotel_index, start, days)
+        capacity, _ = occupancy.apply_inventory(overrides, hotel_index, start, days, list(hotels.values()))
+        
+        calendars = []
+        for hotel_id in hotel_ids:
+            if hotel_id not in hotels:
+                calendars.append({"hotel_id": hotel_id, "error": "Hotel not found"})
+                continue
+            row = hotel_index[hotel_id]
+            available = (capacity[row] - booked[row]).clip(min=0)
+            calendars.append({
+                "hotel_id": hotel_id,
+                "total_rooms": hotels[hotel_id],
+                "available_rooms": available.tolist()
+            })
         
         return jsonify({
-            "hotel_id": hotel_id,
-            "available_rooms": max(0, available_rooms),
-            "total_rooms": hotel['rooms']
+            "start": start,
+            "end": end,
+            "days": days,
+            "calendars": calendars
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/availability/cache/stats', methods=['GET'])
+def get_availability_cache_stats():
+    return jsonify(availability_cache.stats())
+
+@bp.route('/api/quotes', methods=['POST'])
+def get_quotes():
+    try:
+        data = request.json
+        items = data.get('requests', [data]) if isinstance(data, dict) else data
+        breakdown = request.args.get('breakdown', 'false').lower() == 'true'
+        
+        conn = get_db_connection()
+        quotes = pricing.compute_quotes(conn, items, breakdown=breakdown)
+        conn.close()
+        
+        return jsonify({"quotes": quotes})
+    except pricing.QuoteError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/bookings', methods=['POST'])
+@bp.route('/api/bookings/holds', methods=['POST'])
+def create_hold():
+    # Reserve rooms for the checkout; 409 when the nights are sold out
+    try:
+        conn = get_db_connection()
+        hold = holds.create_hold(conn, request.get_json() or {})
+        conn.close()
+        
+        if not hold:
+            return jsonify({"error": "Hotel not found"}), 404
+        
+        invalidate_availability(hold['hotel_id'], hold['check_in'], hold['check_out'])
+        return jsonify(hold), 201
+    except holds.HoldError as e:
+        return jsonify({"error": str(e)}), 400
+    except holds.HoldUnavailable as e:
+        return jsonify({"error": str(e), "available_rooms": e.available}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/bookings/holds/<token>', methods=['GET'])
+def get_hold(token):
+    try:
+        conn = get_db_connection()
+        hold = holds.get_hold(conn, token)
+        conn.close()
+        
+        if hold:
+            return jsonify(hold)
+        else:
+            return jsonify({"error": "Hold not found or expired"}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/bookings/holds/<token>', methods=['DELETE'])
+def release_hold(token):
+    try:
+        conn = get_db_connection()
+        hold = holds.get_hold(conn, token)
+        released = hold is not None and holds.release_hold(conn, token)
+        conn.close()
+        
+        if not released:
+            return jsonify({"error": "Hold not found, expired or already booked"}), 404
+        
+        invalidate_availability(hold['hotel_id'], hold['check_in'], hold['check_out'])
+        return jsonify({"message": "Hold released"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def booking_event(status, data):
+    # Change event payload, shaped like the ones the payment-service sweeps emit
+    return {'status': status, 'hotel_id': data['hotel_id'], 'check_in': data['check_in'], 'check_out': data['check_out']}
+
+def claim_booking_ref(cursor):
+    # bookings only keys booking_ref together with check_out, so each ref is
+    # claimed in booking_refs first; a taken one is simply drawn again
+    for _ in range(BOOKING_REF_ATTEMPTS):
+        booking_ref = f"BK{random.randint(100000, 999999)}"
+        try:
+            cursor.execute("INSERT INTO booking_refs (booking_ref) VALUES (%s)", (booking_ref,))
+            return booking_ref
+        except Exception as e:
+            if getattr(e, 'errno', None) != DUPLICATE_KEY:
+                raise
+    raise RuntimeError("Could not allocate a unique booking reference")
+
+@bp.route('/api/bookings', methods=['POST'])
 def create_booking():
+    # With a hold_token the booking takes the hold's rooms and stays pending
+    # until payment-service confirms it; without one it is confirmed at once
     try:
         data = request.json
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Generate booking reference
-        booking_ref = f"BK{random.randint(100000, 999999)}"
+        hold_id, rooms = None, 1
+        if data.get('hold_token'):
+            hold_id, rooms = holds.attach_booking(cursor, data['hold_token'], data)
+        
+        # Price the stay server-side and hold the client to it
+        held = (data['hotel_id'], data['check_in'], data['check_out'], rooms) if hold_id else None
+        quote = pricing.compute_quotes(conn, [data], held=held)[0]
+        if 'error' in quote:
+            cursor.close()
+            conn.close()
+            return jsonify({"error": quote['error']}), 404
+        total = round(quote['total'] * rooms, 2)
+        if 'total_amount' not in data:
+            data['total_amount'] = total
+        elif abs(float(data['total_amount']) - total) > QUOTE_TOLERANCE:
+            cursor.close()
+            conn.close()
+            return jsonify({"error": "total_amount does not match quote", "quote": quote, "rooms": rooms}), 409
+        
+        booking_ref = claim_booking_ref(cursor)
         
         query = """
         INSERT INTO bookings (booking_ref, hotel_id, user_id, check_in, check_out, 
-                             guests, room_type, special_requests, total_amount, status)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                             guests, rooms, room_type, special_requests, total_amount, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
         params = (
             booking_ref,
@@ -86,41 +345,58 @@ def create_booking():
             data['check_in'],
             data['check_out'],
             data['guests'],
+            rooms,
             data['room_type'],
             data.get('special_requests', ''),
             data['total_amount'],
-            'confirmed'
+            'pending' if hold_id else 'confirmed'
         )
         
         cursor.execute(query, params)
-        conn.commit()
         booking_id = cursor.lastrowid
+        cursor.execute("UPDATE booking_refs SET booking_id = %s WHERE booking_ref = %s", (booking_id, booking_ref))
+        if hold_id:
+            holds.link_booking(cursor, hold_id, booking_id)
+        emit_each(cursor, 'booking', 'create', {booking_id: booking_event(params[-1], data)})
+        conn.commit()
         
         cursor.close()
+        trips.refresh_quietly(conn, user_id=params[2])
         conn.close()
         
+        invalidate_availability(data['hotel_id'], data['check_in'], data['check_out'])
+        
         return jsonify({
             "booking_id": booking_id,
             "booking_ref": booking_ref,
+            "total_amount": data['total_amount'],
+            "rooms": rooms,
+            "status": params[-1],
             "message": "Booking created successfully"
         }), 201
+    except (pricing.QuoteError, holds.HoldError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>', methods=['GET'])
+@bp.route('/api/bookings/<int:booking_id>', methods=['GET'])
 def get_booking(booking_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT b.*, h.name as hotel_name, h.location as hotel_location
-        FROM bookings b
-        JOIN hotels h ON b.hotel_id = h.id
-        WHERE b.id = %s
-        """
-        cursor.execute(query, (booking_id,))
-        booking = cursor.fetchone()
+        booking = None
+        for table in BOOKING_TABLES:
+            query = f"""
+            SELECT b.*, h.name as hotel_name, h.location as hotel_location
+            FROM {table} b
+            JOIN hotels h ON b.hotel_id = h.id
+            WHERE b.id = %s
+            """
+            cursor.execute(query, (booking_id,))
+            booking = cursor.fetchone()
+            if booking:
+                break
         
         cursor.close()
         conn.close()
@@ -132,36 +408,81 @@ def get_booking(booking_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/bookings/user/<int:user_id>', methods=['GET'])
+@bp.route('/api/bookings/user/<int:user_id>', methods=['GET'])
 def get_user_bookings(user_id):
     try:
+        columns = select_fields(USER_BOOKING_FIELDS, required=('created_at',))
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT b.*, h.name as hotel_name, h.location as hotel_location
+        # Recent stays come from the live partitions, older ones from the archive
+        query = f"""
+        SELECT {columns}
         FROM bookings b
         JOIN hotels h ON b.hotel_id = h.id
         WHERE b.user_id = %s
-        ORDER BY b.created_at DESC
+        UNION ALL
+        SELECT {columns}
+        FROM bookings_archive b
+        JOIN hotels h ON b.hotel_id = h.id
+        WHERE b.user_id = %s
+        ORDER BY created_at DESC
         """
-        cursor.execute(query, (user_id,))
+        cursor.execute(query, (user_id, user_id))
         bookings = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
         return jsonify(bookings)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>', methods=['PUT'])
+@bp.route('/api/bookings/user/<int:user_id>/trips', methods=['GET'])
+def get_user_trips(user_id):
+    # ?view=upcoming|past|cancelled, keyset paged with ?cursor=
+    try:
+        columns = select_fields(USER_BOOKING_FIELDS, required=('id', 'check_in'))
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({"error": "limit must be a number"}), 400
+        
+        conn = get_db_connection()
+        page = fetch_page(conn, user_id, request.args.get('view', 'upcoming'), columns, limit, request.args.get('cursor'))
+        conn.close()
+        
+        return jsonify(page)
+    except (FieldSelectionError, ItineraryError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/bookings/user/<int:user_id>/trips/summary', methods=['GET'])
+def get_user_trip_summary(user_id):
+    # The "My Trips" landing page: one primary-key read
+    try:
+        conn = get_db_connection()
+        summary = trips.load(conn, user_id)
+        conn.close()
+        
+        return jsonify(summary)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/bookings/<int:booking_id>', methods=['PUT'])
 def update_booking(booking_id):
     try:
         data = request.json
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        # Both the old and the new stay change availability
+        cursor.execute("SELECT hotel_id, check_in, check_out, user_id FROM bookings WHERE id = %s", (booking_id,))
+        previous = cursor.fetchone()
+        
         query = """
         UPDATE bookings 
         SET check_in = %s, check_out = %s, guests = %s, 
@@ -179,30 +500,57 @@ def update_booking(booking_id):
         )
         
         cursor.execute(query, params)
+        if previous:
+            emit_each(cursor, 'booking', 'update', {booking_id: booking_event(None, {**data, 'hotel_id': previous[0]})})
         conn.commit()
         
         cursor.close()
+        if previous:
+            trips.refresh_quietly(conn, user_id=previous[3])
         conn.close()
         
+        if previous:
+            invalidate_availability(*previous[:3])
+            invalidate_availability(previous[0], data['check_in'], data['check_out'])
+        
         return jsonify({"message": "Booking updated successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>', methods=['DELETE'])
+@bp.route('/api/bookings/<int:booking_id>', methods=['DELETE'])
 def cancel_booking(booking_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        cursor.execute("SELECT hotel_id, check_in, check_out, user_id FROM bookings WHERE id = %s", (booking_id,))
+        booking = cursor.fetchone()
+        
         cursor.execute("UPDATE bookings SET status = 'cancelled' WHERE id = %s", (booking_id,))
+        # A pending booking gives its hold's rooms back with it
+        cursor.execute("DELETE FROM room_holds WHERE booking_id = %s", (booking_id,))
+        if booking:
+            emit_each(cursor, 'booking', 'cancel', {booking_id: {
+                'status': 'cancelled', 'hotel_id': booking[0], 'check_in': booking[1], 'check_out': booking[2]
+            }})
         conn.commit()
         
         cursor.close()
+        if booking:
+            trips.refresh_quietly(conn, user_id=booking[3])
         conn.close()
         
+        if booking:
+            invalidate_availability(*booking[:3])
+        
         return jsonify({"message": "Booking cancelled successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=82, debug=True)
\ No newline at end of file
+    run(app, config)
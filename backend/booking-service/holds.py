@@ -0,0 +1,123 @@
+import os
+import secrets
+
+import occupancy
+
+# Room holds: N rooms of a hotel for a stay, reserved for a few minutes while
+# the guest books and pays. A hold is one row in room_holds, counted by every
+# availability check (occupancy.fetch_overlapping_bookings) until it expires,
+# so nothing stays locked across the payment step. Creating one is a short
+# transaction that locks the hotel row only while it checks the nights and
+# inserts. A booking made with the hold's token stays pending and the hold
+# keeps its rooms; payment-service confirms the booking and deletes the hold
+# in one transaction. Expired holds stop counting at once and are swept (with
+# their pending booking) by the maintenance.expire_holds job.
+
+DEFAULT_TTL = int(os.getenv('HOLD_TTL_SECONDS', 600))
+MAX_TTL = 1800
+MAX_ROOMS = 10
+
+HOLD_COLUMNS = (
+    'hold_token', 'hotel_id', 'user_id', 'check_in', 'check_out', 'rooms', 'booking_id',
+    'expires_at', 'created_at'
+)
+
+class HoldError(ValueError):
+    pass
+
+class HoldUnavailable(Exception):
+
+    def __init__(self, available):
+        super().__init__(f"Only {available} room(s) left for these dates")
+        self.available = available
+
+def normalize(data):
+    try:
+        hotel_id = int(data['hotel_id'])
+        check_in = occupancy.parse_date(data['check_in'])
+        check_out = occupancy.parse_date(data['check_out'])
+        rooms = int(data.get('rooms', 1))
+        ttl = int(data.get('ttl_seconds', DEFAULT_TTL))
+    except (KeyError, TypeError, ValueError) as e:
+        raise HoldError(f"Invalid hold request: {e}")
+    if check_out <= check_in:
+        raise HoldError("check_out must be after check_in")
+    if not 1 <= rooms <= MAX_ROOMS:
+        raise HoldError(f"rooms must be between 1 and {MAX_ROOMS}")
+    if not 1 <= ttl <= MAX_TTL:
+        raise HoldError(f"ttl_seconds must be between 1 and {MAX_TTL}")
+    return hotel_id, check_in, check_out, rooms, ttl
+
+def available_rooms(conn, hotel_id, total_rooms, check_in, check_out):
+    # Rooms left on the tightest night, bookings and live holds counted
+    days = (check_out - check_in).days
+    hotel_index = {hotel_id: 0}
+    stays = occupancy.fetch_overlapping_bookings(conn, [hotel_id], check_in, check_out)
+    overrides = occupancy.fetch_inventory(conn, [hotel_id], check_in, check_out)
+    booked = occupancy.booked_rooms(stays, hotel_index, check_in, days)
+    capacity, _ = occupancy.apply_inventory(overrides, hotel_index, check_in, days, [total_rooms])
+    return max(0, int((capacity - booked).min()))
+
+def create_hold(conn, data):
+    hotel_id, check_in, check_out, rooms, ttl = normalize(data)
+    cursor = conn.cursor()
+    try:
+        # The hotel row lock serializes holds on one hotel for a few
+        # statements; the reads after it see every hold committed before
+        cursor.execute("SELECT rooms FROM hotels WHERE id = %s AND status = 'active' FOR UPDATE", (hotel_id,))
+        hotel = cursor.fetchone()
+        if not hotel:
+            conn.rollback()
+            return None
+        available = available_rooms(conn, hotel_id, hotel[0], check_in, check_out)
+        if available < rooms:
+            conn.rollback()
+            raise HoldUnavailable(available)
+
+        token = secrets.token_hex(16)
+        cursor.execute("""
+            INSERT INTO room_holds (hold_token, hotel_id, user_id, check_in, check_out, rooms, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW(3) + INTERVAL %s SECOND)
+        """, (token, hotel_id, data.get('user_id'), check_in, check_out, rooms, ttl))
+        conn.commit()
+    finally:
+        cursor.close()
+    return get_hold(conn, token)
+
+def get_hold(conn, token):
+    # Live holds only; an expired one is as good as gone
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(f"""
+        SELECT {', '.join(HOLD_COLUMNS)}, TIMESTAMPDIFF(SECOND, NOW(3), expires_at) as expires_in
+        FROM room_holds WHERE hold_token = %s AND expires_at > NOW(3)
+    """, (token,))
+    hold = cursor.fetchone()
+    cursor.close()
+    return hold
+
+def release_hold(conn, token):
+    # A hold already attached to a booking is released by cancelling it
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM room_holds WHERE hold_token = %s AND booking_id IS NULL", (token,))
+    released = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return released > 0
+
+def attach_booking(cursor, token, booking):
+    # In the booking's transaction: lock a live, unattached hold matching the
+    # stay. Returns (hold id, rooms), or raises HoldError.
+    cursor.execute("""
+        SELECT id, hotel_id, check_in, check_out, rooms FROM room_holds
+        WHERE hold_token = %s AND expires_at > NOW(3) AND booking_id IS NULL FOR UPDATE
+    """, (token,))
+    hold = cursor.fetchone()
+    if not hold:
+        raise HoldError("Hold has expired or was already used")
+    stay = (int(booking['hotel_id']), occupancy.parse_date(booking['check_in']), occupancy.parse_date(booking['check_out']))
+    if (hold[1], hold[2], hold[3]) != stay:
+        raise HoldError("Hold is for a different hotel or dates")
+    return hold[0], hold[4]
+
+def link_booking(cursor, hold_id, booking_id):
+    cursor.execute("UPDATE room_holds SET booking_id = %s WHERE id = %s", (booking_id, hold_id))
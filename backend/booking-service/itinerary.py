@@ -0,0 +1,68 @@
+from datetime import date
+
+# "My Trips" views of one user's bookings, paged by keyset on the
+# (user_id, check_in, id) index: each page is an index range read that
+# stops after `limit` rows, however long the history. The cursor is the
+# (check_in, id) of the last row served.
+
+# view: (condition, direction, tables). Stays that have started count as
+# past; upcoming stays are never in the archive (archiving follows check_out)
+VIEWS = {
+    'upcoming': ("b.status <> 'cancelled' AND b.check_in >= CURDATE()", 'ASC', ('bookings',)),
+    'past': ("b.status <> 'cancelled' AND b.check_in < CURDATE()", 'DESC', ('bookings', 'bookings_archive')),
+    'cancelled': ("b.status = 'cancelled'", 'DESC', ('bookings', 'bookings_archive')),
+}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+class ItineraryError(ValueError):
+    pass
+
+def parse_cursor(value):
+    try:
+        check_in, booking_id = value.split(':')
+        return date.fromisoformat(check_in), int(booking_id)
+    except ValueError:
+        raise ItineraryError("cursor must be check_in:id, as returned in next_cursor")
+
+def format_cursor(booking):
+    return f"{booking['check_in'].isoformat()}:{booking['id']}"
+
+def fetch_page(conn, user_id, view, columns, limit=DEFAULT_LIMIT, cursor=None):
+    if view not in VIEWS:
+        raise ItineraryError(f"view must be one of {', '.join(VIEWS)}")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ItineraryError(f"limit must be between 1 and {MAX_LIMIT}")
+    condition, direction, tables = VIEWS[view]
+    after = parse_cursor(cursor) if cursor else None
+    comparison = '>' if direction == 'ASC' else '<'
+
+    keyset, params = '', [user_id]
+    if after:
+        keyset = f"AND (b.check_in {comparison} %s OR (b.check_in = %s AND b.id {comparison} %s))"
+        params += [after[0], after[0], after[1]]
+
+    # One bounded range read per table, merged here; limit + 1 rows tell
+    # whether another page exists
+    rows = []
+    db_cursor = conn.cursor(dictionary=True)
+    for table in tables:
+        db_cursor.execute(f"""
+            SELECT {columns}
+            FROM {table} b
+            JOIN hotels h ON b.hotel_id = h.id
+            WHERE b.user_id = %s AND {condition} {keyset}
+            ORDER BY b.check_in {direction}, b.id {direction}
+            LIMIT %s
+        """, (*params, limit + 1))
+        rows.extend(db_cursor.fetchall())
+    db_cursor.close()
+
+    rows.sort(key=lambda row: (row['check_in'], row['id']), reverse=direction == 'DESC')
+    page = rows[:limit]
+    return {
+        "view": view,
+        "bookings": page,
+        "next_cursor": format_cursor(page[-1]) if len(rows) > limit else None
+    }
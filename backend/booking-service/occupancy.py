@@ -0,0 +1,101 @@
+from datetime import date, datetime
+
+import numpy as np
+
+from common.query import Statement, fetch
+
+# Rooms taken over a window: confirmed bookings plus live room holds
+# (holds.py), as (hotel_id, check_in, check_out, rooms) rows
+OVERLAPPING = """
+    SELECT hotel_id, check_in, check_out, rooms FROM bookings
+    WHERE hotel_id {hotels} AND status = 'confirmed'
+    AND check_out > %s AND check_in < %s
+    UNION ALL
+    SELECT hotel_id, check_in, check_out, rooms FROM room_holds
+    WHERE hotel_id {hotels} AND expires_at > NOW(3)
+    AND check_out > %s AND check_in < %s
+    """
+
+# Single-hotel form behind every availability check, prepared once per
+# pooled connection; rows stay plain tuples for booked_rooms()
+OVERLAPPING_ONE = Statement('overlapping_bookings', OVERLAPPING.format(hotels='= %s'))
+
+def parse_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), '%Y-%m-%d').date()
+
+def night_dates(start, days):
+    return np.arange(np.datetime64(start, 'D'), np.datetime64(start, 'D') + days)
+
+def fetch_overlapping_bookings(conn, hotel_ids, start, end):
+    # One indexed range query for every hotel in the window [start, end)
+    if not hotel_ids:
+        return []
+    if len(hotel_ids) == 1:
+        return fetch(conn, OVERLAPPING_ONE, (hotel_ids[0], start, end) * 2)
+    cursor = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(hotel_ids))
+    query = OVERLAPPING.format(hotels=f"IN ({placeholders})")
+    cursor.execute(query, (*hotel_ids, start, end) * 2)
+    bookings = cursor.fetchall()
+    cursor.close()
+    return bookings
+
+def booked_rooms(bookings, hotel_index, start, days):
+    # Difference-array sweep: +rooms on the first night of each stay clipped
+    # to the window, -rooms on the night after it, then a cumulative sum per
+    # hotel gives rooms booked per night. bookings are (hotel_id, check_in,
+    # check_out, rooms).
+    diff = np.zeros((len(hotel_index), days + 1), dtype=np.int32)
+    if bookings:
+        # date.toordinal() is far cheaper than building datetime64 arrays from date objects
+        count = len(bookings)
+        origin = start.toordinal()
+        rows = np.fromiter((hotel_index[b[0]] for b in bookings), dtype=np.intp, count=count)
+        first = np.fromiter((b[1].toordinal() for b in bookings), dtype=np.int64, count=count) - origin
+        last = np.fromiter((b[2].toordinal() for b in bookings), dtype=np.int64, count=count) - origin
+        rooms = np.fromiter((b[3] for b in bookings), dtype=np.int32, count=count)
+        np.add.at(diff, (rows, np.clip(first, 0, days)), rooms)
+        np.add.at(diff, (rows, np.clip(last, 0, days)), -rooms)
+    return np.cumsum(diff, axis=1)[:, :days]
+
+def fetch_inventory(conn, hotel_ids, start, end):
+    # Per-night allotment/rate overrides for [start, end); primary-key range scan
+    if not hotel_ids:
+        return []
+    cursor = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(hotel_ids))
+    query = f"""
+    SELECT hotel_id, night, rooms, price, closed FROM hotel_inventory
+    WHERE hotel_id IN ({placeholders}) AND night >= %s AND night < %s
+    """
+    cursor.execute(query, (*hotel_ids, start, end))
+    overrides = cursor.fetchall()
+    cursor.close()
+    return overrides
+
+def apply_inventory(overrides, hotel_index, start, days, rooms, prices=None):
+    # Broadcast each hotel's default allotment (and rate, per hotel or per
+    # hotel-night) over the window, then overwrite the nights that have
+    # overrides. Closed nights sell no rooms.
+    capacity = np.repeat(np.asarray(rooms, dtype=np.int64)[:, None], days, axis=1)
+    nightly = None
+    if prices is not None:
+        prices = np.asarray(prices, dtype=np.float64)
+        nightly = np.broadcast_to(prices[:, None] if prices.ndim == 1 else prices, capacity.shape).copy()
+    if overrides:
+        origin = start.toordinal()
+        count = len(overrides)
+        rows = np.fromiter((hotel_index[o[0]] for o in overrides), dtype=np.intp, count=count)
+        cols = np.fromiter((o[1].toordinal() - origin for o in overrides), dtype=np.intp, count=count)
+        has_rooms = np.fromiter((o[2] is not None for o in overrides), dtype=bool, count=count)
+        override_rooms = np.fromiter((o[2] or 0 for o in overrides), dtype=np.int64, count=count)
+        closed = np.fromiter((bool(o[4]) for o in overrides), dtype=bool, count=count)
+        capacity[rows[has_rooms], cols[has_rooms]] = override_rooms[has_rooms]
+        capacity[rows[closed], cols[closed]] = 0
+        if nightly is not None:
+            has_price = np.fromiter((o[3] is not None for o in overrides), dtype=bool, count=count)
+            override_price = np.fromiter((float(o[3] or 0) for o in overrides), dtype=np.float64, count=count)
+            nightly[rows[has_price], cols[has_price]] = override_price[has_price]
+    return capacity, nightly
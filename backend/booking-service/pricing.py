@@ -0,0 +1,131 @@
+import numpy as np
+
+from occupancy import apply_inventory, booked_rooms, fetch_inventory, fetch_overlapping_bookings, night_dates, parse_date
+
+# Nightly rate = base price x weekday x season x occupancy x room type x guests;
+# a per-night price in hotel_inventory replaces base price x weekday x season
+WEEKDAY_MULTIPLIERS = np.array([1.0, 1.0, 1.0, 1.0, 1.15, 1.2, 1.0])  # Monday..Sunday night
+SEASON_MULTIPLIERS = np.array([0.9, 0.9, 1.0, 1.0, 1.05, 1.15, 1.25, 1.25, 1.05, 1.0, 0.95, 1.15])  # Jan..Dec
+ROOM_TYPE_MULTIPLIERS = {'standard': 1.0, 'deluxe': 1.3, 'suite': 1.8}
+GUESTS_INCLUDED = 2
+EXTRA_GUEST_MULTIPLIER = 0.1
+# Above this share of rooms booked the rate climbs linearly up to +OCCUPANCY_UPLIFT
+OCCUPANCY_THRESHOLD = 0.7
+OCCUPANCY_UPLIFT = 0.25
+
+class QuoteError(ValueError):
+    pass
+
+def normalize_request(item):
+    try:
+        check_in = parse_date(item['check_in'])
+        check_out = parse_date(item['check_out'])
+        hotel_id = int(item['hotel_id'])
+        guests = int(item.get('guests', 1))
+    except (KeyError, TypeError, ValueError) as e:
+        raise QuoteError(f"Invalid quote request: {e}")
+    if check_out <= check_in:
+        raise QuoteError("check_out must be after check_in")
+    return {
+        'hotel_id': hotel_id,
+        'check_in': check_in,
+        'check_out': check_out,
+        'guests': guests,
+        'room_type': item.get('room_type', 'standard')
+    }
+
+def compute_quotes(conn, items, breakdown=False, held=None):
+    # held: (hotel_id, check_in, check_out, rooms) of a hold the caller is
+    # booking from. Those rooms are taken out of occupancy again so the
+    # booking is priced as quoted before the hold, not uplifted by it.
+    requests = [normalize_request(item) for item in items]
+    if not requests:
+        return []
+
+    hotel_ids = sorted({r['hotel_id'] for r in requests})
+    cursor = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(hotel_ids))
+    cursor.execute(f"SELECT id, price, rooms FROM hotels WHERE id IN ({placeholders})", hotel_ids)
+    hotels = {row[0]: (float(row[1]), row[2]) for row in cursor.fetchall()}
+    cursor.close()
+
+    hotel_index = {hotel_id: i for i, hotel_id in enumerate(hotels)}
+    base_price = np.array([hotels[h][0] for h in hotel_index])
+    total_rooms = np.array([hotels[h][1] for h in hotel_index], dtype=np.float64)
+
+    # One window covering every requested stay, one bookings query, one sweep
+    known = [r for r in requests if r['hotel_id'] in hotels]
+    if known:
+        window_start = min(r['check_in'] for r in known)
+        window_end = max(r['check_out'] for r in known)
+        days = (window_end - window_start).days
+        bookings = fetch_overlapping_bookings(conn, list(hotel_index), window_start, window_end)
+        if held and int(held[0]) in hotel_index:
+            bookings = [*bookings, (int(held[0]), parse_date(held[1]), parse_date(held[2]), -held[3])]
+        overrides = fetch_inventory(conn, list(hotel_index), window_start, window_end)
+        booked = booked_rooms(bookings, hotel_index, window_start, days)
+
+        dates = night_dates(window_start, days)
+        weekday = (dates.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        month = dates.astype('datetime64[M]').astype(np.int64) % 12
+        calendar_multiplier = WEEKDAY_MULTIPLIERS[weekday] * SEASON_MULTIPLIERS[month]
+        capacity, nightly_base = apply_inventory(
+            overrides, hotel_index, window_start, days, total_rooms,
+            base_price[:, None] * calendar_multiplier[None, :]
+        )
+
+        occupancy = np.divide(booked, capacity, out=np.ones_like(booked, dtype=np.float64),
+                              where=capacity > 0)
+        occupancy_multiplier = 1 + OCCUPANCY_UPLIFT * np.clip(
+            (occupancy - OCCUPANCY_THRESHOLD) / (1 - OCCUPANCY_THRESHOLD), 0, 1
+        )
+
+        # Flatten every stay into one array of (request, night) pairs
+        rows = np.array([hotel_index[r['hotel_id']] for r in known], dtype=np.intp)
+        offsets = np.array([(r['check_in'] - window_start).days for r in known], dtype=np.int64)
+        nights = np.array([(r['check_out'] - r['check_in']).days for r in known], dtype=np.int64)
+        stay_multiplier = np.array([
+            ROOM_TYPE_MULTIPLIERS.get(r['room_type'], 1.0)
+            * (1 + EXTRA_GUEST_MULTIPLIER * max(0, r['guests'] - GUESTS_INCLUDED))
+            for r in known
+        ])
+
+        owner = np.repeat(np.arange(len(known)), nights)
+        starts = np.cumsum(nights) - nights
+        day = offsets[owner] + (np.arange(nights.sum()) - starts[owner])
+        hotel_row = rows[owner]
+
+        rates = np.round(
+            nightly_base[hotel_row, day]
+            * occupancy_multiplier[hotel_row, day] * stay_multiplier[owner], 2
+        )
+        totals = np.bincount(owner, weights=rates, minlength=len(known))
+        # Rooms left on the tightest night of each stay
+        available = np.minimum.reduceat(capacity[hotel_row, day] - booked[hotel_row, day], starts)
+
+    quotes = []
+    position = 0
+    for r in requests:
+        quote = {
+            'hotel_id': r['hotel_id'],
+            'check_in': r['check_in'],
+            'check_out': r['check_out'],
+            'guests': r['guests'],
+            'room_type': r['room_type'],
+            'nights': (r['check_out'] - r['check_in']).days
+        }
+        if r['hotel_id'] not in hotels:
+            quote['error'] = "Hotel not found"
+        else:
+            i = position
+            position += 1
+            quote['total'] = round(float(totals[i]), 2)
+            quote['available_rooms'] = max(0, int(available[i]))
+            if breakdown:
+                first = int(starts[i])
+                quote['nightly'] = [
+                    {'date': str(dates[d]), 'rate': float(rate)}
+                    for d, rate in zip(day[first:first + nights[i]], rates[first:first + nights[i]])
+                ]
+        quotes.append(quote)
+    return quotes
@@ -0,0 +1,60 @@
+import os
+import sys
+from datetime import date
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
+
+import app as booking_app
+
+class StubCursor:
+    # Answers by statement text, as the pooled connection would
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.conn.executed.append(sql)
+        if 'FROM hotels' in sql:
+            self.rows = [(10,)]
+        elif 'FROM bookings' in sql:
+            self.rows = [(1, date(2027, 1, 5), date(2027, 1, 7), 3)]
+        else:
+            self.rows = []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class StubConnection:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self, **kwargs):
+        return StubCursor(self)
+
+    def close(self):
+        pass
+
+def test_availability_counts_booked_rooms(monkeypatch):
+    conn = StubConnection()
+    monkeypatch.setattr(booking_app, 'get_db_connection', lambda: conn)
+    booking_app.availability_cache.clear()
+
+    response = booking_app.app.test_client().post('/api/availability', json={
+        'hotel_id': 1, 'check_in': '2027-01-05', 'check_out': '2027-01-08'
+    })
+
+    assert response.status_code == 200
+    assert response.get_json() == {'hotel_id': 1, 'available_rooms': 7, 'total_rooms': 10}
+
+def test_unpadded_dates_share_a_cache_entry(monkeypatch):
+    conn = StubConnection()
+    monkeypatch.setattr(booking_app, 'get_db_connection', lambda: conn)
+    booking_app.availability_cache.clear()
+    client = booking_app.app.test_client()
+
+    client.post('/api/availability', json={'hotel_id': 1, 'check_in': '2027-1-5', 'check_out': '2027-1-8'})
+    assert booking_app.invalidate_availability(1, '2027-01-06', '2027-01-07') == 1
@@ -0,0 +1,325 @@
+import hashlib
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+
+# Admission control shared by the services. Every request is classified into
+# a priority class, charged against a per-client token bucket, and admitted
+# only while the process is under its concurrency limit. Each class may use
+# a share of that limit, so under overload listings and admin reports are
+# shed first and bookings/payments keep their slots. The limit itself adapts
+# to observed MySQL latency: it backs off when queries slow down and grows
+# back while the database keeps up, which keeps the number of open
+# get_db_connection() connections below what MySQL can serve.
+
+PRIORITY_CLASSES = ('critical', 'normal', 'low', 'background')
+
+# Share of the concurrency limit each class may occupy
+PRIORITY_SHARES = {'critical': 1.0, 'normal': 0.8, 'low': 0.5, 'background': 0.25}
+
+# Token bucket (requests per second, burst) per client and class
+DEFAULT_RATES = {
+    'critical': (20, 40),
+    'normal': (50, 100),
+    'low': (30, 60),
+    'background': (2, 5),
+}
+
+EXEMPT_PATHS = ('/', '/health')
+
+# Peers whose X-Forwarded-For is believed: nginx, the gateway and other
+# in-cluster hops. Entries added by anyone else are the client's own claim.
+TRUSTED_PROXIES = ('127.0.0.0/8', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '::1/128', 'fc00::/7')
+
+# MySQL errors that mean the server is saturated rather than the query wrong:
+# too many connections, lock wait timeout, query interrupted by max time
+OVERLOAD_ERRNOS = (1040, 1205, 3024)
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        # Returns 0 when a token was taken, else seconds until one is due
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class AdaptiveLimit:
+    # AIMD on DB latency: every window, compare the median query time with
+    # a slowly drifting baseline. Well above it (or overload errors seen) the
+    # limit shrinks by 20%; otherwise, if the limit was actually reached, it
+    # grows by one.
+
+    def __init__(self, initial, minimum, maximum, tolerance=2.0, window=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.window = window
+        self.baseline = None
+        self.last_p50 = None
+        self._samples = []
+        self._overloaded = False
+        self._peak_inflight = 0
+        self._window_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def note_inflight(self, inflight):
+        if inflight > self._peak_inflight:
+            self._peak_inflight = inflight
+
+    def observe(self, latency, overloaded=False):
+        with self._lock:
+            self._samples.append(latency)
+            self._overloaded = self._overloaded or overloaded
+            if time.monotonic() - self._window_started >= self.window:
+                self._adjust()
+
+    def _adjust(self):
+        samples = sorted(self._samples)
+        p50 = samples[len(samples) // 2]
+        if self.baseline is None:
+            self.baseline = p50
+        else:
+            # Drifts up slowly so a permanently slower DB becomes the new normal
+            self.baseline = min(p50, self.baseline * 1.005)
+
+        if self._overloaded or p50 > self.baseline * self.tolerance:
+            self.limit = max(self.minimum, self.limit * 0.8)
+        elif self._peak_inflight >= int(self.limit):
+            self.limit = min(self.maximum, self.limit + 1)
+
+        self.last_p50 = p50
+        self._samples = []
+        self._overloaded = False
+        self._peak_inflight = 0
+        self._window_started = time.monotonic()
+
+class _TimedCursor:
+    def __init__(self, cursor, observe):
+        self._cursor = cursor
+        self._observe = observe
+
+    def _timed(self, method, *args, **kwargs):
+        started = time.monotonic()
+        overloaded = False
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            overloaded = getattr(e, 'errno', None) in OVERLOAD_ERRNOS
+            raise
+        finally:
+            self._observe(time.monotonic() - started, overloaded)
+
+    def execute(self, *args, **kwargs):
+        return self._timed(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed(self._cursor.executemany, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _TimedConnection:
+    def __init__(self, conn, observe):
+        self._conn = conn
+        self._observe = observe
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs), self._observe)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class Admission:
+
+    def __init__(self, routes=(), default_class='normal', max_concurrency=64, min_concurrency=4,
+                 initial_concurrency=None, tolerance=2.0, rates=None, critical_wait=0.25, max_clients=10000,
+                 trusted_proxies=TRUSTED_PROXIES):
+        # routes: (path prefix, methods or None, class, route concurrency cap or None);
+        # the longest matching prefix wins
+        self.routes = sorted(routes, key=lambda route: len(route[0]), reverse=True)
+        self.default_class = default_class
+        self.limiter = AdaptiveLimit(initial_concurrency or max_concurrency // 2, min_concurrency,
+                                     max_concurrency, tolerance)
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+        self.critical_wait = critical_wait
+        self.max_clients = max_clients
+        self.trusted_proxies = [ipaddress.ip_network(network, strict=False) for network in trusted_proxies]
+        self.inflight = 0
+        self.route_inflight = {}
+        self._buckets = OrderedDict()
+        self._condition = threading.Condition()
+        self._stats = {
+            priority: {'admitted': 0, 'rate_limited': 0, 'shed': 0}
+            for priority in PRIORITY_CLASSES
+        }
+
+    @classmethod
+    def from_env(cls, routes=(), default_class='normal'):
+        rates = {}
+        for priority in PRIORITY_CLASSES:
+            value = os.getenv(f'ADMISSION_RATE_{priority.upper()}')
+            if value:
+                rate, _, burst = value.partition('/')
+                rates[priority] = (float(rate), float(burst or rate))
+        return cls(
+            routes,
+            default_class,
+            max_concurrency=int(os.getenv('ADMISSION_MAX_CONCURRENCY', 64)),
+            min_concurrency=int(os.getenv('ADMISSION_MIN_CONCURRENCY', 4)),
+            initial_concurrency=int(os.getenv('ADMISSION_INITIAL_CONCURRENCY', 0)) or None,
+            tolerance=float(os.getenv('ADMISSION_LATENCY_TOLERANCE', 2.0)),
+            rates=rates,
+            critical_wait=float(os.getenv('ADMISSION_CRITICAL_WAIT', 0.25)),
+            trusted_proxies=[
+                network.strip() for network in os.getenv('ADMISSION_TRUSTED_PROXIES', ','.join(TRUSTED_PROXIES)).split(',')
+                if network.strip()
+            ]
+        )
+
+    def classify(self, path, method):
+        for prefix, methods, priority, cap in self.routes:
+            if (path == prefix or path.startswith(prefix + '/')) and (methods is None or method in methods):
+                return priority, f"{method} {prefix}", cap
+        return self.default_class, None, None
+
+    def trusted(self, address):
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def client_address(self):
+        # Walks X-Forwarded-For from the right while the hop that added the
+        # entry is a trusted proxy; the first address not vouched for that
+        # way is the client. Entries the client sent itself are never reached.
+        address = request.remote_addr or 'unknown'
+        hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        while hops and self.trusted(address):
+            address = hops.pop()
+        return address
+
+    def client_key(self):
+        # API key first, then the bearer token, then the client address
+        key = request.headers.get('X-API-Key') or request.headers.get('Authorization')
+        if key:
+            return 'k:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return 'ip:' + self.client_address()
+
+    def rate_limit(self, client, priority):
+        rate, burst = self.rates[priority]
+        now = time.monotonic()
+        key = (client, priority)
+        with self._condition:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(now)
+
+    def _fits(self, priority, route_key, cap):
+        allowed = max(1, int(self.limiter.limit * PRIORITY_SHARES[priority]))
+        if self.inflight >= allowed:
+            return False
+        return cap is None or self.route_inflight.get(route_key, 0) < cap
+
+    def acquire(self, priority, route_key=None, cap=None):
+        # Only critical requests wait (briefly) for a slot; the rest fail fast
+        deadline = time.monotonic() + (self.critical_wait if priority == 'critical' else 0)
+        with self._condition:
+            while not self._fits(priority, route_key, cap):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats[priority]['shed'] += 1
+                    return False
+                self._condition.wait(remaining)
+            self.inflight += 1
+            if route_key:
+                self.route_inflight[route_key] = self.route_inflight.get(route_key, 0) + 1
+            self.limiter.note_inflight(self.inflight)
+            self._stats[priority]['admitted'] += 1
+            return True
+
+    def release(self, route_key=None):
+        with self._condition:
+            self.inflight -= 1
+            if route_key:
+                self.route_inflight[route_key] -= 1
+            self._condition.notify()
+
+    def connect(self, connect, **config):
+        # Wraps a DB connection so every query feeds the adaptive limit
+        started = time.monotonic()
+        try:
+            conn = connect(**config)
+        except Exception as e:
+            self.limiter.observe(time.monotonic() - started, getattr(e, 'errno', None) in OVERLOAD_ERRNOS)
+            raise
+        self.limiter.observe(time.monotonic() - started)
+        return _TimedConnection(conn, self.limiter.observe)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": round(self.limiter.limit, 1),
+                "inflight": self.inflight,
+                "baseline_ms": round(self.limiter.baseline * 1000, 2) if self.limiter.baseline is not None else None,
+                "last_p50_ms": round(self.limiter.last_p50 * 1000, 2) if self.limiter.last_p50 is not None else None,
+                "clients": len(self._buckets),
+                "classes": {priority: dict(counts) for priority, counts in self._stats.items()}
+            }
+
+    def _reject(self, status, message, retry_after, priority):
+        retry_after = max(1, math.ceil(retry_after))
+        response = jsonify({"error": message, "priority": priority, "retry_after": retry_after})
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def before_request(self):
+        if request.method == 'OPTIONS' or request.path in EXEMPT_PATHS or request.path.startswith('/health/'):
+            return None
+        priority, route_key, cap = self.classify(request.path, request.method)
+
+        wait = self.rate_limit(self.client_key(), priority)
+        if wait:
+            self._stats[priority]['rate_limited'] += 1
+            return self._reject(429, "Rate limit exceeded", wait, priority)
+
+        if not self.acquire(priority, route_key, cap):
+            return self._reject(503, "Service overloaded, try again shortly", 1, priority)
+        g.admission_route = route_key
+        return None
+
+    def teardown_request(self, exc=None):
+        if 'admission_route' in g:
+            self.release(g.pop('admission_route'))
+
+    def install(self, app):
+        if os.getenv('ADMISSION_ENABLED', 'true').lower() != 'true':
+            return
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/health/admission', 'admission_stats', lambda: jsonify(self.stats()))
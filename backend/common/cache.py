@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.invalidated = False
+
+class SWRCache:
+    # In-process cache with a fresh TTL, a stale-while-revalidate window and
+    # singleflight loading: concurrent misses on one key share one loader call
+
+    def __init__(self, ttl, stale_ttl=0, max_entries=10000, refresh_workers=4):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers)
+        self._stats = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+            'loads': 0, 'load_errors': 0, 'invalidations': 0
+        }
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.ttl:
+                    self._stats['hits'] += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._stats['stale_hits'] += 1
+                    if key not in self._flights:
+                        self._flights[key] = _Flight()
+                        self._refresher.submit(self._load, key, loader)
+                    return value
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self._stats['misses'] += 1
+                leader = True
+
+        if leader:
+            self._load(key, loader)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _load(self, key, loader):
+        with self._lock:
+            flight = self._flights[key]
+            self._stats['loads'] += 1
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+
+        with self._lock:
+            if flight.error is not None:
+                self._stats['load_errors'] += 1
+            elif not flight.invalidated:
+                # A write that landed while we were loading makes the result suspect
+                if len(self._entries) >= self.max_entries and key not in self._entries:
+                    self._entries.pop(next(iter(self._entries)))
+                self._entries[key] = (flight.value, time.monotonic())
+            del self._flights[key]
+        flight.done.set()
+
+    def invalidate(self, match):
+        # match(key) -> bool; in-flight loads for matching keys are not stored
+        with self._lock:
+            stale = [key for key in self._entries if match(key)]
+            for key in stale:
+                del self._entries[key]
+            for key, flight in self._flights.items():
+                if match(key):
+                    flight.invalidated = True
+            self._stats['invalidations'] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        return self.invalidate(lambda key: True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['in_flight'] = len(self._flights)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_ratio'] = round((stats['hits'] + stats['stale_hits']) / lookups, 4) if lookups else 0.0
+        # Share of lookups that did not trigger their own DB computation
+        stats['db_offload_ratio'] = round(1 - stats['loads'] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Cold-start timings per service: import, app factory and first /health
+# request in a fresh interpreter, or with --serve the wall time from
+# `python app.py` to a healthy /health, which is what a readiness probe sees.
+#
+#   python -m common.coldstart
+#   python -m common.coldstart booking-service hotel-service --serve
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    'api-gateway': 8080,
+    'hotel-service': 81,
+    'booking-service': 82,
+    'user-service': 83,
+    'review-service': 84,
+    'payment-service': 85,
+    'admin-dashboard': 8999,
+}
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+status = application.test_client().get('/health').status_code
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": round((imported - started) * 1000, 1),
+    "create_app_ms": round((created - imported) * 1000, 1),
+    "first_request_ms": round((served - created) * 1000, 1),
+    "status": status
+}))
+"""
+
+def service_env(port=None):
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv('PYTHONPATH')]))}
+    # Measure the start itself, not the background warm-up
+    env['SERVICE_WARMUP'] = 'false'
+    if port is not None:
+        env['PORT'] = str(port)
+    return env
+
+def measure_import(service):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=os.path.join(BACKEND_DIR, service),
+                            env=service_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+def measure_serve(service, port, timeout):
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=os.path.join(BACKEND_DIR, service),
+                               env=service_env(port), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                return {"error": f"exited with {process.returncode}"}
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.5) as response:
+                    if response.status == 200:
+                        return {"ready_ms": round((time.perf_counter() - started) * 1000, 1)}
+            except Exception:
+                time.sleep(0.02)
+        return {"error": "not ready before timeout"}
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure service cold-start time")
+    parser.add_argument('services', nargs='*', help="service directories (default: all)")
+    parser.add_argument('--serve', action='store_true', help="start each server and time until /health answers")
+    parser.add_argument('--port-offset', type=int, default=20000, help="added to each service port with --serve")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    for service in args.services or list(SERVICES):
+        if args.serve:
+            result = measure_serve(service, SERVICES[service] + args.port_offset, args.timeout)
+        else:
+            result = measure_import(service)
+        print(json.dumps({"service": service, **result}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import math
+import os
+import re
+import threading
+import time
+
+from flask import g, has_request_context, jsonify, request
+
+# Request deadlines. The edge (gateway) starts a budget per route; every hop
+# passes the remaining budget on in X-Request-Deadline-Ms and each service
+# caps it by its own route default. Inside a service the deadline bounds
+# every MySQL statement: SELECTs get a MAX_EXECUTION_TIME hint with the time
+# left. When a pooled connection is checked out, its session's
+# max_execution_time and lock wait timeouts are set to the remaining budget
+# (ConnectionPool._set_timeout). That bounds prepared SELECTs, which cannot
+# take a hint, and writes waiting on locks. An unpooled connection gets a
+# socket read timeout instead.
+# Connections opened for a request are closed when it ends, so work that
+# timed out never keeps holding one.
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Below this there is no point starting another statement or call
+MIN_BUDGET = 0.005
+
+SELECT_PATTERN = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+# 3024: statement interrupted by max_execution_time; 2013: socket read timeout
+TIMEOUT_ERRNOS = (3024, 2013)
+
+class DeadlineExceeded(Exception):
+    pass
+
+def with_time_limit(query, milliseconds):
+    match = SELECT_PATTERN.match(query) if isinstance(query, str) else None
+    if not match:
+        return query
+    return f"{query[:match.end()]} /*+ MAX_EXECUTION_TIME({milliseconds}) */{query[match.end():]}"
+
+class _DeadlineCursor:
+    def __init__(self, cursor, deadlines, hint=True):
+        self._cursor = cursor
+        self._deadlines = deadlines
+        self._hint = hint
+
+    def _bounded(self, method, query, *args, **kwargs):
+        remaining = self._deadlines.remaining()
+        if remaining is not None:
+            if remaining < MIN_BUDGET:
+                self._deadlines.expired('budget_exhausted')
+            if self._hint:
+                query = with_time_limit(query, max(1, int(remaining * 1000)))
+        try:
+            return method(query, *args, **kwargs)
+        except Exception as e:
+            errno = getattr(e, 'errno', None)
+            if errno == 3024:
+                self._deadlines.record('statement_timeouts')
+                g.deadline_exceeded = True
+            elif errno in TIMEOUT_ERRNOS and remaining is not None:
+                self._deadlines.record('read_timeouts')
+                g.deadline_exceeded = True
+            raise
+
+    def execute(self, query, *args, **kwargs):
+        return self._bounded(self._cursor.execute, query, *args, **kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        return self._bounded(self._cursor.executemany, query, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _DeadlineConnection:
+    def __init__(self, conn, deadlines):
+        self._conn = conn
+        self._deadlines = deadlines
+
+    def cursor(self, *args, **kwargs):
+        # A prepared statement is only reused while its text stays the same,
+        # so those get no hint; the session max_execution_time set at
+        # checkout bounds them instead
+        return _DeadlineCursor(self._conn.cursor(*args, **kwargs), self._deadlines, hint=not kwargs.get('prepared'))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class Deadlines:
+
+    def __init__(self, routes=(), default_budget=5.0, connect=None, grace=1.0):
+        # routes: (path prefix, methods or None, budget seconds); longest prefix wins
+        self.routes = sorted(routes, key=lambda route: len(route[0]), reverse=True)
+        self.default_budget = default_budget
+        self._connect = connect
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'propagated': 0, 'exceeded': 0, 'budget_exhausted': 0,
+            'statement_timeouts': 0, 'read_timeouts': 0, 'upstream_timeouts': 0
+        }
+        self._exceeded_routes = {}
+
+    @classmethod
+    def from_env(cls, routes=(), connect=None):
+        return cls(routes, float(os.getenv('REQUEST_BUDGET_MS', 5000)) / 1000, connect)
+
+    def budget_for(self, path, method):
+        for prefix, methods, budget in self.routes:
+            if (path == prefix or path.startswith(prefix + '/')) and (methods is None or method in methods):
+                return budget
+        return self.default_budget
+
+    def remaining(self):
+        # Seconds left for the current request; None outside a request
+        if not has_request_context() or 'deadline' not in g:
+            return None
+        return g.deadline - time.monotonic()
+
+    def timeout(self, default=None):
+        # For outgoing calls: the caller's own timeout, cut to the budget left
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining < MIN_BUDGET:
+            self.expired('budget_exhausted')
+        return remaining if default is None else min(default, remaining)
+
+    def headers(self):
+        remaining = self.remaining()
+        if remaining is None:
+            return {}
+        return {DEADLINE_HEADER: str(max(0, int(remaining * 1000)))}
+
+    def record(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def expired(self, counter):
+        self.record(counter)
+        g.deadline_exceeded = True
+        raise DeadlineExceeded("Request deadline exceeded")
+
+    def connect(self, **config):
+        remaining = self.remaining()
+        if remaining is not None:
+            if remaining < MIN_BUDGET:
+                self.expired('budget_exhausted')
+            # Backstop for statements the hint cannot bound (prepared
+            # SELECTs, writes, lock waits): the socket read timeout, or on a
+            # pooled connection the session timeouts set at checkout
+            config = {**config, 'connection_timeout': max(1, math.ceil(remaining + self.grace))}
+        conn = _DeadlineConnection(self._connect(**config), self)
+        if has_request_context():
+            g.setdefault('deadline_connections', []).append(conn)
+        return conn
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'exceeded_by_route': dict(self._exceeded_routes)}
+
+    def before_request(self):
+        budget = self.budget_for(request.path, request.method)
+        header = request.headers.get(DEADLINE_HEADER)
+        if header:
+            try:
+                budget = min(budget, max(0, int(header)) / 1000)
+                self.record('propagated')
+            except ValueError:
+                pass
+        g.deadline = time.monotonic() + budget
+        self.record('requests')
+
+    def after_request(self, response):
+        # Routes report every failure as 500; a blown deadline is a 504
+        if g.get('deadline_exceeded'):
+            route = request.url_rule.rule if request.url_rule else request.path
+            with self._lock:
+                self._stats['exceeded'] += 1
+                self._exceeded_routes[route] = self._exceeded_routes.get(route, 0) + 1
+            if response.status_code == 500:
+                response = jsonify({"error": "Request deadline exceeded"})
+                response.status_code = 504
+        return response
+
+    def teardown_request(self, exc=None):
+        # Error paths skip conn.close(); make sure nothing outlives the request
+        for conn in g.pop('deadline_connections', []):
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def install(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/health/deadlines', 'deadline_stats', lambda: jsonify(self.stats()))
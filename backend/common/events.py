@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+
+# Transactional outbox: writers insert change rows in the same transaction as
+# the data change; any service that caches that data polls and invalidates
+
+def emit(cursor, entity, entity_ids, action, payload=None):
+    encoded = json.dumps(payload, default=str) if payload is not None else None
+    rows = [(entity, entity_id, action, encoded) for entity_id in entity_ids]
+    if rows:
+        cursor.executemany(
+            "INSERT INTO change_events (entity, entity_id, action, payload) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+    return len(rows)
+
+def emit_each(cursor, entity, action, payloads):
+    # Like emit(), with a payload per entity: payloads maps id -> payload
+    rows = [(entity, entity_id, action, json.dumps(payload, default=str)) for entity_id, payload in payloads.items()]
+    if rows:
+        cursor.executemany(
+            "INSERT INTO change_events (entity, entity_id, action, payload) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+    return len(rows)
+
+def prune(conn, older_than_hours=24):
+    cursor = conn.cursor()
+    cursor.execute(
+        "DELETE FROM change_events WHERE created_at < NOW() - INTERVAL %s HOUR LIMIT 10000",
+        (older_than_hours,)
+    )
+    deleted = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return deleted
+
+# How long a skipped outbox id is re-checked. Ids are taken at insert, not
+# at commit, so a lower id can become visible after higher ones were read;
+# this must outlast any transaction that writes change events.
+GAP_GRACE = 30.0
+
+class ChangeListener:
+    # Polls change_events for the given entities from a daemon thread and
+    # hands each batch to handler(events); starts at the current tail.
+    # Ids skipped over in the read order are kept as gaps and re-read on
+    # later polls for GAP_GRACE seconds, so an event from a transaction that
+    # committed late is still delivered (after newer ones). confirmed_id is
+    # the highest id at or below which every event has been delivered (or
+    # its gap given up on); None until the first poll.
+
+    def __init__(self, get_connection, entities, handler, interval=1.0, batch_size=1000):
+        self.get_connection = get_connection
+        self.entities = tuple(entities)
+        self.handler = handler
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_id = None
+        self.confirmed_id = None
+        self.gaps = {}
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def poll(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        if self.last_id is None:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) as last_id FROM change_events")
+            self.last_id = cursor.fetchone()['last_id']
+
+        late = []
+        if self.gaps:
+            placeholders = ', '.join(['%s'] * len(self.gaps))
+            cursor.execute(f"""
+                SELECT id, entity, entity_id, action, payload FROM change_events
+                WHERE id IN ({placeholders}) ORDER BY id
+            """, tuple(self.gaps))
+            late = cursor.fetchall()
+
+        # Every entity, in id order, so a missing id is a real gap; rows
+        # for other entities are dropped below
+        cursor.execute("""
+            SELECT id, entity, entity_id, action, payload FROM change_events
+            WHERE id > %s ORDER BY id LIMIT %s
+        """, (self.last_id, self.batch_size))
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.commit()  # end the snapshot so the next poll sees new rows
+
+        # Rolled back transactions leave gaps that never fill
+        now = time.monotonic()
+        found = {event['id'] for event in late}
+        gaps = {gap: seen for gap, seen in self.gaps.items() if gap not in found and now - seen < GAP_GRACE}
+        previous = self.last_id
+        for event in rows:
+            for gap in range(previous + 1, event['id']):
+                gaps[gap] = now
+            previous = event['id']
+
+        events = [event for event in late + rows if event['entity'] in self.entities]
+        for event in events:
+            if event['payload']:
+                event['payload'] = json.loads(event['payload'])
+        if events:
+            self.handler(events)
+        # Swapped in whole so confirmed_id readers never see it half updated
+        self.gaps = gaps
+        self.last_id = previous
+        self.confirmed_id = min(gaps) - 1 if gaps else previous
+        return len(rows)
+
+    def _run(self):
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = self.get_connection()
+                if self.poll(conn) == self.batch_size:
+                    continue
+            except Exception:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+            time.sleep(self.interval)
@@ -0,0 +1,370 @@
+import functools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+# Durable job queue shared by the services. Jobs live in MySQL and workers
+# claim them with SELECT ... FOR UPDATE SKIP LOCKED, so any number of worker
+# processes can drain a queue without handing the same job out twice.
+# JOB_STORE=sqlite:///path swaps in a local SQLite file for development.
+
+DEFAULT_MAX_ATTEMPTS = 5
+MAINTENANCE_INTERVAL = 5.0
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL DEFAULT 'default',
+    task TEXT NOT NULL,
+    payload TEXT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TEXT NOT NULL,
+    locked_by TEXT NULL,
+    locked_at TEXT NULL,
+    result TEXT NULL,
+    last_error TEXT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, queue, priority, run_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (status, locked_at);
+CREATE TABLE IF NOT EXISTS jobs_dead_letter (
+    job_id INTEGER PRIMARY KEY,
+    queue TEXT NOT NULL,
+    task TEXT NOT NULL,
+    payload TEXT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT NULL,
+    failed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS job_schedules (
+    name TEXT PRIMARY KEY,
+    queue TEXT NOT NULL DEFAULT 'default',
+    task TEXT NOT NULL,
+    payload TEXT NULL,
+    interval_seconds INTEGER NOT NULL,
+    next_run_at TEXT NOT NULL
+);
+"""
+
+JOB_COLUMNS = 'id, queue, task, payload, status, priority, attempts, max_attempts, run_at, result, last_error'
+
+def stamp(value):
+    # One text form both MySQL DATETIME(3) and SQLite compare correctly
+    return value.isoformat(sep=' ', timespec='milliseconds')
+
+def connect_sqlite(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SQLITE_SCHEMA)
+    return conn
+
+class JobQueue:
+
+    def __init__(self, get_connection, dialect='mysql', backoff_base=2.0, backoff_max=600.0, visibility_timeout=300.0):
+        self.get_connection = get_connection
+        self.dialect = dialect
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibility_timeout = visibility_timeout
+        self.tasks = {}
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, get_connection):
+        store = os.getenv('JOB_STORE', 'mysql')
+        options = {
+            'backoff_base': float(os.getenv('JOB_BACKOFF_BASE', 2.0)),
+            'backoff_max': float(os.getenv('JOB_BACKOFF_MAX', 600)),
+            'visibility_timeout': float(os.getenv('JOB_VISIBILITY_TIMEOUT', 300)),
+        }
+        if store.startswith('sqlite:///'):
+            return cls(functools.partial(connect_sqlite, store[len('sqlite:///'):]), 'sqlite', **options)
+        return cls(get_connection, 'mysql', **options)
+
+    def task(self, name, queue='default', priority=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        def register(fn):
+            self.tasks[name] = {'fn': fn, 'queue': queue, 'priority': priority, 'max_attempts': max_attempts}
+            return fn
+        return register
+
+
+    def _conn(self):
+        # Worker loops keep one connection per process and thread; a forked
+        # worker never reuses its parent's socket
+        cached = getattr(self._local, 'conn', None)
+        if cached is None or cached[0] != os.getpid():
+            self._local.conn = (os.getpid(), self.get_connection())
+        return self._local.conn[1]
+
+    def _reset(self):
+        cached = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if cached is not None and cached[0] == os.getpid():
+            try:
+                cached[1].close()
+            except Exception:
+                pass
+
+    def _execute(self, cursor, query, params=()):
+        if self.dialect == 'sqlite':
+            query = query.replace('%s', '?')
+        cursor.execute(query, params)
+        return cursor
+
+    def _rows(self, cursor):
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def _transaction(self, work, persistent=True):
+        # Producers (request handlers) use a short-lived connection per call
+        conn = self._conn() if persistent else self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if self.dialect == 'sqlite':
+                cursor.execute('BEGIN IMMEDIATE')
+            result = work(cursor)
+            conn.commit()
+            return result
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                if persistent:
+                    self._reset()
+            raise
+        finally:
+            cursor.close()
+            if not persistent:
+                conn.close()
+
+    def _decode(self, job):
+        for column in ('payload', 'result'):
+            if isinstance(job.get(column), (str, bytes)):
+                job[column] = json.loads(job[column])
+        return job
+
+    def enqueue(self, task, payload=None, queue=None, priority=None, delay=0, run_at=None, max_attempts=None):
+        spec = self.tasks.get(task, {})
+        run_at = run_at or datetime.now() + timedelta(seconds=delay)
+        params = (
+            queue or spec.get('queue', 'default'),
+            task,
+            json.dumps(payload, default=str),
+            spec.get('priority', 0) if priority is None else priority,
+            max_attempts or spec.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+            stamp(run_at)
+        )
+
+        def insert(cursor):
+            self._execute(cursor, """
+                INSERT INTO jobs (queue, task, payload, priority, max_attempts, run_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, params)
+            return cursor.lastrowid
+        return self._transaction(insert, persistent=False)
+
+    def get(self, job_id):
+        def fetch(cursor):
+            self._execute(cursor, f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+            return self._rows(cursor)
+        rows = self._transaction(fetch, persistent=False)
+        return self._decode(rows[0]) if rows else None
+
+    def counts(self):
+        def fetch(cursor):
+            self._execute(cursor, "SELECT queue, status, COUNT(*) as jobs FROM jobs GROUP BY queue, status")
+            return self._rows(cursor)
+        counts = {}
+        for row in self._transaction(fetch, persistent=False):
+            counts.setdefault(row['queue'], {})[row['status']] = row['jobs']
+        return counts
+
+    def schedule(self, name, task, interval_seconds, payload=None, queue='default'):
+        # Registers (or re-tunes) a recurring job; an existing next run is kept
+        if self.dialect == 'sqlite':
+            conflict = "ON CONFLICT(name) DO UPDATE SET queue = excluded.queue, task = excluded.task, payload = excluded.payload, interval_seconds = excluded.interval_seconds"
+        else:
+            conflict = "ON DUPLICATE KEY UPDATE queue = VALUES(queue), task = VALUES(task), payload = VALUES(payload), interval_seconds = VALUES(interval_seconds)"
+        params = (name, queue, task, json.dumps(payload, default=str), int(interval_seconds), stamp(datetime.now()))
+        self._transaction(lambda cursor: self._execute(cursor, f"""
+            INSERT INTO job_schedules (name, queue, task, payload, interval_seconds, next_run_at)
+            VALUES (%s, %s, %s, %s, %s, %s) {conflict}
+        """, params), persistent=False)
+
+    def retry_dead(self, job_id):
+        def revive(cursor):
+            self._execute(cursor, "DELETE FROM jobs_dead_letter WHERE job_id = %s", (job_id,))
+            self._execute(cursor, """
+                UPDATE jobs SET status = 'queued', attempts = 0, run_at = %s, last_error = NULL
+                WHERE id = %s AND status = 'dead'
+            """, (stamp(datetime.now()), job_id))
+            return cursor.rowcount
+        return self._transaction(revive, persistent=False) > 0
+
+    def prune(self, older_than_hours=72):
+        cutoff = stamp(datetime.now() - timedelta(hours=older_than_hours))
+        return self._transaction(lambda cursor: self._execute(
+            cursor, "DELETE FROM jobs WHERE status = 'succeeded' AND run_at < %s", (cutoff,)
+        ).rowcount)
+
+    def _lock_clause(self, skip_locked=True):
+        # SQLite serializes writers with BEGIN IMMEDIATE instead of row locks
+        if self.dialect != 'mysql':
+            return ''
+        return ' FOR UPDATE SKIP LOCKED' if skip_locked else ' FOR UPDATE'
+
+    def claim(self, worker_id, queues=('default',), limit=1):
+        now = stamp(datetime.now())
+        placeholders = ', '.join(['%s'] * len(queues))
+
+        def take(cursor):
+            self._execute(cursor, f"""
+                SELECT {JOB_COLUMNS} FROM jobs
+                WHERE status = 'queued' AND queue IN ({placeholders}) AND run_at <= %s
+                ORDER BY priority DESC, run_at, id LIMIT %s{self._lock_clause()}
+            """, (*queues, now, limit))
+            jobs = self._rows(cursor)
+            if jobs:
+                ids = [job['id'] for job in jobs]
+                self._execute(cursor, f"""
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = %s, locked_at = %s
+                    WHERE id IN ({', '.join(['%s'] * len(ids))})
+                """, (worker_id, now, *ids))
+            for job in jobs:
+                job['attempts'] += 1
+                job['locked_by'] = worker_id
+            return jobs
+        return [self._decode(job) for job in self._transaction(take)]
+
+    def complete(self, job, result=None):
+        self._transaction(lambda cursor: self._execute(cursor, """
+            UPDATE jobs SET status = 'succeeded', result = %s, last_error = NULL, locked_by = NULL
+            WHERE id = %s AND status = 'running' AND locked_by = %s
+        """, (json.dumps(result, default=str), job['id'], job['locked_by'])))
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _retry_or_bury(self, cursor, job, error):
+        if job['attempts'] >= job['max_attempts']:
+            self._execute(cursor, """
+                REPLACE INTO jobs_dead_letter (job_id, queue, task, payload, attempts, last_error)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (job['id'], job['queue'], job['task'], json.dumps(job['payload'], default=str), job['attempts'], error))
+            self._execute(cursor, """
+                UPDATE jobs SET status = 'dead', last_error = %s, locked_by = NULL WHERE id = %s
+            """, (error, job['id']))
+            return 'dead'
+        run_at = datetime.now() + timedelta(seconds=self.backoff(job['attempts']))
+        self._execute(cursor, """
+            UPDATE jobs SET status = 'queued', run_at = %s, last_error = %s, locked_by = NULL WHERE id = %s
+        """, (stamp(run_at), error, job['id']))
+        return 'retry'
+
+    def fail(self, job, error):
+        def record(cursor):
+            # Skip if the job was already reclaimed after a visibility timeout
+            self._execute(cursor, f"""
+                SELECT id FROM jobs WHERE id = %s AND status = 'running' AND locked_by = %s{self._lock_clause(skip_locked=False)}
+            """, (job['id'], job['locked_by']))
+            if not cursor.fetchall():
+                return None
+            return self._retry_or_bury(cursor, job, error)
+        return self._transaction(record)
+
+    def requeue_stale(self):
+        # Jobs whose worker died mid-run count as a failed attempt
+        cutoff = stamp(datetime.now() - timedelta(seconds=self.visibility_timeout))
+
+        def sweep(cursor):
+            self._execute(cursor, f"""
+                SELECT {JOB_COLUMNS} FROM jobs WHERE status = 'running' AND locked_at < %s
+                LIMIT 100{self._lock_clause()}
+            """, (cutoff,))
+            jobs = [self._decode(job) for job in self._rows(cursor)]
+            for job in jobs:
+                self._retry_or_bury(cursor, job, "Worker lost before finishing the job")
+            return len(jobs)
+        return self._transaction(sweep)
+
+    def enqueue_due_schedules(self):
+        now = datetime.now()
+
+        def due(cursor):
+            self._execute(cursor, f"""
+                SELECT name, queue, task, payload, interval_seconds FROM job_schedules
+                WHERE next_run_at <= %s{self._lock_clause()}
+            """, (stamp(now),))
+            schedules = self._rows(cursor)
+            for schedule in schedules:
+                spec = self.tasks.get(schedule['task'], {})
+                self._execute(cursor, """
+                    INSERT INTO jobs (queue, task, payload, priority, max_attempts, run_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (schedule['queue'], schedule['task'], schedule['payload'], spec.get('priority', 0),
+                      spec.get('max_attempts', DEFAULT_MAX_ATTEMPTS), stamp(now)))
+                self._execute(cursor, "UPDATE job_schedules SET next_run_at = %s WHERE name = %s", (
+                    stamp(now + timedelta(seconds=schedule['interval_seconds'])), schedule['name']
+                ))
+            return len(schedules)
+        return self._transaction(due)
+
+    def execute(self, job):
+        spec = self.tasks.get(job['task'])
+        try:
+            if spec is None:
+                raise LookupError(f"Unknown task: {job['task']}")
+            result = spec['fn'](job['payload'])
+        except Exception:
+            return self.fail(job, traceback.format_exc(limit=5)[-4000:])
+        self.complete(job, result)
+        return 'succeeded'
+
+    def work(self, worker_id, queues=('default',), poll_interval=1.0, stop=None):
+        stop = stop or threading.Event()
+        last_maintenance = 0.0
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                    self.requeue_stale()
+                    self.enqueue_due_schedules()
+                    last_maintenance = time.monotonic()
+                jobs = self.claim(worker_id, queues)
+                for job in jobs:
+                    self.execute(job)
+            except Exception:
+                self._reset()
+                jobs = []
+            if not jobs:
+                stop.wait(poll_interval)
+
+def run_workers(queue, queues=('default',), processes=2, poll_interval=1.0):
+    # Separate processes so slow or CPU-bound jobs never share a GIL with
+    # each other; SIGTERM lets every worker finish its current job
+    stop = multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    host = socket.gethostname()
+    workers = [
+        multiprocessing.Process(
+            target=queue.work, args=(f"{host}-{os.getpid()}-{i}", tuple(queues), poll_interval, stop)
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,541 @@
+import argparse
+import ast
+import glob
+import json
+import os
+import re
+import sys
+
+# Query plan regression check. Finds every SQL statement the services run
+# from their app.py files, and every prepared Statement constant in any of
+# their modules (run through fetch()), binds sample parameters and runs EXPLAIN
+# FORMAT=JSON against a local MySQL built from supabase/migrations and seeded
+# at realistic scale. A statement fails when it scans a large table, is
+# estimated to examine too many rows, or (on request paths outside the
+# admin tools) sorts or groups through a filesort/temporary table. Failing
+# statements get a proposed composite index.
+#
+#   python -m common.plancheck --setup              # migrate + seed, then check
+#   python -m common.plancheck                      # check an already seeded DB
+#   python -m common.plancheck hotel-service --json
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'supabase', 'migrations')
+
+SERVICES = ('hotel-service', 'booking-service', 'user-service', 'review-service', 'payment-service', 'admin-dashboard')
+
+# Rows seeded per table at --scale 1
+SEED_ROWS = {
+    'users': 50000,
+    'hotels': 5000,
+    'bookings': 200000,
+    'bookings_archive': 100000,
+    'payments': 200000,
+    'payments_archive': 100000,
+    'reviews': 100000,
+    'review_likes': 100000,
+    'hotel_inventory': 100000,
+    'change_events': 50000,
+}
+
+# Parent table of foreign-key style columns
+PARENTS = {
+    'user_id': 'users',
+    'hotel_id': 'hotels',
+    'booking_id': 'bookings',
+    'review_id': 'reviews',
+}
+
+# Tables below this size may be scanned
+MIN_SCAN_ROWS = 1000
+MAX_ROWS_EXAMINED = 10000
+
+# Known plans that are accepted as they are: (service, function) -> reason
+ACCEPTED = {
+    ('hotel-service', 'get_hotels'): "substring search on location; needs FULLTEXT and a MATCH query",
+    ('user-service', 'get_users'): "unpaginated user listing",
+    ('review-service', 'get_all_reviews'): "unpaginated review feed",
+    ('booking-service', 'get_user_bookings'): "live and archive rows are merged, then sorted",
+    ('payment-service', 'get_booking_payments'): "live and archive rows are merged, then sorted",
+    ('admin-dashboard', 'collect_stats'): "whole-table counts, computed once per live interval",
+    ('admin-dashboard', 'get_admin_users'): "unpaginated admin listing",
+    ('admin-dashboard', 'get_revenue_data'): "daily grouping over 30 days of payments",
+}
+
+# Migration statements that may fail when replaying the squashed history
+IGNORED_ERRNOS = (1007, 1050, 1060, 1061, 1062, 1091)
+
+WRITE_PREFIXES = ('INSERT', 'REPLACE')
+
+def _module_constants(tree, directory):
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            # Constants imported from a sibling module (from tasks import ...)
+            path = os.path.join(directory, node.module.replace('.', os.sep) + '.py')
+            if os.path.exists(path):
+                with open(path) as f:
+                    imported = _module_constants(ast.parse(f.read()), directory)
+                for alias in node.names:
+                    if alias.name in imported:
+                        constants[alias.asname or alias.name] = imported[alias.name]
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                constants[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                pass
+    return constants
+
+def _route(function):
+    for decorator in function.decorator_list:
+        if isinstance(decorator, ast.Call) and getattr(decorator.func, 'attr', None) == 'route' and decorator.args:
+            if isinstance(decorator.args[0], ast.Constant):
+                return decorator.args[0].value
+    return None
+
+class _Resolver:
+    # Turns the query argument of an execute() call back into SQL text.
+    # Optional clauses appended with += (or .append()ed to a list that is
+    # joined in) are all included, and a conditional expression takes its
+    # first branch, so the checked statement is the one with every filter
+    # applied.
+
+    def __init__(self, function, constants):
+        self.function = function
+        self.constants = constants
+        self.assignments = {}
+        self.appends = {}
+        self.loops = {}
+        for node in ast.walk(function):
+            if isinstance(node, (ast.Assign, ast.AugAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        self.assignments.setdefault(target.id, []).append(node)
+            elif isinstance(node, ast.For) and isinstance(node.target, ast.Name):
+                self.loops[node.target.id] = node.iter
+            elif (isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'append'
+                  and isinstance(node.func.value, ast.Name) and len(node.args) == 1):
+                self.appends.setdefault(node.func.value.id, []).append(node)
+
+    def value(self, node, line):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return node.value
+        if isinstance(node, ast.JoinedStr):
+            parts = []
+            for part in node.values:
+                text = self.value(part.value, line) if isinstance(part, ast.FormattedValue) else part.value
+                if text is None:
+                    return None
+                parts.append(str(text))
+            return ''.join(parts)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            left, right = self.value(node.left, line), self.value(node.right, line)
+            return None if left is None or right is None else left + right
+        if isinstance(node, ast.IfExp):
+            return self.value(node.body, line)
+        if (isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'join' and len(node.args) == 1
+                and isinstance(node.func.value, ast.Constant) and isinstance(node.func.value.value, str)):
+            items = self.items(node.args[0], line)
+            return None if items is None else node.func.value.value.join(items)
+        if isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'format' and not node.args:
+            template = self.value(node.func.value, line)
+            values = {keyword.arg: self.value(keyword.value, line) for keyword in node.keywords}
+            if template is None or None in values.values() or None in values:
+                return None
+            return template.format(**values)
+        if isinstance(node, ast.Name):
+            return self.name(node.id, line)
+        return None
+
+    def items(self, node, line):
+        # The strings of a list literal, a ['%s'] * n repeat (taken as two)
+        # or a list variable with what was appended to it before line
+        if isinstance(node, (ast.List, ast.Tuple)):
+            values = [self.value(item, line) for item in node.elts]
+            return None if None in values else values
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult) and isinstance(node.left, ast.List):
+            values = self.items(node.left, line)
+            return None if values is None else values * 2
+        if isinstance(node, (ast.DictComp, ast.ListComp, ast.GeneratorExp)) and len(node.generators) == 1:
+            # {name: name for name in (...)}: the names iterated over
+            return self.items(node.generators[0].iter, line)
+        if isinstance(node, ast.Name):
+            starts = [
+                assignment for assignment in self.assignments.get(node.id, ())
+                if isinstance(assignment, ast.Assign) and assignment.lineno < line
+            ]
+            if not starts:
+                constant = self.constants.get(node.id)
+                if isinstance(constant, (dict, list, tuple)) and all(isinstance(item, str) for item in constant):
+                    return list(constant)
+                return None
+            start = starts[-1]
+            values = self.items(start.value, start.lineno)
+            for call in self.appends.get(node.id, ()):
+                if values is not None and start.lineno < call.lineno < line:
+                    extra = self.value(call.args[0], call.lineno)
+                    values = None if extra is None else values + [extra]
+            return values
+        return None
+
+    def name(self, name, line):
+        if name in ('columns', 'fields'):
+            return '*'
+        if name == 'placeholders':
+            return '%s, %s'
+        if name in self.loops:
+            values = self.loops[name]
+            if isinstance(values, ast.Name):
+                values = self.constants.get(values.id)
+            elif isinstance(values, (ast.Tuple, ast.List)):
+                values = [item.value for item in values.elts if isinstance(item, ast.Constant)]
+            return values[0] if values else None
+        assignments = [node for node in self.assignments.get(name, ()) if node.lineno < line]
+        starts = [node for node in assignments if isinstance(node, ast.Assign)]
+        if not starts:
+            constant = self.constants.get(name)
+            return constant if isinstance(constant, str) else None
+        start = starts[-1]
+        text = self.value(start.value, start.lineno)
+        for node in assignments:
+            if isinstance(node, ast.AugAssign) and node.lineno > start.lineno and text is not None:
+                extra = self.value(node.value, node.lineno)
+                text = None if extra is None else text + extra
+        return text
+
+def find_statements(service):
+    path = os.path.join(BACKEND_DIR, service, 'app.py')
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    constants = _module_constants(tree, os.path.dirname(path))
+    statements = []
+    for function in tree.body:
+        if not isinstance(function, ast.FunctionDef):
+            continue
+        resolver = _Resolver(function, constants)
+        calls = [
+            node for node in ast.walk(function)
+            if isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'execute' and node.args
+        ]
+        for call in sorted(calls, key=lambda node: node.lineno):
+            statements.append({
+                "service": service,
+                "function": function.name,
+                "route": _route(function),
+                "line": call.lineno,
+                "sql": resolver.value(call.args[0], call.lineno)
+            })
+    return statements
+
+def find_prepared(service):
+    # Statement constants, in whichever module declares them. Each is run
+    # through fetch() on a request path, so it is checked as a hot statement.
+    directory = os.path.join(BACKEND_DIR, service)
+    statements = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        resolver = _Resolver(tree, _module_constants(tree, directory))
+        for node in tree.body:
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                    and isinstance(node.value, ast.Call) and getattr(node.value.func, 'id', None) == 'Statement'
+                    and len(node.value.args) >= 2):
+                statements.append({
+                    "service": service,
+                    "function": node.targets[0].id,
+                    "route": None,
+                    "line": f"{os.path.basename(path)}:{node.lineno}",
+                    "sql": resolver.value(node.value.args[1], node.lineno)
+                })
+    return statements
+
+def is_hot(statement):
+    route = statement['route'] or ''
+    return statement['service'] != 'admin-dashboard' and not route.startswith('/api/admin')
+
+DATE_COLUMNS = re.compile(r'(_at|check_in|check_out|night|date)$')
+
+def bind(sql):
+    # Replaces %s with literals MySQL can plan with; the column in front of
+    # the placeholder decides the shape
+    def literal(match):
+        before = sql[:match.start()].rstrip()
+        if re.search(r'\b(LIMIT|OFFSET)$', before, re.IGNORECASE) or re.search(r'\bLIMIT\s+\S+,$', before, re.IGNORECASE):
+            return '50'
+        if re.search(r'\bLIKE$', before, re.IGNORECASE):
+            return "'%a%'"
+        column = (re.search(r'(\w+)`?\s*(=|<|>|<=|>=|!=|<>)$', before)
+                  or re.search(r'(\w+)`?\s+BETWEEN(?:\s+\S+\s+AND)?$', before, re.IGNORECASE))
+        if column and DATE_COLUMNS.search(column.group(1)):
+            return "'2026-06-01'"
+        return "'1'"
+    return re.sub(r'%s', literal, sql)
+
+def joins(node):
+    # Yields the tables of each join (in join order) anywhere in the plan
+    if isinstance(node, list):
+        for item in node:
+            yield from joins(item)
+        return
+    if not isinstance(node, dict):
+        return
+    rest = node
+    if isinstance(node.get('nested_loop'), list):
+        tables = [item['table'] for item in node['nested_loop'] if 'table' in item]
+        yield tables
+        for table in tables:
+            yield from joins(table)
+        rest = {key: value for key, value in node.items() if key != 'nested_loop'}
+    elif isinstance(node.get('table'), dict) and 'access_type' in node['table']:
+        yield [node['table']]
+        yield from joins(node['table'])
+        rest = {key: value for key, value in node.items() if key != 'table'}
+    for value in rest.values():
+        yield from joins(value)
+
+def _flag(node, name):
+    if isinstance(node, dict):
+        return bool(node.get(name)) or any(_flag(value, name) for value in node.values())
+    if isinstance(node, list):
+        return any(_flag(item, name) for item in node)
+    return False
+
+def rows_examined(plan):
+    total = 0
+    for tables in joins(plan):
+        produced = 1
+        for table in tables:
+            total += table.get('rows_examined_per_scan', 0) * produced
+            produced = max(1, table.get('rows_produced_per_join', 1))
+    return total
+
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+        if alias and alias.upper() not in ('WHERE', 'JOIN', 'ON', 'LEFT', 'INNER', 'ORDER', 'GROUP', 'LIMIT', 'SET', 'UNION'):
+            aliases[alias] = table
+        aliases.setdefault(table, table)
+    return aliases
+
+def order_columns(sql, alias):
+    match = re.search(r'\bORDER\s+BY\s+(.+?)(?:\bLIMIT\b|$)', sql, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return []
+    columns = []
+    for item in match.group(1).split(','):
+        name = item.strip().split()[0] if item.strip() else ''
+        prefix, _, column = name.rpartition('.')
+        if column and prefix in ('', alias) and re.match(r'^\w+$', column):
+            columns.append(column)
+    return columns
+
+def propose_index(sql, table):
+    alias = table.get('table_name', '')
+    real = table_aliases(sql).get(alias, alias)
+    condition = table.get('attached_condition', '')
+    if re.search(rf"`{alias}`\.`\w+` like '%", condition):
+        column = re.search(rf"`{alias}`\.`(\w+)` like '%", condition).group(1)
+        return f"ALTER TABLE {real} ADD FULLTEXT INDEX ft_{real}_{column} ({column});  -- and query with MATCH ... AGAINST"
+    equal = re.findall(rf"`{alias}`\.`(\w+)` = ", condition)
+    ranges = re.findall(rf"`{alias}`\.`(\w+)` (?:<|>|<=|>=|between|like)", condition)
+    # Equality columns first, then the sort order, or else one range column
+    columns = equal + (order_columns(sql, alias) or ranges[:1])
+    columns = list(dict.fromkeys(columns))
+    if not columns:
+        return None
+    return f"CREATE INDEX idx_{real}_{'_'.join(columns)} ON {real} ({', '.join(columns)});"
+
+def analyse(statement, plan, max_rows=MAX_ROWS_EXAMINED, min_scan_rows=MIN_SCAN_ROWS):
+    problems, proposals = [], []
+    for tables in joins(plan):
+        for table in tables:
+            scanned = table.get('rows_examined_per_scan', 0)
+            if table.get('access_type') in ('ALL', 'index') and scanned >= min_scan_rows:
+                kind = 'full scan' if table['access_type'] == 'ALL' else 'full index scan'
+                problems.append(f"{kind} of {table.get('table_name')} (~{scanned} rows)")
+                proposal = propose_index(statement['sql'], table)
+                if proposal:
+                    proposals.append(proposal)
+
+    examined = rows_examined(plan)
+    if examined > max_rows:
+        problems.append(f"examines ~{examined} rows (limit {max_rows})")
+
+    if is_hot(statement):
+        if _flag(plan, 'using_filesort'):
+            problems.append("filesort on a request path")
+        if _flag(plan, 'using_temporary_table'):
+            problems.append("temporary table on a request path")
+    return {"rows_examined": examined, "problems": problems, "proposals": list(dict.fromkeys(proposals))}
+
+def check(conn, statement, max_rows=MAX_ROWS_EXAMINED):
+    sql = statement['sql']
+    if sql is None:
+        # A statement that cannot be checked fails unless it is accepted
+        result = {"problems": ["query text could not be resolved statically"]}
+        if (statement['service'], statement['function']) in ACCEPTED:
+            result['status'] = 'accepted'
+            result['reason'] = ACCEPTED[(statement['service'], statement['function'])]
+        else:
+            result['status'] = 'fail'
+        return result
+    if sql.lstrip().upper().startswith(WRITE_PREFIXES):
+        return {"status": "skipped", "problems": []}
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"EXPLAIN FORMAT=JSON {bind(sql)}")
+        plan = json.loads(cursor.fetchone()[0])
+    except Exception as e:
+        return {"status": "error", "problems": [str(e)]}
+    finally:
+        cursor.close()
+    result = analyse(statement, plan, max_rows)
+    if not result['problems']:
+        result['status'] = 'ok'
+    elif (statement['service'], statement['function']) in ACCEPTED:
+        result['status'] = 'accepted'
+        result['reason'] = ACCEPTED[(statement['service'], statement['function'])]
+    else:
+        result['status'] = 'fail'
+    return result
+
+def split_statements(script):
+    script = re.sub(r'^\s*--.*$', '', script, flags=re.MULTILINE)
+    return [statement.strip() for statement in re.split(r';\s*(?:\n|$)', script) if statement.strip()]
+
+def migrate(conn):
+    cursor = conn.cursor()
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+        with open(path) as f:
+            for statement in split_statements(f.read()):
+                try:
+                    cursor.execute(statement)
+                except Exception as e:
+                    if getattr(e, 'errno', None) not in IGNORED_ERRNOS:
+                        raise RuntimeError(f"{os.path.basename(path)}: {e}")
+    conn.commit()
+    cursor.close()
+
+def _column_expression(column, counts, unique):
+    # SQL producing a value for row n, derived from the column's type
+    name, data_type, column_type = column['name'], column['data_type'], column['column_type']
+    if name in PARENTS and counts.get(PARENTS[name]):
+        return f"1 + (n * 7919) % {counts[PARENTS[name]]}"
+    if column['nullable'] and (name.endswith('_id') or name == 'refund_for' or data_type == 'json'):
+        return 'NULL'
+    if data_type == 'enum':
+        values = re.findall(r"'((?:[^']|'')*)'", column_type)
+        return f"ELT(1 + n % {len(values)}, {', '.join(repr(value) for value in values)})"
+    if name == 'check_out':
+        return "DATE_ADD('2025-01-01', INTERVAL n % 730 + 1 + n % 7 DAY)"
+    if data_type == 'date':
+        return "DATE_ADD('2025-01-01', INTERVAL n % 730 DAY)"
+    if data_type in ('datetime', 'timestamp'):
+        return "DATE_ADD('2024-06-01', INTERVAL (n * 977) % 63072000 SECOND)"
+    if name == 'rating':
+        return '1 + n % 5'
+    if data_type in ('tinyint', 'smallint', 'int', 'bigint', 'decimal', 'float', 'double'):
+        return '1 + n % 500'
+    if data_type == 'json':
+        return "'{}'"
+    # Strings: unique columns get one value per row, the rest a realistic spread
+    width = column['length'] or 255
+    suffix = 'n' if unique else 'n % 500'
+    return f"LEFT(CONCAT('{name}-', {suffix}), {width})"
+
+def seed(conn, scale=1.0, chunk=50000):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT DATABASE() as db")
+    database = cursor.fetchone()['db']
+    cursor.execute(f"SET SESSION cte_max_recursion_depth = {chunk + 1}")
+    counts = {}
+    for table, rows in SEED_ROWS.items():
+        rows = int(rows * scale)
+        cursor.execute("""
+            SELECT COLUMN_NAME as name, DATA_TYPE as data_type, COLUMN_TYPE as column_type,
+                   IS_NULLABLE = 'YES' as nullable, CHARACTER_MAXIMUM_LENGTH as length, EXTRA as extra
+            FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (database, table))
+        columns = [column for column in cursor.fetchall() if 'auto_increment' not in column['extra']
+                   and 'GENERATED' not in column['extra'].upper()]
+        if not columns:
+            continue
+        cursor.execute("""
+            SELECT DISTINCT COLUMN_NAME as name FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND NON_UNIQUE = 0
+        """, (database, table))
+        unique = {row['name'] for row in cursor.fetchall()}
+        names = ', '.join(f"`{column['name']}`" for column in columns)
+        values = ', '.join(_column_expression(column, counts, column['name'] in unique) for column in columns)
+        for start in range(0, rows, chunk):
+            end = min(rows, start + chunk) - 1
+            cursor.execute(f"""
+                INSERT IGNORE INTO {table} ({names})
+                WITH RECURSIVE seq (n) AS (SELECT {start} UNION ALL SELECT n + 1 FROM seq WHERE n < {end})
+                SELECT {values} FROM seq
+            """)
+            conn.commit()
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+        cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
+        counts[table] = cursor.fetchone()['count']
+    cursor.close()
+    return counts
+
+def connect(args, database=None):
+    import mysql.connector
+    return mysql.connector.connect(host=args.host, port=args.port, user=args.user, password=args.password,
+                                   database=database)
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN every service SQL statement against a seeded local MySQL")
+    parser.add_argument('services', nargs='*', help="service directories (default: all)")
+    parser.add_argument('--host', default=os.getenv('DB_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('DB_PORT', 3306)))
+    parser.add_argument('--user', default=os.getenv('DB_USER', 'root'))
+    parser.add_argument('--password', default=os.getenv('DB_PASSWORD', ''))
+    parser.add_argument('--setup', action='store_true', help="apply the migrations and seed before checking")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplier for the seeded row counts")
+    parser.add_argument('--max-rows', type=int, default=MAX_ROWS_EXAMINED)
+    parser.add_argument('--list', action='store_true', help="only print the statements found")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    statements = [
+        statement for service in (args.services or SERVICES)
+        for statement in find_statements(service) + find_prepared(service)
+    ]
+    if args.list:
+        for statement in statements:
+            print(json.dumps(statement))
+        return 0
+
+    if args.setup:
+        conn = connect(args)
+        migrate(conn)
+        conn.close()
+    conn = connect(args, 'hotel_booking')
+    if args.setup:
+        print(json.dumps({"seeded": seed(conn, args.scale)}))
+
+    failed = 0
+    for statement in statements:
+        result = {**statement, **check(conn, statement, args.max_rows)}
+        failed += result['status'] in ('fail', 'error')
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f"{result['status'].upper():9} {statement['service']}:{statement['line']} {statement['function']}")
+        for problem in result['problems']:
+            print(f"          - {problem}")
+        if result.get('reason'):
+            print(f"          accepted: {result['reason']}")
+        for proposal in result.get('proposals', ()):
+            print(f"          proposed: {proposal}")
+    conn.close()
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Fast path for hot queries. Connections are pooled per process, named
+# statements are prepared once per pooled connection (server-side, binary
+# protocol), and rows come back as namedtuples, about a third of the cost of
+# a dict per row. Rows headed straight into a response are built as dicts
+# from the binary row instead (as_dict=True), which is cheaper than a
+# namedtuple plus _asdict(); statements without fields return plain tuples.
+
+# Prepared statements kept per pooled connection, least recently used dropped
+MAX_PREPARED = 32
+
+_record_types = {}
+_record_lock = threading.Lock()
+
+def record_type(fields):
+    fields = tuple(fields)
+    with _record_lock:
+        if fields not in _record_types:
+            _record_types[fields] = namedtuple('Row', fields)
+        return _record_types[fields]
+
+class Statement:
+    __slots__ = ('name', 'sql', 'fields', 'record')
+
+    def __init__(self, name, sql, fields=None):
+        self.name = name
+        # The connector reuses a prepared statement only while it is handed
+        # the very same string object, so this one is kept for every call
+        self.sql = sql
+        self.fields = tuple(fields) if fields else None
+        self.record = record_type(fields) if fields else None
+
+class _Slot:
+    __slots__ = ('conn', 'key', 'statements', 'released_at', 'timeout')
+
+    def __init__(self, conn, key):
+        self.conn = conn
+        self.key = key
+        self.statements = OrderedDict()
+        self.released_at = None
+        self.timeout = None
+
+class PooledConnection:
+    # close() hands the connection back to the pool; the prepared statements
+    # live with it
+
+    def __init__(self, slot, pool):
+        self._slot = slot
+        self._pool = pool
+        self._closed = False
+
+    @property
+    def prepared_statements(self):
+        return self._slot.statements
+
+    def close(self):
+        # Routes close explicitly and the deadline teardown closes again
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._slot)
+
+    def discard(self):
+        # Drops the connection instead of pooling it. release() reads any
+        # unread result to the end, which for a stream abandoned halfway can
+        # be millions of rows; closing the socket ends the query instead.
+        if not self._closed:
+            self._closed = True
+            self._pool.discard(self._slot)
+
+    def __getattr__(self, name):
+        return getattr(self._slot.conn, name)
+
+class ConnectionPool:
+
+    def __init__(self, connect, size=8, idle_timeout=60.0):
+        self._connect = connect
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'reused': 0, 'discarded': 0}
+
+    @classmethod
+    def from_env(cls, connect):
+        return cls(connect, size=int(os.getenv('DB_POOL_SIZE', 8)),
+                   idle_timeout=float(os.getenv('DB_POOL_IDLE_SECONDS', 60)))
+
+    def _close(self, conn):
+        self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def connect(self, **config):
+        if self.size <= 0:
+            return self._connect(**config)
+        # Deadlines pass a per-request connection_timeout; it is applied on
+        # checkout rather than keyed, so every budget shares one pool
+        timeout = config.pop('connection_timeout', None)
+        key = tuple(sorted(config.items()))
+        stale = []
+        slot = None
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Forked worker: the parent's sockets are not ours to use or close
+                self._idle = {}
+                self._pid = os.getpid()
+            idle = self._idle.get(key, [])
+            now = time.monotonic()
+            while idle:
+                candidate = idle.pop()
+                if now - candidate.released_at <= self.idle_timeout:
+                    slot = candidate
+                    self._stats['reused'] += 1
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            self._close(candidate.conn)
+        if slot is None:
+            slot = _Slot(self._connect(**config), key)
+            self._stats['opened'] += 1
+        try:
+            self._set_timeout(slot, timeout)
+        except Exception:
+            self._close(slot.conn)
+            raise
+        return PooledConnection(slot, self)
+
+    def _set_timeout(self, slot, timeout):
+        # The socket timeout is fixed when a connection opens, so a pooled
+        # one is bounded server-side instead: SELECTs (prepared ones too,
+        # which carry no hint) by max_execution_time, writes by how long
+        # they may wait on row and metadata locks. The budget is the whole
+        # request's, taken at checkout. DEFAULT puts back the server's own
+        # settings.
+        if timeout == slot.timeout:
+            return
+        seconds = int(timeout) if timeout is not None else 'DEFAULT'
+        milliseconds = int(timeout * 1000) if timeout is not None else 'DEFAULT'
+        cursor = slot.conn.cursor()
+        try:
+            cursor.execute(
+                f"SET SESSION max_execution_time = {milliseconds}, "
+                f"innodb_lock_wait_timeout = {seconds}, lock_wait_timeout = {seconds}"
+            )
+        finally:
+            cursor.close()
+        slot.timeout = timeout
+
+    def release(self, slot):
+        conn = slot.conn
+        try:
+            # Never hand out a connection mid-transaction or with rows unread
+            if getattr(conn, 'unread_result', False):
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._close(conn)
+            return
+        slot.released_at = time.monotonic()
+        with self._lock:
+            if os.getpid() == self._pid:
+                idle = self._idle.setdefault(slot.key, [])
+                if len(idle) < self.size:
+                    idle.append(slot)
+                    return
+        self._close(conn)
+
+    def discard(self, slot):
+        self._stats['discarded'] += 1
+        try:
+            # No QUIT round trip and no reading of pending rows
+            slot.conn.shutdown()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "idle": sum(len(idle) for idle in self._idle.values())}
+
+def _cursor(conn, statement):
+    statements = getattr(conn, 'prepared_statements', None)
+    if statements is None:
+        # Unpooled connection: prepare for this call only
+        return conn.cursor(prepared=True), True
+    cursor = statements.get(statement.name)
+    if cursor is None:
+        cursor = statements[statement.name] = conn.cursor(prepared=True)
+        if len(statements) > MAX_PREPARED:
+            _, oldest = statements.popitem(last=False)
+            try:
+                oldest.close()
+            except Exception:
+                pass
+    else:
+        statements.move_to_end(statement.name)
+    return cursor, False
+
+def fetch(conn, statement, params=(), as_dict=False):
+    cursor, owned = _cursor(conn, statement)
+    try:
+        cursor.execute(statement.sql, params)
+        rows = cursor.fetchall()
+        if statement.record is None:
+            return rows
+        if as_dict:
+            fields = statement.fields
+            return [dict(zip(fields, row)) for row in rows]
+        make = statement.record._make
+        return [make(row) for row in rows]
+    finally:
+        if owned:
+            cursor.close()
+
+def fetch_one(conn, statement, params=(), as_dict=False):
+    rows = fetch(conn, statement, params, as_dict)
+    return rows[0] if rows else None
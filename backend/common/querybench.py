@@ -0,0 +1,131 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+from common.query import ConnectionPool, Statement, fetch_one
+from common.responses import dumps
+from common.service import load_config, mysql_connect
+
+# Micro-benchmark for the hot query fast path. Runs each hot statement the
+# old way (text protocol, dictionary cursor) and through common.query
+# (pooled connection, prepared statement, namedtuple row), both ending in
+# JSON, and reports client CPU and wall time per query; the server also
+# skips parsing, which does not show here. --decode-only measures just row
+# decoding and serialization, without a database.
+#
+#   python -m common.querybench --iterations 5000
+#   python -m common.querybench --decode-only
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (service, module, statement attribute, sample parameters)
+HOT_QUERIES = (
+    ('booking-service', 'app', 'HOTEL_ROOMS', (1,)),
+    ('booking-service', 'occupancy', 'OVERLAPPING_ONE', (1, '2026-06-01', '2026-06-08') * 2),
+    ('hotel-service', 'app', 'HOTEL_BY_ID', (1,)),
+    ('user-service', 'app', 'TOKEN_USER', (1,)),
+)
+
+def load_statement(service, module, attribute):
+    # Service modules share names (app), so each is loaded under its own
+    directory = os.path.join(BACKEND_DIR, service)
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(f"{service}.{module}", os.path.join(directory, f"{module}.py"))
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+    finally:
+        sys.path.remove(directory)
+    return getattr(loaded, attribute)
+
+def timed(work, iterations):
+    work()
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(iterations):
+        work()
+    return {
+        "cpu_us": round((time.process_time() - cpu) / iterations * 1e6, 2),
+        "wall_us": round((time.perf_counter() - wall) / iterations * 1e6, 2)
+    }
+
+def compare(baseline, fast):
+    saved = baseline['cpu_us'] - fast['cpu_us']
+    return {
+        "baseline": baseline,
+        "fast_path": fast,
+        "cpu_saved_us": round(saved, 2),
+        "cpu_saved_pct": round(saved / baseline['cpu_us'] * 100, 1) if baseline['cpu_us'] else None
+    }
+
+def bench_database(iterations):
+    config = load_config('querybench', port=0)
+    plain = mysql_connect(**config.db)
+    pooled = ConnectionPool(mysql_connect).connect(**config.db)
+
+    results = []
+    for service, module, attribute, params in HOT_QUERIES:
+        statement = load_statement(service, module, attribute)
+
+        def text_protocol():
+            cursor = plain.cursor(dictionary=True)
+            cursor.execute(statement.sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+            return dumps(rows)
+
+        def prepared():
+            return dumps(fetch_one(pooled, statement, params, as_dict=True))
+
+        results.append({"query": statement.name, **compare(timed(text_protocol, iterations), timed(prepared, iterations))})
+    plain.close()
+    pooled.close()
+    return results
+
+def bench_decode(iterations, rows=1):
+    # A hotel row decoded the dictionary-cursor way vs as a namedtuple, once
+    # for rows used internally and once for rows that go into a response
+    fields = ('id', 'external_ref', 'name', 'location', 'description', 'rooms', 'price', 'amenities',
+              'image', 'status', 'created_at', 'updated_at')
+    raw = [(i, None, 'Grand Palace Hotel', 'New York, NY', 'Luxury hotel', 150, 299.0, 'WiFi,Pool',
+            'https://example.com/h.jpg', 'active', '2026-01-01 00:00:00', '2026-01-01 00:00:00')
+           for i in range(rows)]
+    make = Statement('decode', '', fields).record._make
+
+    def as_dicts():
+        return [dict(zip(fields, row)) for row in raw]
+
+    def as_records():
+        return [make(row) for row in raw]
+
+    def serialize_dicts():
+        return dumps([dict(zip(fields, row)) for row in raw])
+
+    def serialize_records():
+        return dumps([make(row)._asdict() for row in raw])
+
+    # Rows kept as records vs dicts; rows serialized as records (+_asdict)
+    # cost more than dicts, which is why such statements use as_dict=True
+    return [
+        {"query": f"decode {rows} row(s)", **compare(timed(as_dicts, iterations), timed(as_records, iterations))},
+        {"query": f"decode+serialize {rows} row(s) via records",
+         **compare(timed(serialize_dicts, iterations), timed(serialize_records, iterations))},
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the prepared statement / tuple row fast path")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--decode-only', action='store_true', help="no database; row decoding and serialization only")
+    args = parser.parse_args()
+
+    if args.decode_only:
+        results = bench_decode(args.iterations * 10) + bench_decode(args.iterations, rows=100)
+    else:
+        results = bench_database(args.iterations)
+    for result in results:
+        print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import math
+
+from common.events import emit
+
+# Hotel ranking scores (hotel_rankings), recomputed every few minutes by the
+# maintenance.hotel_rankings job so search never joins bookings, reviews and
+# review_likes per request. Per hotel:
+#   velocity      rooms booked per day (non-cancelled bookings, each counted
+#                 by its rooms), the last 7 days weighted over the last 30
+#   bayes_rating  average rating pulled towards the global mean by
+#                 RATING_PRIOR phantom reviews, so three 5-star reviews do
+#                 not outrank three hundred 4.8s
+#   conversion    share of bookings made in the window that were paid,
+#                 smoothed the same way towards the global rate
+#   popularity    the weighted blend of the above plus review volume and
+#                 helpful votes
+# Each aggregate is one grouped read over an index (bookings by created_at,
+# reviews by (hotel_id, rating)). Only rows whose values changed are
+# written, in short batches, and a 'hotel_ranking' change event tells
+# hotel-service to fold the scores into its catalogue snapshot.
+
+WINDOW_DAYS = 30
+RECENT_DAYS = 7
+RATING_PRIOR = 10
+CONVERSION_PRIOR = 10
+BATCH_SIZE = 1000
+
+WEIGHTS = {'velocity': 1.0, 'rating': 1.0, 'conversion': 0.5, 'reviews': 0.25, 'likes': 0.1}
+
+RANKING_FIELDS = (
+    'hotel_id', 'bookings_7d', 'bookings_30d', 'velocity', 'review_count', 'rating_avg',
+    'bayes_rating', 'review_likes', 'conversion', 'popularity'
+)
+
+def smoothed(total, count, prior_mean, prior_weight):
+    return (prior_mean * prior_weight + total) / (prior_weight + count)
+
+def score(recent, bookings, attempts, paid, reviews, rating_sum, likes, mean_rating, mean_conversion):
+    velocity = 0.7 * recent / RECENT_DAYS + 0.3 * bookings / WINDOW_DAYS
+    bayes_rating = smoothed(rating_sum, reviews, mean_rating, RATING_PRIOR)
+    conversion = smoothed(paid, attempts, mean_conversion, CONVERSION_PRIOR)
+    popularity = (
+        WEIGHTS['velocity'] * math.log1p(velocity)
+        + WEIGHTS['rating'] * (bayes_rating - 1) / 4
+        + WEIGHTS['conversion'] * conversion
+        + WEIGHTS['reviews'] * math.log1p(reviews)
+        + WEIGHTS['likes'] * math.log1p(likes)
+    )
+    return (
+        recent, bookings, round(velocity, 6), reviews,
+        round(rating_sum / reviews, 2) if reviews else None,
+        round(bayes_rating, 6), likes, round(conversion, 6), round(popularity, 6)
+    )
+
+def aggregate(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT hotel_id,
+               SUM(IF(status <> 'cancelled' AND created_at >= NOW() - INTERVAL {RECENT_DAYS} DAY, rooms, 0)),
+               SUM(IF(status <> 'cancelled', rooms, 0)),
+               COUNT(*),
+               SUM(payment_status = 'completed')
+        FROM bookings WHERE created_at >= NOW() - INTERVAL {WINDOW_DAYS} DAY
+        GROUP BY hotel_id
+    """)
+    bookings = {row[0]: tuple(int(value) for value in row[1:]) for row in cursor.fetchall()}
+    cursor.execute("SELECT hotel_id, COUNT(*), SUM(rating) FROM reviews GROUP BY hotel_id")
+    reviews = {row[0]: (int(row[1]), int(row[2])) for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT r.hotel_id, COUNT(*) FROM review_likes l JOIN reviews r ON r.id = l.review_id
+        GROUP BY r.hotel_id
+    """)
+    likes = {row[0]: int(row[1]) for row in cursor.fetchall()}
+    cursor.execute("SELECT id FROM hotels WHERE status = 'active'")
+    hotels = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.commit()
+    return hotels, bookings, reviews, likes
+
+def compute(hotels, bookings, reviews, likes):
+    # {hotel id: row values after hotel_id}
+    review_total = sum(count for count, _ in reviews.values())
+    mean_rating = sum(total for _, total in reviews.values()) / review_total if review_total else 3.0
+    attempts_total = sum(row[2] for row in bookings.values())
+    mean_conversion = sum(row[3] for row in bookings.values()) / attempts_total if attempts_total else 0.5
+    scores = {}
+    for hotel_id in hotels:
+        recent, booked, attempts, paid = bookings.get(hotel_id, (0, 0, 0, 0))
+        count, rating_sum = reviews.get(hotel_id, (0, 0))
+        scores[hotel_id] = score(
+            recent, booked, attempts, paid, count, rating_sum, likes.get(hotel_id, 0),
+            mean_rating, mean_conversion
+        )
+    return scores
+
+def stored(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(RANKING_FIELDS)} FROM hotel_rankings")
+    rows = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    cursor.close()
+    conn.commit()
+    return rows
+
+def refresh(conn, batch_size=BATCH_SIZE):
+    scores = compute(*aggregate(conn))
+    previous = stored(conn)
+    # Scores are rounded and stored as DOUBLE, so unchanged rows compare equal
+    changed = [(hotel_id, *values) for hotel_id, values in scores.items() if previous.get(hotel_id) != values]
+
+    columns = ', '.join(RANKING_FIELDS)
+    updates = ', '.join(f"{name} = VALUES({name})" for name in RANKING_FIELDS[1:])
+    cursor = conn.cursor()
+    for start in range(0, len(changed), batch_size):
+        cursor.executemany(f"""
+            INSERT INTO hotel_rankings ({columns}, computed_at)
+            VALUES ({', '.join(['%s'] * len(RANKING_FIELDS))}, NOW())
+            ON DUPLICATE KEY UPDATE {updates}, computed_at = VALUES(computed_at)
+        """, changed[start:start + batch_size])
+        if start + batch_size >= len(changed):
+            emit(cursor, 'hotel_ranking', [0], 'refresh', {'changed': len(changed)})
+        conn.commit()
+    cursor.close()
+    return {"hotels": len(scores), "changed": len(changed)}
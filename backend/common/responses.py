@@ -0,0 +1,67 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import orjson
+from flask import request
+from flask.json.provider import JSONProvider
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+class FieldSelectionError(ValueError):
+    pass
+
+def _default(value):
+    # orjson handles date/datetime natively; MySQL DECIMAL and TIME need help
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        # namedtuple rows from common.query
+        return value._asdict()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        sign = '-' if seconds < 0 else ''
+        hours, remainder = divmod(abs(seconds), 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(obj):
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
+
+def install_json(app):
+    app.json = OrjsonProvider(app)
+    return app
+
+def select_fields(columns, required=()):
+    # columns maps each public field name to its SQL expression; ?fields=a,b
+    # narrows the SELECT list to those fields instead of SELECT * / b.*
+    raw = request.args.get('fields', '')
+    names = [name.strip() for name in raw.split(',') if name.strip()] or list(columns)
+
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise FieldSelectionError(f"Unknown fields: {', '.join(unknown)}")
+
+    for name in required:
+        if name not in names:
+            names.append(name)
+
+    return ', '.join(
+        columns[name] if columns[name] == name else f"{columns[name]} as {name}"
+        for name in names
+    )
@@ -0,0 +1,123 @@
+import importlib
+import os
+import threading
+
+from flask import Flask, jsonify
+from flask_cors import CORS
+
+from common.query import ConnectionPool
+from common.responses import install_json
+
+# Shared service scaffolding: one config loader, an app factory that wires
+# CORS, JSON encoding, deadlines, admission control and the health route,
+# and lazy values so importing a service never opens connections, starts
+# threads or loads heavy libraries before the first request needs them.
+
+class Config:
+    def __init__(self, service, port):
+        self.service = service
+        self.port = int(os.getenv('PORT', port))
+        self.debug = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+        self.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
+        self.db = {
+            'host': os.getenv('DB_HOST', 'mysql-db'),
+            'user': os.getenv('DB_USER', 'hotel_user'),
+            'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
+            'database': os.getenv('DB_NAME', 'hotel_booking'),
+            'port': int(os.getenv('DB_PORT', 3306))
+        }
+        # Optional read replica for scans that may trail the primary
+        replica_host = os.getenv('DB_REPLICA_HOST')
+        self.replica_db = {
+            **self.db,
+            'host': replica_host,
+            'port': int(os.getenv('DB_REPLICA_PORT', self.db['port']))
+        } if replica_host else None
+
+    def get(self, name, default=None, cast=str):
+        value = os.getenv(name)
+        return default if value is None else cast(value)
+
+def load_config(service, port):
+    return Config(service, port)
+
+class Lazy:
+    # Builds its value on first use, once, even under concurrent first requests
+
+    _registry = []
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        Lazy._registry.append(self)
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self._factory()
+                    self._loaded = True
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+def lazy_import(module):
+    return Lazy(lambda: importlib.import_module(module))
+
+def warm_up():
+    # Loads every lazy value in the background once the service is serving,
+    # so readiness is not delayed but the first real request is not cold
+    def load():
+        for value in list(Lazy._registry):
+            try:
+                value.get()
+            except Exception:
+                pass
+    threading.Thread(target=load, daemon=True).start()
+
+def mysql_connect(**config):
+    import mysql.connector
+    # The C extension protocol implementation whenever it is installed
+    return mysql.connector.connect(use_pure=False, **config)
+
+# Per-process pool; connections closed at the end of a request are reused
+mysql_pool = ConnectionPool.from_env(mysql_connect)
+
+def create_service(config, blueprints, deadlines=None, admission=None):
+    # Templates and static files resolve next to the service's own module
+    app = Flask(config.service, root_path=blueprints[0].root_path if blueprints else None)
+    app.config['SECRET_KEY'] = config.secret_key
+    CORS(app)
+    install_json(app)
+    if deadlines is not None:
+        deadlines.install(app)
+    if admission is not None:
+        admission.install(app)
+
+    app.add_url_rule('/health', 'health_check', lambda: jsonify({"status": "healthy", "service": config.service}))
+    app.add_url_rule('/health/pool', 'pool_stats', lambda: jsonify(mysql_pool.stats()))
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
+
+    if config.get('SERVICE_WARMUP', 'true').lower() == 'true':
+        # The first request (normally the readiness probe) kicks off warm-up
+        started = threading.Event()
+
+        @app.before_request
+        def warm():
+            if not started.is_set():
+                started.set()
+                warm_up()
+    return app
+
+def run(app, config):
+    # The reloader re-imports the whole service in a child process; only
+    # worth it while developing
+    app.run(host='0.0.0.0', port=config.port, debug=config.debug, use_reloader=config.debug, threaded=True)
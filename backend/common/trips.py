@@ -0,0 +1,130 @@
+from datetime import date, datetime, timedelta
+
+# Per-user "My Trips" summary (user_trip_summary): stay counts, the next
+# upcoming stay and lifetime spend. booking-service and payment-service
+# refresh a user's row after every write that touches their bookings or
+# payments, so the landing page is one primary-key read. A row also goes
+# stale by itself when its next stay starts (the counts move from upcoming
+# to past) or when it is older than MAX_AGE, and is then rebuilt on read.
+
+MAX_AGE = timedelta(days=1)
+
+SUMMARY_FIELDS = (
+    'user_id', 'upcoming', 'past', 'cancelled', 'lifetime_spend', 'next_booking_id',
+    'next_booking_ref', 'next_hotel_id', 'next_hotel_name', 'next_check_in', 'next_check_out',
+    'refreshed_at'
+)
+
+def _owner(cursor, booking_id):
+    for table in ('bookings', 'bookings_archive'):
+        cursor.execute(f"SELECT user_id FROM {table} WHERE id = %s LIMIT 1", (booking_id,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+    return None
+
+def refresh(conn, user_id):
+    # Its own short transaction, run after the write has committed. The row
+    # lock serializes concurrent refreshes of one user, and the reads after
+    # it see every write committed before it was granted.
+    cursor = conn.cursor()
+    try:
+        conn.commit()
+        cursor.execute("INSERT IGNORE INTO user_trip_summary (user_id) VALUES (%s)", (user_id,))
+        cursor.execute("SELECT user_id FROM user_trip_summary WHERE user_id = %s FOR UPDATE", (user_id,))
+        cursor.fetchall()
+
+        cursor.execute("""
+            SELECT COALESCE(SUM(status <> 'cancelled' AND check_in >= CURDATE()), 0),
+                   COALESCE(SUM(status <> 'cancelled' AND check_in < CURDATE()), 0),
+                   COALESCE(SUM(status = 'cancelled'), 0)
+            FROM (
+                SELECT status, check_in FROM bookings WHERE user_id = %s
+                UNION ALL
+                SELECT status, check_in FROM bookings_archive WHERE user_id = %s
+            ) stays
+        """, (user_id, user_id))
+        upcoming, past, cancelled = cursor.fetchone()
+
+        # Refunds are stored as negative completed payments
+        cursor.execute("""
+            SELECT COALESCE(SUM(amount), 0) FROM (
+                SELECT p.amount FROM payments p JOIN bookings b ON b.id = p.booking_id
+                WHERE b.user_id = %s AND p.payment_status = 'completed'
+                UNION ALL
+                SELECT p.amount FROM payments_archive p JOIN bookings b ON b.id = p.booking_id
+                WHERE b.user_id = %s AND p.payment_status = 'completed'
+                UNION ALL
+                SELECT p.amount FROM payments p JOIN bookings_archive b ON b.id = p.booking_id
+                WHERE b.user_id = %s AND p.payment_status = 'completed'
+                UNION ALL
+                SELECT p.amount FROM payments_archive p JOIN bookings_archive b ON b.id = p.booking_id
+                WHERE b.user_id = %s AND p.payment_status = 'completed'
+            ) paid
+        """, (user_id, user_id, user_id, user_id))
+        spend = cursor.fetchone()[0]
+
+        # Upcoming stays are never archived (archiving follows check_out)
+        cursor.execute("""
+            SELECT b.id, b.booking_ref, b.hotel_id, h.name, b.check_in, b.check_out
+            FROM bookings b JOIN hotels h ON h.id = b.hotel_id
+            WHERE b.user_id = %s AND b.status <> 'cancelled' AND b.check_in >= CURDATE()
+            ORDER BY b.check_in, b.id LIMIT 1
+        """, (user_id,))
+        next_stay = cursor.fetchone() or (None,) * 6
+
+        cursor.execute("""
+            UPDATE user_trip_summary
+            SET upcoming = %s, past = %s, cancelled = %s, lifetime_spend = %s,
+                next_booking_id = %s, next_booking_ref = %s, next_hotel_id = %s, next_hotel_name = %s,
+                next_check_in = %s, next_check_out = %s, refreshed_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s
+        """, (upcoming, past, cancelled, spend, *next_stay, user_id))
+        conn.commit()
+    finally:
+        cursor.close()
+
+def refresh_for_booking(conn, booking_id):
+    cursor = conn.cursor()
+    user_id = _owner(cursor, booking_id)
+    cursor.close()
+    if user_id is not None:
+        refresh(conn, user_id)
+    return user_id
+
+def refresh_quietly(conn, user_id=None, booking_id=None):
+    # The write itself has committed; a failed refresh is repaired by the
+    # next one or by MAX_AGE, so it must not fail the request
+    try:
+        if user_id is not None:
+            refresh(conn, user_id)
+        elif booking_id is not None:
+            refresh_for_booking(conn, booking_id)
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+def is_stale(summary, today=None):
+    today = today or date.today()
+    if summary['refreshed_at'] is None:
+        return True
+    refreshed = summary['refreshed_at']
+    if isinstance(refreshed, datetime) and datetime.now() - refreshed > MAX_AGE:
+        return True
+    return summary['next_check_in'] is not None and summary['next_check_in'] < today
+
+def load(conn, user_id):
+    cursor = conn.cursor(dictionary=True)
+    query = f"SELECT {', '.join(SUMMARY_FIELDS)} FROM user_trip_summary WHERE user_id = %s"
+    cursor.execute(query, (user_id,))
+    summary = cursor.fetchone()
+    if summary is None or is_stale(summary):
+        cursor.close()
+        refresh(conn, user_id)
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, (user_id,))
+        summary = cursor.fetchone()
+    cursor.close()
+    return summary
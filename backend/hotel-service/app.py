@@ -1,42 +1,108 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import mysql.connector
-import os
-
-app = Flask(__name__)
-CORS(app)
-
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'mysql-db'),
-    'user': os.getenv('DB_USER', 'hotel_user'),
-    'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
-    'database': os.getenv('DB_NAME', 'hotel_booking'),
-    'port': int(os.getenv('DB_PORT', 3306))
-}
+from flask import Blueprint, request, jsonify
+from catalogue_import import import_catalogue
+from geo import GeoError, latitude, longitude, parse_bbox, parse_coordinates
+from inventory import InventoryError, apply_updates
+from common.admission import Admission
+from common.deadline import Deadlines
+from common.events import emit
+from common.query import Statement, fetch_one
+from common.service import Lazy, create_service, lazy_import, load_config, mysql_pool, run
+from common.responses import FieldSelectionError, select_fields
+
+config = load_config('hotel-service', port=81)
+bp = Blueprint('hotels', __name__)
+
+HOTEL_FIELDS = {name: name for name in (
+    'id', 'external_ref', 'name', 'location', 'description', 'rooms', 'price', 'amenities',
+    'image', 'status', 'latitude', 'longitude', 'created_at', 'updated_at'
+)}
+
+# Hotel page lookup, prepared once per pooled connection
+HOTEL_BY_ID = Statement('hotel_by_id', f"SELECT {', '.join(HOTEL_FIELDS)} FROM hotels WHERE id = %s", tuple(HOTEL_FIELDS))
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/hotels', None, 'low', None),
+    ('/api/admin/hotels', None, 'normal', None),
+    ('/api/admin/hotels/import', ('POST',), 'background', 1),
+    ('/api/admin/hotels/inventory', ('POST',), 'background', 2),
+)
+
+# Request budgets in seconds where the REQUEST_BUDGET_MS default does not fit
+DEADLINE_ROUTES = (
+    ('/api/admin/hotels/import', ('POST',), 300),
+    ('/api/admin/hotels/inventory', ('POST',), 60),
+)
+
+deadlines = Deadlines.from_env(DEADLINE_ROUTES, mysql_pool.connect)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='low')
 
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    # Statements are bounded by the request deadline; their latency drives
+    # the adaptive concurrency limit
+    return admission.connect(deadlines.connect, **config.db)
+
+# Memory-mapped search snapshot shared by all workers (numpy loads on first use)
+catalogue = lazy_import('catalogue')
+hotel_catalogue = Lazy(lambda: catalogue.Catalogue.from_env(lambda: mysql_pool.connect(**config.db)))
+
+SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+MAX_RADIUS_KM = 20000
+
+def refresh_catalogue():
+    # Other workers pick the new version up through change events
+    try:
+        hotel_catalogue.request_rebuild()
+    except Exception:
+        pass
+
+@bp.before_app_request
+def start_catalogue():
+    # Idempotent; follows hotel changes made by other workers and replicas
+    try:
+        hotel_catalogue.start()
+    except Exception:
+        pass
 
-@app.route('/', methods=['GET'])
+@bp.route('/', methods=['GET'])
 def index():
     return "🏨 Welcome to the Hotel Service API"
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "service": "hotel-service"})
+def search_sort():
+    sort = request.args.get('sort')
+    if sort and sort not in catalogue.SORTS:
+        raise ValueError(f"sort must be one of {', '.join(catalogue.SORTS)}")
+    return sort
 
-@app.route('/api/hotels', methods=['GET'])
+def ranked_hotel_ids(sort, location):
+    # Top-K from the catalogue snapshot: ids of one page, best first
+    limit = min(int(request.args.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+    offset = int(request.args.get('offset', 0))
+    if limit < 0 or offset < 0:
+        raise ValueError("limit and offset must not be negative")
+    snapshot = hotel_catalogue.current()
+    positions = snapshot.ranked(snapshot.select(location=location), sort, offset + limit)[offset:]
+    return [int(hotel_id) for hotel_id in snapshot.columns['ids'][positions]]
+
+@bp.route('/api/hotels', methods=['GET'])
 def get_hotels():
     try:
         location = request.args.get('location', '')
+        sort = search_sort()
+        columns = select_fields(HOTEL_FIELDS, required=('id',) if sort else ())
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = "SELECT * FROM hotels WHERE status = 'active'"
+        query = f"SELECT {columns} FROM hotels WHERE status = 'active'"
         params = []
         
-        if location:
+        if sort:
+            # The snapshot picks and orders the page; rows are read by id
+            ids = ranked_hotel_ids(sort, location)
+            query += f" AND id IN ({', '.join(['%s'] * len(ids))})" if ids else " AND FALSE"
+            params.extend(ids)
+        elif location:
             query += " AND location LIKE %s"
             params.append(f"%{location}%")
         
@@ -46,20 +112,113 @@ def get_hotels():
         cursor.close()
         conn.close()
         
+        if sort:
+            by_id = {hotel['id']: hotel for hotel in hotels}
+            hotels = [by_id[hotel_id] for hotel_id in ids if hotel_id in by_id]
+        
         return jsonify(hotels)
+    except (FieldSelectionError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/hotels/<int:hotel_id>', methods=['GET'])
-def get_hotel(hotel_id):
+def search_filters():
+    # Shared by the catalogue searches; ValueError on malformed numbers
+    return {
+        "min_price": float(request.args['min_price']) if request.args.get('min_price') else None,
+        "max_price": float(request.args['max_price']) if request.args.get('max_price') else None,
+        "amenities": catalogue.split_amenities(request.args.get('amenities')),
+        "location": request.args.get('location')
+    }
+
+@bp.route('/api/hotels/search', methods=['GET'])
+def search_hotels():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        try:
+            filters = search_filters()
+            limit = min(int(request.args.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({"error": "min_price, max_price, limit and offset must be numbers"}), 400
+        if limit < 0 or offset < 0:
+            return jsonify({"error": "limit and offset must not be negative"}), 400
+        sort = search_sort()
         
-        cursor.execute("SELECT * FROM hotels WHERE id = %s", (hotel_id,))
-        hotel = cursor.fetchone()
+        snapshot = hotel_catalogue.current()
+        matches = snapshot.select(**filters)
+        # ?sort=popular|rating|price selects the top offset + limit only
+        page = snapshot.ranked(matches, sort, offset + limit)[offset:] if sort else matches[offset:offset + limit]
         
-        cursor.close()
+        return jsonify({
+            "total": len(matches),
+            "version": snapshot.version,
+            "hotels": snapshot.rows(page)
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/hotels/nearby', methods=['GET'])
+def nearby_hotels():
+    # ?lat=&lon= with radius_km (all within, nearest first) or without (the
+    # `limit` nearest), or ?bbox=south,west,north,east for a map viewport,
+    # nearest to lat/lon or to the box centre first
+    try:
+        try:
+            filters = search_filters()
+            limit = min(int(request.args.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+        except ValueError:
+            return jsonify({"error": "min_price, max_price and limit must be numbers"}), 400
+        if limit < 0:
+            return jsonify({"error": "limit must not be negative"}), 400
+        
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        if request.args.get('lat') or request.args.get('lon'):
+            lat, lon = latitude(request.args.get('lat')), longitude(request.args.get('lon'))
+        elif bbox:
+            south, west, north, east = bbox
+            lat = (south + north) / 2
+            lon = (west + east) / 2 if west <= east else (west + east + 360) / 2
+            lon = lon - 360 if lon > 180 else lon
+        else:
+            return jsonify({"error": "lat and lon, or bbox, are required"}), 400
+        radius_km = None
+        if request.args.get('radius_km'):
+            try:
+                radius_km = float(request.args['radius_km'])
+            except ValueError:
+                return jsonify({"error": "radius_km must be a number"}), 400
+            if not 0 < radius_km <= MAX_RADIUS_KM:
+                return jsonify({"error": f"radius_km must be above 0 and at most {MAX_RADIUS_KM}"}), 400
+        
+        snapshot = hotel_catalogue.current()
+        if bbox:
+            positions = snapshot.select(positions=snapshot.within(*bbox), **filters)
+            total = len(positions)
+            positions, distances = catalogue.closest(positions, snapshot.distances(positions, lat, lon), limit)
+        else:
+            positions, distances, total = snapshot.nearest(lat, lon, limit, radius_km, **filters)
+        
+        hotels = snapshot.rows(positions)
+        for hotel, distance in zip(hotels, distances):
+            hotel['distance_km'] = round(float(distance), 3)
+        return jsonify({
+            "total": total,
+            "version": snapshot.version,
+            "origin": {"lat": lat, "lon": lon},
+            "hotels": hotels
+        })
+    except GeoError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/hotels/<int:hotel_id>', methods=['GET'])
+def get_hotel(hotel_id):
+    try:
+        conn = get_db_connection()
+        hotel = fetch_one(conn, HOTEL_BY_ID, (hotel_id,), as_dict=True)
         conn.close()
         
         if hotel:
@@ -69,16 +228,17 @@ def get_hotel(hotel_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/hotels', methods=['POST'])
+@bp.route('/api/admin/hotels', methods=['POST'])
 def create_hotel():
     try:
         data = request.json
+        coordinates = parse_coordinates(data) or (None, None)
         conn = get_db_connection()
         cursor = conn.cursor()
         
         query = """
-        INSERT INTO hotels (name, location, rooms, price, amenities, description, image, status)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        INSERT INTO hotels (name, location, rooms, price, amenities, description, image, status, latitude, longitude)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
         params = (
             data['name'],
@@ -88,31 +248,39 @@ def create_hotel():
             ','.join(data['amenities']) if isinstance(data['amenities'], list) else data['amenities'],
             data['description'],
             data['image'],
-            data.get('status', 'active')
+            data.get('status', 'active'),
+            *coordinates
         )
         
         cursor.execute(query, params)
-        conn.commit()
         hotel_id = cursor.lastrowid
+        emit(cursor, 'hotel', [hotel_id], 'create')
+        conn.commit()
         
         cursor.close()
         conn.close()
+        refresh_catalogue()
         
         return jsonify({"id": hotel_id, "message": "Hotel created successfully"}), 201
+    except GeoError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/hotels/<int:hotel_id>', methods=['PUT'])
+@bp.route('/api/admin/hotels/<int:hotel_id>', methods=['PUT'])
 def update_hotel(hotel_id):
     try:
         data = request.json
+        # Coordinates left out of the payload keep their current values
+        coordinates = parse_coordinates(data)
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        query = """
+        query = f"""
         UPDATE hotels 
         SET name = %s, location = %s, rooms = %s, price = %s, 
             amenities = %s, description = %s, image = %s, status = %s
+            {', latitude = %s, longitude = %s' if coordinates else ''}
         WHERE id = %s
         """
         params = (
@@ -124,34 +292,116 @@ def update_hotel(hotel_id):
             data['description'],
             data['image'],
             data.get('status', 'active'),
+            *(coordinates or ()),
             hotel_id
         )
         
         cursor.execute(query, params)
+        emit(cursor, 'hotel', [hotel_id], 'update')
         conn.commit()
         
         cursor.close()
         conn.close()
+        refresh_catalogue()
         
         return jsonify({"message": "Hotel updated successfully"})
+    except GeoError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/hotels/<int:hotel_id>', methods=['DELETE'])
+@bp.route('/api/admin/hotels/<int:hotel_id>', methods=['DELETE'])
 def delete_hotel(hotel_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM hotels WHERE id = %s", (hotel_id,))
+        emit(cursor, 'hotel', [hotel_id], 'delete')
         conn.commit()
         
         cursor.close()
         conn.close()
+        refresh_catalogue()
         
         return jsonify({"message": "Hotel deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/api/admin/hotels/import', methods=['POST'])
+def import_hotels():
+    try:
+        file_format = request.args.get('format')
+        if not file_format:
+            file_format = 'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+        if file_format not in ('ndjson', 'csv'):
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        
+        conn = get_db_connection()
+        report = import_catalogue(conn, request.stream, file_format, dry_run)
+        conn.close()
+        if not dry_run:
+            refresh_catalogue()
+        
+        # Large feeds can ask for failures only
+        if request.args.get('report') == 'errors':
+            report['results'] = [r for r in report['results'] if r['status'] == 'invalid']
+        
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/admin/hotels/inventory', methods=['POST'])
+def update_inventory():
+    try:
+        data = request.get_json() or {}
+        # Either {"updates": [...]} or a single range update
+        updates = data.get('updates') or [data]
+        
+        conn = get_db_connection()
+        results = apply_updates(conn, updates)
+        conn.close()
+        
+        return jsonify({
+            "updated": results,
+            "nights_written": sum(result['nights_written'] for result in results)
+        })
+    except InventoryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/hotels/<int:hotel_id>/inventory', methods=['GET'])
+def get_inventory(hotel_id):
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        if not start or not end:
+            return jsonify({"error": "start and end are required"}), 400
+        
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        cursor.execute("""
+            SELECT night, rooms, price, closed FROM hotel_inventory
+            WHERE hotel_id = %s AND night BETWEEN %s AND %s ORDER BY night
+        """, (hotel_id, start, end))
+        nights = cursor.fetchall()
+        
+        cursor.close()
+        conn.close()
+        
+        for night in nights:
+            night['closed'] = bool(night['closed'])
+        return jsonify({"hotel_id": hotel_id, "overrides": nights})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=81, debug=True)
+    run(app, config)
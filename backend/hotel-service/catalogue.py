@@ -0,0 +1,435 @@
+import fcntl
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import geo
+from common.events import ChangeListener
+
+# Columnar snapshot of the active catalogue, shared by every worker process.
+# One file per version holds the arrays (ids, prices, rooms, a location
+# string table with a per-hotel index, names, amenity bitsets, coordinates
+# and a grid index over them, ranking scores) behind a JSON header; workers
+# mmap it read-only, so the pages exist once in the page cache however many
+# workers there are. CURRENT names the live version and is swapped with
+# os.replace, so readers see the old or the new file, never a mix. Rebuilds
+# are serialized across processes with a file lock.
+
+MAGIC = b'HCAT0003'
+ALIGN = 64
+
+# Versions kept besides the current one, for readers still mapping them
+KEEP_VERSIONS = 2
+
+DEFAULT_DIR = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'hotel-catalogue')
+
+# sort mode: (column, descending). popular and rating use the scores from
+# hotel_rankings (common/ranking.py), rating the Bayesian-smoothed one
+SORTS = {
+    'popular': ('popularity', True),
+    'rating': ('ratings', True),
+    'price': ('prices', False),
+}
+
+def split_amenities(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+def grid_keys(latitudes, longitudes):
+    rows = np.clip(np.floor((latitudes + 90) / geo.CELL_DEGREES), 0, geo.LAT_CELLS - 1).astype(np.int64)
+    columns = np.clip(np.floor((longitudes + 180) / geo.CELL_DEGREES), 0, geo.LON_CELLS - 1).astype(np.int64)
+    return rows * geo.LON_CELLS + columns
+
+def haversine_km(lat, lon, latitudes, longitudes):
+    lat, lon = np.radians(lat), np.radians(lon)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((latitudes - lat) / 2) ** 2 + np.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def write_snapshot(directory, rows, source_event_id):
+    # rows: (id, name, location, price, rooms, amenities, latitude, longitude,
+    # popularity, rating, review count) ordered by id
+    count = len(rows)
+    locations, location_codes = [], {}
+    vocabulary, amenity_bits = [], {}
+    for row in rows:
+        if row[2] not in location_codes:
+            location_codes[row[2]] = len(locations)
+            locations.append(row[2])
+        for amenity in split_amenities(row[5]):
+            if amenity.lower() not in amenity_bits:
+                amenity_bits[amenity.lower()] = len(vocabulary)
+                vocabulary.append(amenity)
+
+    # Bits are gathered as Python ints, one per row, then split into words
+    words = max(1, (len(vocabulary) + 63) // 64)
+    bitsets = np.zeros((count, words), dtype=np.uint64)
+    for index, row in enumerate(rows):
+        value = 0
+        for amenity in split_amenities(row[5]):
+            value |= 1 << amenity_bits[amenity.lower()]
+        for word in range(words):
+            bitsets[index, word] = (value >> (64 * word)) & 0xFFFFFFFFFFFFFFFF
+
+    names = [(row[1] or '').encode('utf-8') for row in rows]
+    name_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in names], out=name_offsets[1:])
+
+    # Hotels with coordinates, ordered by grid cell: a box query is one
+    # binary search per row of cells instead of a scan
+    latitudes = np.array([np.nan if row[6] is None else float(row[6]) for row in rows], dtype=np.float64)
+    longitudes = np.array([np.nan if row[7] is None else float(row[7]) for row in rows], dtype=np.float64)
+    located = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+    keys = grid_keys(latitudes[located], longitudes[located])
+    order = np.argsort(keys, kind='stable')
+
+    columns = {
+        'ids': np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+        'prices': np.fromiter((float(row[3]) for row in rows), dtype=np.float64, count=count),
+        'rooms': np.fromiter((row[4] or 0 for row in rows), dtype=np.int32, count=count),
+        'locations': np.fromiter((location_codes[row[2]] for row in rows), dtype=np.int32, count=count),
+        'amenities': bitsets,
+        'name_offsets': name_offsets,
+        'names': np.frombuffer(b''.join(names), dtype=np.uint8),
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'grid_keys': keys[order],
+        'grid_order': located[order].astype(np.int32),
+        'popularity': np.fromiter((row[8] or 0.0 for row in rows), dtype=np.float64, count=count),
+        'ratings': np.fromiter((row[9] or 0.0 for row in rows), dtype=np.float64, count=count),
+        'review_counts': np.fromiter((row[10] or 0 for row in rows), dtype=np.int32, count=count),
+    }
+
+    version = time.time_ns()
+    header = {
+        'version': version,
+        'source_event_id': source_event_id,
+        'count': count,
+        'location_table': locations,
+        'amenity_table': vocabulary,
+        'columns': {},
+    }
+    # Offsets depend on the header size, so lay out twice if it grows
+    offset = 0
+    for _ in range(2):
+        body = 16 + len(json.dumps(header).encode('utf-8'))
+        offset = _aligned(body + 64)
+        for name, array in columns.items():
+            header['columns'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(header).encode('utf-8')
+
+    path = os.path.join(directory, f"catalogue-{version}.bin")
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+        for name, array in columns.items():
+            f.seek(header['columns'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(max(offset, f.tell()))
+    os.replace(temporary, path)
+    return path
+
+# First search radius of a nearest-hotels query; it grows 4x per round
+NEAREST_START_KM = 5.0
+
+# Half the Earth's circumference: a circle this big covers every hotel
+MAX_DISTANCE_KM = math.pi * geo.EARTH_RADIUS_KM
+
+def closest(positions, distances, limit):
+    # Top `limit` by distance without sorting everything
+    if len(positions) > limit:
+        nearest = np.argpartition(distances, limit - 1)[:limit] if limit else np.empty(0, dtype=np.intp)
+        positions, distances = positions[nearest], distances[nearest]
+    order = np.argsort(distances, kind='stable')
+    return positions[order], distances[order]
+
+class Snapshot:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:8] != MAGIC:
+            raise ValueError(f"{path} is not a catalogue snapshot")
+        length = struct.unpack('<Q', self._map[8:16])[0]
+        self.header = json.loads(self._map[16:16 + length])
+        self.version = self.header['version']
+        self.count = self.header['count']
+        self.location_table = self.header['location_table']
+        self.amenity_table = self.header['amenity_table']
+        self._amenity_bits = {name.lower(): bit for bit, name in enumerate(self.amenity_table)}
+        self._lowered_locations = [location.lower() for location in self.location_table]
+        # Zero-copy, read-only views over the mapped file
+        self.columns = {
+            name: np.frombuffer(self._map, dtype=spec['dtype'], count=int(np.prod(spec['shape'])),
+                                offset=spec['offset']).reshape(spec['shape'])
+            for name, spec in self.header['columns'].items()
+        }
+
+    def amenity_mask(self, amenities):
+        # None when an amenity is unknown: no hotel can match
+        mask = np.zeros(self.columns['amenities'].shape[1], dtype=np.uint64)
+        for amenity in amenities:
+            bit = self._amenity_bits.get(amenity.strip().lower())
+            if bit is None:
+                return None
+            mask[bit // 64] |= np.uint64(1 << (bit % 64))
+        return mask
+
+    def select(self, min_price=None, max_price=None, amenities=(), location=None, positions=None):
+        # Vectorized scans over the mapped columns, or over the given row
+        # positions only; returns the matching positions
+        if positions is None:
+            positions = np.arange(self.count)
+        keep = np.ones(len(positions), dtype=bool)
+        if min_price is not None or max_price is not None:
+            prices = self.columns['prices'][positions]
+            if min_price is not None:
+                keep &= prices >= min_price
+            if max_price is not None:
+                keep &= prices <= max_price
+        if amenities:
+            mask = self.amenity_mask(amenities)
+            if mask is None:
+                return np.empty(0, dtype=np.intp)
+            bitsets = self.columns['amenities']
+            for word in np.flatnonzero(mask):
+                keep &= (bitsets[positions, word] & mask[word]) == mask[word]
+        if location:
+            # Substring match on the (small) location table, then one isin scan
+            needle = location.lower()
+            codes = [code for code, name in enumerate(self._lowered_locations) if needle in name]
+            keep &= np.isin(self.columns['locations'][positions], codes)
+        return positions[keep]
+
+    def within(self, south, west, north, east):
+        # Positions of hotels inside the box: candidate cells from the grid
+        # index, then an exact check on their coordinates
+        ranges = geo.cell_ranges(south, west, north, east)
+        keys = self.columns['grid_keys']
+        starts = np.searchsorted(keys, [low for low, _ in ranges], side='left')
+        ends = np.searchsorted(keys, [high for _, high in ranges], side='right')
+        order = self.columns['grid_order']
+        slices = [order[start:end] for start, end in zip(starts, ends) if end > start]
+        if not slices:
+            return np.empty(0, dtype=np.intp)
+        positions = np.concatenate(slices).astype(np.intp)
+        latitudes = self.columns['latitudes'][positions]
+        longitudes = self.columns['longitudes'][positions]
+        keep = (latitudes >= south) & (latitudes <= north)
+        if west <= east:
+            keep &= (longitudes >= west) & (longitudes <= east)
+        else:
+            keep &= (longitudes >= west) | (longitudes <= east)
+        return positions[keep]
+
+    def distances(self, positions, lat, lon):
+        return haversine_km(lat, lon, self.columns['latitudes'][positions], self.columns['longitudes'][positions])
+
+    def nearest(self, lat, lon, limit, radius_km=None, **filters):
+        # Hotels within radius_km sorted by distance, or the `limit` nearest
+        # when no radius is given: the search circle grows until it holds
+        # enough matches. Returns (positions, distances, total within range)
+        radius = radius_km or NEAREST_START_KM
+        while True:
+            positions = self.select(positions=self.within(*geo.bbox_around(lat, lon, radius)), **filters)
+            distances = self.distances(positions, lat, lon)
+            inside = distances <= radius
+            if radius_km or inside.sum() >= limit or radius >= MAX_DISTANCE_KM:
+                break
+            radius *= 4
+        positions, distances = positions[inside], distances[inside]
+        return (*closest(positions, distances, limit), len(positions))
+
+    def ranked(self, positions, sort, count):
+        # The first `count` positions in sort order, ties by id: a partition
+        # around the count-th key, then a sort of those rows only
+        column, descending = SORTS[sort]
+        keys = self.columns[column][positions]
+        if descending:
+            keys = -keys
+        if len(positions) > count:
+            if not count:
+                return positions[:0]
+            kth = np.partition(keys, count - 1)[count - 1]
+            below = np.flatnonzero(keys < kth)
+            # positions are ascending, so the first tied ones have the lowest ids
+            tied = np.flatnonzero(keys == kth)[:count - len(below)]
+            chosen = np.concatenate([below, tied])
+            positions, keys = positions[chosen], keys[chosen]
+        return positions[np.lexsort((positions, keys))]
+
+    def rows(self, positions):
+        ids, prices, rooms = self.columns['ids'], self.columns['prices'], self.columns['rooms']
+        locations, bitsets = self.columns['locations'], self.columns['amenities']
+        offsets, names = self.columns['name_offsets'], self.columns['names']
+        latitudes, longitudes = self.columns['latitudes'], self.columns['longitudes']
+        ratings, review_counts = self.columns['ratings'], self.columns['review_counts']
+        result = []
+        for position in positions:
+            words = bitsets[position]
+            lat, lon = float(latitudes[position]), float(longitudes[position])
+            result.append({
+                "id": int(ids[position]),
+                "name": names[offsets[position]:offsets[position + 1]].tobytes().decode('utf-8'),
+                "location": self.location_table[locations[position]],
+                "price": float(prices[position]),
+                "rooms": int(rooms[position]),
+                "latitude": None if math.isnan(lat) else lat,
+                "longitude": None if math.isnan(lon) else lon,
+                "rating": round(float(ratings[position]), 2) if review_counts[position] else None,
+                "review_count": int(review_counts[position]),
+                "amenities": [
+                    name for bit, name in enumerate(self.amenity_table)
+                    if int(words[bit // 64]) >> (bit % 64) & 1
+                ]
+            })
+        return result
+
+class Catalogue:
+
+    def __init__(self, get_connection, directory=DEFAULT_DIR):
+        self.get_connection = get_connection
+        self.directory = directory
+        self.pointer = os.path.join(directory, 'CURRENT')
+        self._snapshot = None
+        self._pointer_key = None
+        self._lock = threading.Lock()
+        self._wanted = None
+        self._wake = threading.Event()
+        self._listener = ChangeListener(get_connection, ('hotel', 'hotel_ranking'), self.on_events)
+        self._started = False
+
+    @classmethod
+    def from_env(cls, get_connection):
+        return cls(get_connection, os.getenv('CATALOGUE_DIR', DEFAULT_DIR))
+
+    def current(self):
+        # One stat per call; the snapshot is re-mapped only after a swap
+        try:
+            stat = os.stat(self.pointer)
+        except FileNotFoundError:
+            self.rebuild()
+            stat = os.stat(self.pointer)
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key != self._pointer_key:
+            with self._lock:
+                if key != self._pointer_key:
+                    self._snapshot = self._load()
+                    self._pointer_key = key
+        return self._snapshot
+
+    def _load(self):
+        with open(self.pointer) as f:
+            path = os.path.join(self.directory, f.read().strip())
+        try:
+            return Snapshot(path)
+        except ValueError:
+            # Written by an older format version: replace it
+            self.rebuild()
+            with open(self.pointer) as f:
+                return Snapshot(os.path.join(self.directory, f.read().strip()))
+
+    def _current_event_id(self):
+        try:
+            with open(self.pointer) as f:
+                path = os.path.join(self.directory, f.read().strip())
+            with open(path, 'rb') as f:
+                prefix = f.read(16)
+                if prefix[:8] != MAGIC:
+                    return None
+                length = struct.unpack('<Q', prefix[8:])[0]
+                return json.loads(f.read(length))['source_event_id']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def rebuild(self, min_event_id=None):
+        # Serialized across workers; a worker that waited for the lock skips
+        # the build when the snapshot already covers the events it saw
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'build.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if min_event_id is not None:
+                    built = self._current_event_id()
+                    if built is not None and built >= min_event_id:
+                        return False
+                # Recorded as covered: only events this worker's listener has
+                # seen committed, all below any id it is still waiting on.
+                # MAX(change_events.id) would also cover a lower id whose
+                # transaction commits after this read.
+                event_id = self._listener.confirmed_id or 0
+                conn = self.get_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("""
+                        SELECT h.id, h.name, h.location, h.price, h.rooms, h.amenities, h.latitude, h.longitude,
+                               r.popularity, r.bayes_rating, r.review_count
+                        FROM hotels h LEFT JOIN hotel_rankings r ON r.hotel_id = h.id
+                        WHERE h.status = 'active' ORDER BY h.id
+                    """)
+                    rows = cursor.fetchall()
+                    cursor.close()
+                    conn.commit()
+                finally:
+                    conn.close()
+                path = write_snapshot(self.directory, rows, event_id)
+                temporary = self.pointer + '.tmp'
+                with open(temporary, 'w') as f:
+                    f.write(os.path.basename(path))
+                os.replace(temporary, self.pointer)
+                self._prune(path)
+                return True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _prune(self, current):
+        versions = sorted(glob.glob(os.path.join(self.directory, 'catalogue-*.bin')))
+        for path in [path for path in versions if path != current][:-KEEP_VERSIONS or None]:
+            try:
+                # Mapped pages stay valid for readers until they re-map
+                os.remove(path)
+            except OSError:
+                pass
+
+    def request_rebuild(self, event_id=0):
+        # 0 rebuilds unconditionally (a local write); event ids coalesce, so
+        # a burst of changes costs one build
+        with self._lock:
+            self._wanted = max(self._wanted or 0, event_id)
+        self.start()
+        self._wake.set()
+
+    def on_events(self, events):
+        self.request_rebuild(max(event['id'] for event in events))
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._listener.start()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                wanted, self._wanted = self._wanted, None
+            try:
+                self.rebuild(min_event_id=wanted or None)
+            except Exception:
+                # Keep serving the last snapshot; the next change retries
+                pass
@@ -0,0 +1,186 @@
+import argparse
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from common.events import emit
+
+BATCH_SIZE = 1000
+CATALOGUE_COLUMNS = ('name', 'location', 'rooms', 'price', 'amenities', 'description', 'image', 'status')
+HOTEL_STATUSES = ('active', 'inactive')
+
+def read_records(stream, file_format):
+    # Yields (line, record-or-None, error) without loading the feed in memory
+    text = stream if isinstance(stream, io.TextIOBase) else io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if file_format == 'csv':
+        for line, record in enumerate(csv.DictReader(text), start=2):
+            yield line, record, None
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            yield line, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "Expected a JSON object"
+            continue
+        yield line, record, None
+
+def normalize(record):
+    errors = []
+    external_ref = str(record.get('external_ref') or '').strip()
+    if not external_ref:
+        errors.append("external_ref is required")
+
+    hotel = {}
+    for column in ('name', 'location'):
+        hotel[column] = str(record.get(column) or '').strip()
+        if not hotel[column]:
+            errors.append(f"{column} is required")
+
+    try:
+        hotel['rooms'] = int(record.get('rooms'))
+        if hotel['rooms'] < 0:
+            errors.append("rooms must not be negative")
+    except (TypeError, ValueError):
+        errors.append("rooms must be an integer")
+
+    try:
+        hotel['price'] = Decimal(str(record.get('price'))).quantize(Decimal('0.01'))
+        if hotel['price'] < 0:
+            errors.append("price must not be negative")
+    except (InvalidOperation, ValueError):
+        errors.append("price must be a number")
+
+    amenities = record.get('amenities') or ''
+    if isinstance(amenities, list):
+        amenities = ','.join(str(a).strip() for a in amenities)
+    hotel['amenities'] = amenities
+    hotel['description'] = record.get('description') or ''
+    hotel['image'] = record.get('image') or ''
+    hotel['status'] = record.get('status') or 'active'
+    if hotel['status'] not in HOTEL_STATUSES:
+        errors.append(f"status must be one of {', '.join(HOTEL_STATUSES)}")
+
+    return external_ref, hotel, errors
+
+def differs(current, hotel):
+    for column in CATALOGUE_COLUMNS:
+        value = current[column]
+        if column == 'price':
+            value = Decimal(value).quantize(Decimal('0.01'))
+        elif value is None:
+            value = ''
+        if value != hotel[column]:
+            return True
+    return False
+
+def apply_batch(conn, batch, dry_run):
+    # batch: list of (line, external_ref, hotel). One SELECT to diff, one
+    # multi-row upsert for the rows that really changed, one commit.
+    refs = [external_ref for _, external_ref, _ in batch]
+    placeholders = ', '.join(['%s'] * len(refs))
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(
+        f"SELECT id, external_ref, {', '.join(CATALOGUE_COLUMNS)} FROM hotels WHERE external_ref IN ({placeholders})",
+        refs
+    )
+    current = {row['external_ref']: row for row in cursor.fetchall()}
+
+    results, changed = [], {}
+    for line, external_ref, hotel in batch:
+        existing = current.get(external_ref)
+        if existing is None:
+            outcome = 'inserted'
+        elif differs(existing, hotel):
+            outcome = 'updated'
+        else:
+            outcome = 'unchanged'
+        if outcome != 'unchanged':
+            # A ref repeated within the batch keeps its last version
+            changed[external_ref] = hotel
+        results.append({'line': line, 'external_ref': external_ref, 'status': outcome})
+
+    if changed and not dry_run:
+        columns = ('external_ref',) + CATALOGUE_COLUMNS
+        row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        query = f"""
+        INSERT INTO hotels ({', '.join(columns)})
+        VALUES {', '.join([row_placeholder] * len(changed))}
+        ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in CATALOGUE_COLUMNS)}
+        """
+        params = [value for ref, hotel in changed.items() for value in (ref, *(hotel[c] for c in CATALOGUE_COLUMNS))]
+        cursor.execute(query, params)
+
+        changed_refs = list(changed)
+        placeholders = ', '.join(['%s'] * len(changed_refs))
+        cursor.execute(f"SELECT id, external_ref FROM hotels WHERE external_ref IN ({placeholders})", changed_refs)
+        ids = {row['external_ref']: row['id'] for row in cursor.fetchall()}
+        emit(cursor, 'hotel', [ids[ref] for ref in changed_refs], 'upsert')
+        conn.commit()
+
+        for result in results:
+            result['id'] = ids.get(result['external_ref'], current.get(result['external_ref'], {}).get('id'))
+    else:
+        for result in results:
+            result['id'] = current.get(result['external_ref'], {}).get('id')
+
+    cursor.close()
+    return results
+
+def import_catalogue(conn, stream, file_format='ndjson', dry_run=False, batch_size=BATCH_SIZE):
+    summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0}
+    results = []
+    batch = []
+
+    def flush():
+        for result in apply_batch(conn, batch, dry_run):
+            summary[result['status']] += 1
+            results.append(result)
+        batch.clear()
+
+    for line, record, error in read_records(stream, file_format):
+        if error:
+            errors = [error]
+            external_ref = None
+        else:
+            external_ref, hotel, errors = normalize(record)
+        if errors:
+            summary['invalid'] += 1
+            results.append({'line': line, 'external_ref': external_ref or None, 'status': 'invalid', 'errors': errors})
+            continue
+        batch.append((line, external_ref, hotel))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    results.sort(key=lambda result: result['line'])
+    return {'dry_run': dry_run, 'summary': summary, 'results': results}
+
+def main():
+    from app import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Bulk import/upsert hotels from an NDJSON or CSV feed")
+    parser.add_argument('feed')
+    parser.add_argument('--format', choices=['ndjson', 'csv'])
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    file_format = args.format or ('csv' if args.feed.endswith('.csv') else 'ndjson')
+    conn = get_db_connection()
+    with open(args.feed, newline='', encoding='utf-8') as feed:
+        report = import_catalogue(conn, feed, file_format, args.dry_run)
+    conn.close()
+
+    for result in report['results']:
+        if result['status'] == 'invalid':
+            print(f"line {result['line']}: {'; '.join(result['errors'])}")
+    print(json.dumps(report['summary']))
+
+if __name__ == '__main__':
+    main()
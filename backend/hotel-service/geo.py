@@ -0,0 +1,85 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Grid cell size of the catalogue's spatial index, about 11 km of latitude
+CELL_DEGREES = 0.1
+
+LAT_CELLS = int(round(180 / CELL_DEGREES))
+LON_CELLS = int(round(360 / CELL_DEGREES))
+
+class GeoError(ValueError):
+    pass
+
+def _number(value, name, low, high):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise GeoError(f"{name} must be a number")
+    if not low <= number <= high:
+        raise GeoError(f"{name} must be between {low} and {high}")
+    return number
+
+def latitude(value, name='lat'):
+    return _number(value, name, -90, 90)
+
+def longitude(value, name='lon'):
+    return _number(value, name, -180, 180)
+
+def parse_coordinates(data):
+    # None when the payload does not mention coordinates, (None, None) when
+    # it clears them, else (latitude, longitude)
+    if 'latitude' not in data and 'longitude' not in data:
+        return None
+    lat, lon = data.get('latitude'), data.get('longitude')
+    if lat is None and lon is None:
+        return None, None
+    if lat is None or lon is None:
+        raise GeoError("latitude and longitude must be given together")
+    return latitude(lat, 'latitude'), longitude(lon, 'longitude')
+
+def parse_bbox(value):
+    # south,west,north,east; west > east crosses the antimeridian
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise GeoError("bbox must be south,west,north,east")
+    south, north = latitude(parts[0], 'south'), latitude(parts[2], 'north')
+    west, east = longitude(parts[1], 'west'), longitude(parts[3], 'east')
+    if south > north:
+        raise GeoError("bbox south must not be above north")
+    return south, west, north, east
+
+def bbox_around(lat, lon, radius_km):
+    # Smallest lat/lon box containing the circle; whole longitude band near
+    # the poles
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(-90.0, lat - delta_lat), min(90.0, lat + delta_lat)
+    if south <= -90 or north >= 90 or delta_lat >= 90:
+        return south, -180.0, north, 180.0
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return south, -180.0, north, 180.0
+    delta_lon = math.degrees(math.asin(ratio))
+    west, east = lon - delta_lon, lon + delta_lon
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+def lat_cell(lat):
+    return min(int(math.floor((lat + 90) / CELL_DEGREES)), LAT_CELLS - 1)
+
+def lon_cell(lon):
+    return min(int(math.floor((lon + 180) / CELL_DEGREES)), LON_CELLS - 1)
+
+def cell_ranges(south, west, north, east):
+    # Key ranges [low, high] of the grid cells covering the box: one per row
+    # of latitude cells, two when the box crosses the antimeridian
+    spans = [(lon_cell(west), lon_cell(east))] if west <= east else \
+        [(lon_cell(west), LON_CELLS - 1), (0, lon_cell(east))]
+    return [
+        (row * LON_CELLS + low, row * LON_CELLS + high)
+        for row in range(lat_cell(south), lat_cell(north) + 1)
+        for low, high in spans
+    ]
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from common.events import emit
+
+BATCH_SIZE = 5000
+MAX_NIGHTS = 731
+WEEKDAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+# Named night sets; a "weekend" stay is Friday and Saturday night
+WEEKDAY_SETS = {
+    'all': (0, 1, 2, 3, 4, 5, 6),
+    'weekends': (4, 5),
+    'weekdays': (0, 1, 2, 3, 6),
+}
+
+class InventoryError(ValueError):
+    pass
+
+def parse_weekdays(value):
+    if value is None:
+        return WEEKDAY_SETS['all']
+    if isinstance(value, str):
+        if value not in WEEKDAY_SETS:
+            raise InventoryError(f"Unknown weekday set: {value}")
+        return WEEKDAY_SETS[value]
+    weekdays = []
+    for day in value:
+        if isinstance(day, int) and 0 <= day <= 6:
+            weekdays.append(day)
+        elif isinstance(day, str) and day.lower()[:3] in WEEKDAY_NAMES:
+            weekdays.append(WEEKDAY_NAMES.index(day.lower()[:3]))
+        else:
+            raise InventoryError(f"Unknown weekday: {day}")
+    return tuple(sorted(set(weekdays)))
+
+def expand_nights(start, end, weekdays):
+    # Inclusive date range filtered to the requested nights of the week
+    count = (end - start).days + 1
+    if count > MAX_NIGHTS:
+        raise InventoryError(f"A range may cover at most {MAX_NIGHTS} nights")
+    nights = (start + timedelta(days=offset) for offset in range(count))
+    return [night for night in nights if night.weekday() in weekdays]
+
+def normalize_update(update):
+    try:
+        hotel_ids = [int(h) for h in update.get('hotel_ids') or [update['hotel_id']]]
+        start = datetime.strptime(update['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(update['end'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError) as e:
+        raise InventoryError(f"Invalid inventory update: {e}")
+    if end < start:
+        raise InventoryError("end must not be before start")
+
+    values = {}
+    if update.get('rooms') is not None:
+        try:
+            values['rooms'] = int(update['rooms'])
+        except (TypeError, ValueError):
+            raise InventoryError("rooms must be an integer")
+        if values['rooms'] < 0:
+            raise InventoryError("rooms must not be negative")
+    if update.get('price') is not None:
+        try:
+            values['price'] = Decimal(str(update['price'])).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise InventoryError("price must be a number")
+        if not values['price'].is_finite():
+            raise InventoryError("price must be a number")
+    if update.get('closed') is not None:
+        values['closed'] = 1 if update['closed'] else 0
+    if not values and not update.get('reset'):
+        raise InventoryError("Provide rooms, price, closed or reset")
+
+    return {
+        'hotel_ids': hotel_ids,
+        'start': start,
+        'end': end,
+        'weekdays': parse_weekdays(update.get('weekdays')),
+        'values': values,
+        'reset': bool(update.get('reset'))
+    }
+
+def apply_update(cursor, update):
+    nights = expand_nights(update['start'], update['end'], update['weekdays'])
+    hotel_ids = update['hotel_ids']
+    hotel_placeholders = ', '.join(['%s'] * len(hotel_ids))
+
+    if update['reset']:
+        # Back to the hotel defaults for the selected nights
+        weekday_placeholders = ', '.join(['%s'] * len(update['weekdays']))
+        cursor.execute(f"""
+            DELETE FROM hotel_inventory
+            WHERE hotel_id IN ({hotel_placeholders}) AND night BETWEEN %s AND %s
+            AND WEEKDAY(night) IN ({weekday_placeholders})
+        """, (*hotel_ids, update['start'], update['end'], *update['weekdays']))
+        return cursor.rowcount
+
+    # Only the supplied columns are written; new rows leave the rest NULL/open
+    columns = list(update['values'])
+    row_values = [update['values'][c] for c in columns]
+    row_placeholder = '(' + ', '.join(['%s'] * (len(columns) + 2)) + ')'
+    rows = [(hotel_id, night) for hotel_id in hotel_ids for night in nights]
+
+    written = 0
+    for offset in range(0, len(rows), BATCH_SIZE):
+        batch = rows[offset:offset + BATCH_SIZE]
+        cursor.execute(f"""
+            INSERT INTO hotel_inventory (hotel_id, night, {', '.join(columns)})
+            VALUES {', '.join([row_placeholder] * len(batch))}
+            ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in columns)}
+        """, [value for hotel_id, night in batch for value in (hotel_id, night, *row_values)])
+        written += len(batch)
+    return written
+
+def apply_updates(conn, updates):
+    updates = [normalize_update(update) for update in updates]
+    cursor = conn.cursor()
+    results = []
+    for update in updates:
+        nights = apply_update(cursor, update)
+        emit(cursor, 'hotel_inventory', update['hotel_ids'], 'update', {
+            'start': update['start'], 'end': update['end']
+        })
+        # One short transaction per range keeps lock time bounded
+        conn.commit()
+        results.append({
+            'hotel_ids': update['hotel_ids'],
+            'start': update['start'],
+            'end': update['end'],
+            'nights_written': nights
+        })
+    cursor.close()
+    return results
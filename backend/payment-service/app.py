@@ -1,102 +1,106 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import mysql.connector
-import os
-import random
-import string
-from datetime import datetime
+from flask import Blueprint, request, jsonify
+from common.admission import Admission
+from common.deadline import Deadlines
+from common.jobs import JobQueue
+from common.service import create_service, load_config, mysql_pool, run
+from common.responses import FieldSelectionError, select_fields
+from tasks import (
+    PAYMENT_TABLES, PaymentRefused, build_invoice, card_last_four, charge, generate_transaction_id, payment_stats,
+    refund, register_tasks
+)
 
-app = Flask(__name__)
-CORS(app)
+config = load_config('payment-service', port=85)
+bp = Blueprint('payments', __name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'mysql-db'),
-    'user': os.getenv('DB_USER', 'hotel_user'),
-    'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
-    'database': os.getenv('DB_NAME', 'hotel_booking'),
-    'port': int(os.getenv('DB_PORT', 3306))
-}
+PAYMENT_FIELDS = {name: name for name in (
+    'id', 'transaction_id', 'booking_id', 'amount', 'currency', 'payment_method',
+    'card_last_four', 'payment_status', 'gateway_response', 'refund_for',
+    'created_at', 'updated_at'
+)}
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/payments', ('POST',), 'critical', None),
+    ('/api/payments', ('GET',), 'normal', None),
+    ('/api/payments/stats', None, 'background', 2),
+    ('/api/payments/reconcile', ('POST',), 'background', 1),
+    ('/api/payments/discrepancies', None, 'background', 2),
+    ('/api/invoices', None, 'normal', None),
+    ('/api/jobs', None, 'normal', None),
+)
+
+# Request budgets in seconds where the REQUEST_BUDGET_MS default does not fit
+DEADLINE_ROUTES = (
+    ('/api/payments', ('POST',), 10),
+    ('/api/payments/stats', None, 15),
+)
+
+deadlines = Deadlines.from_env(DEADLINE_ROUTES, mysql_pool.connect)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='normal')
 
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    # Statements are bounded by the request deadline; their latency drives
+    # the adaptive concurrency limit
+    return admission.connect(deadlines.connect, **config.db)
+
+def get_replica_connection():
+    # Read-only scans go to the replica when DB_REPLICA_HOST is set
+    if config.replica_db is None:
+        return get_db_connection()
+    return admission.connect(deadlines.connect, **config.replica_db)
+
+# Slow side work can run on the job workers (worker.py) instead of inline
+jobs = JobQueue.from_env(get_db_connection)
+register_tasks(jobs, get_db_connection, get_replica_connection)
 
-def generate_transaction_id():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+def wants_async():
+    return request.args.get('async', 'false').lower() == 'true'
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "service": "payment-service"})
+def accepted(job_id):
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}), 202
 
-@app.route('/api/payments', methods=['POST'])
+@bp.route('/api/payments', methods=['POST'])
 def process_payment():
     try:
         data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Generate transaction ID
-        transaction_id = generate_transaction_id()
         
-        # Simulate payment processing (always successful for demo)
-        payment_status = 'completed'
-        
-        # Store payment record
-        query = """
-        INSERT INTO payments (transaction_id, booking_id, amount, currency, 
-                            payment_method, card_last_four, payment_status, gateway_response)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (
-            transaction_id,
-            data.get('booking_id'),
-            data['amount'],
-            data.get('currency', 'USD'),
-            data['payment_method'],
-            data.get('card_number', '')[-4:] if data.get('card_number') else '',
-            payment_status,
-            '{"status": "success", "gateway": "fake-gateway"}'
-        )
+        if wants_async():
+            payload = {k: v for k, v in data.items() if k != 'card_number'}
+            payload['card_last_four'] = card_last_four(data)
+            # Fixed now so every attempt of the job is the same charge
+            payload['transaction_id'] = generate_transaction_id()
+            return accepted(jobs.enqueue('payments.charge', payload))
         
-        cursor.execute(query, params)
-        conn.commit()
-        payment_id = cursor.lastrowid
-        
-        # Update booking status if booking_id provided
-        if data.get('booking_id'):
-            cursor.execute("UPDATE bookings SET payment_status = %s WHERE id = %s", 
-                          (payment_status, data['booking_id']))
-            conn.commit()
-        
-        cursor.close()
+        conn = get_db_connection()
+        result = charge(conn, data)
         conn.close()
         
-        return jsonify({
-            "payment_id": payment_id,
-            "transaction_id": transaction_id,
-            "status": payment_status,
-            "amount": data['amount'],
-            "currency": data.get('currency', 'USD'),
-            "message": "Payment processed successfully"
-        }), 201
+        return jsonify(result), 201
+    except PaymentRefused as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/payments/<int:payment_id>', methods=['GET'])
+@bp.route('/api/payments/<int:payment_id>', methods=['GET'])
 def get_payment(payment_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT p.*, b.booking_ref, h.name as hotel_name
-        FROM payments p
-        LEFT JOIN bookings b ON p.booking_id = b.id
-        LEFT JOIN hotels h ON b.hotel_id = h.id
-        WHERE p.id = %s
-        """
-        cursor.execute(query, (payment_id,))
-        payment = cursor.fetchone()
+        payment = None
+        for table in PAYMENT_TABLES:
+            query = f"""
+            SELECT p.*, COALESCE(b.booking_ref, ba.booking_ref) as booking_ref, h.name as hotel_name
+            FROM {table} p
+            LEFT JOIN bookings b ON p.booking_id = b.id
+            LEFT JOIN bookings_archive ba ON p.booking_id = ba.id
+            LEFT JOIN hotels h ON h.id = COALESCE(b.hotel_id, ba.hotel_id)
+            WHERE p.id = %s
+            """
+            cursor.execute(query, (payment_id,))
+            payment = cursor.fetchone()
+            if payment:
+                break
         
         cursor.close()
         conn.close()
@@ -108,167 +112,156 @@ def get_payment(payment_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/payments/booking/<int:booking_id>', methods=['GET'])
+@bp.route('/api/payments/booking/<int:booking_id>', methods=['GET'])
 def get_booking_payments(booking_id):
     try:
+        columns = select_fields(PAYMENT_FIELDS, required=('created_at',))
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT * FROM payments 
-        WHERE booking_id = %s
+        query = f"""
+        SELECT {columns} FROM payments WHERE booking_id = %s
+        UNION ALL
+        SELECT {columns} FROM payments_archive WHERE booking_id = %s
         ORDER BY created_at DESC
         """
-        cursor.execute(query, (booking_id,))
+        cursor.execute(query, (booking_id, booking_id))
         payments = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
         return jsonify(payments)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/payments/<int:payment_id>/refund', methods=['POST'])
+@bp.route('/api/payments/<int:payment_id>/refund', methods=['POST'])
 def refund_payment(payment_id):
     try:
-        data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        data = request.json or {}
         
-        # Get original payment
-        cursor.execute("SELECT * FROM payments WHERE id = %s", (payment_id,))
-        payment = cursor.fetchone()
+        if wants_async():
+            return accepted(jobs.enqueue('payments.refund', {
+                "payment_id": payment_id, "amount": data.get('amount'), "transaction_id": generate_transaction_id()
+            }))
         
-        if not payment:
-            return jsonify({"error": "Payment not found"}), 404
-        
-        # Create refund record
-        refund_amount = data.get('amount', payment[2])  # payment[2] is amount
-        transaction_id = generate_transaction_id()
-        
-        query = """
-        INSERT INTO payments (transaction_id, booking_id, amount, currency, 
-                            payment_method, payment_status, gateway_response, refund_for)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (
-            transaction_id,
-            payment[1],  # booking_id
-            -refund_amount,  # negative amount for refund
-            payment[3],  # currency
-            payment[4],  # payment_method
-            'completed',
-            '{"status": "refund_success", "gateway": "fake-gateway"}',
-            payment_id
-        )
-        
-        cursor.execute(query, params)
-        conn.commit()
-        refund_id = cursor.lastrowid
-        
-        cursor.close()
+        conn = get_db_connection()
+        result = refund(conn, payment_id, data.get('amount'))
         conn.close()
         
-        return jsonify({
-            "refund_id": refund_id,
-            "transaction_id": transaction_id,
-            "amount": refund_amount,
-            "status": "completed",
-            "message": "Refund processed successfully"
-        })
+        if not result:
+            return jsonify({"error": "Payment not found"}), 404
+        
+        return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/invoices/<int:booking_id>', methods=['GET'])
+@bp.route('/api/invoices/<int:booking_id>', methods=['GET'])
 def generate_invoice(booking_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        if wants_async():
+            return accepted(jobs.enqueue('payments.invoice', {"booking_id": booking_id}))
         
-        # Get booking details
-        query = """
-        SELECT b.*, h.name as hotel_name, h.location as hotel_location,
-               u.username, u.email
-        FROM bookings b
-        JOIN hotels h ON b.hotel_id = h.id
-        JOIN users u ON b.user_id = u.id
-        WHERE b.id = %s
-        """
-        cursor.execute(query, (booking_id,))
-        booking = cursor.fetchone()
+        conn = get_db_connection()
+        invoice = build_invoice(conn, booking_id)
+        conn.close()
         
-        if not booking:
+        if not invoice:
             return jsonify({"error": "Booking not found"}), 404
         
-        # Get payment details
-        cursor.execute("SELECT * FROM payments WHERE booking_id = %s AND amount > 0", (booking_id,))
-        payment = cursor.fetchone()
+        return jsonify(invoice)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/payments/stats', methods=['GET'])
+def get_payment_stats():
+    try:
+        if wants_async():
+            return accepted(jobs.enqueue('payments.stats'))
         
-        cursor.close()
+        conn = get_db_connection()
+        stats = payment_stats(conn)
         conn.close()
         
-        # Calculate invoice details
-        nights = (datetime.strptime(booking['check_out'], '%Y-%m-%d') - 
-                 datetime.strptime(booking['check_in'], '%Y-%m-%d')).days
-        subtotal = booking['total_amount']
-        tax_rate = 0.1  # 10% tax
-        tax_amount = subtotal * tax_rate
-        total = subtotal + tax_amount
-        
-        invoice = {
-            "invoice_id": f"INV-{booking['id']}-{datetime.now().strftime('%Y%m%d')}",
-            "booking_ref": booking['booking_ref'],
-            "hotel_name": booking['hotel_name'],
-            "hotel_location": booking['hotel_location'],
-            "guest_name": booking['username'],
-            "guest_email": booking['email'],
-            "check_in": booking['check_in'],
-            "check_out": booking['check_out'],
-            "nights": nights,
-            "room_type": booking['room_type'],
-            "guests": booking['guests'],
-            "subtotal": subtotal,
-            "tax_rate": tax_rate,
-            "tax_amount": tax_amount,
-            "total": total,
-            "payment_status": payment['payment_status'] if payment else 'pending',
-            "payment_method": payment['payment_method'] if payment else None,
-            "transaction_id": payment['transaction_id'] if payment else None,
-            "invoice_date": datetime.now().strftime('%Y-%m-%d'),
-            "due_date": booking['check_in']
-        }
-        
-        return jsonify(invoice)
+        return jsonify(stats)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/payments/stats', methods=['GET'])
-def get_payment_stats():
+@bp.route('/api/payments/discrepancies', methods=['GET'])
+def get_discrepancies():
     try:
+        # Open findings of the reconciliation job, newest first;
+        # ?resolved=true lists the resolved and repaired ones instead
+        resolved = request.args.get('resolved', 'false').lower() == 'true'
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        conditions = ["resolved_at IS NULL" if not resolved else "resolved_at IS NOT NULL"]
+        params = []
+        if request.args.get('kind'):
+            conditions.append("kind = %s")
+            params.append(request.args['kind'])
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Get payment statistics
-        queries = {
-            'total_payments': "SELECT COUNT(*) as count, SUM(amount) as total FROM payments WHERE amount > 0",
-            'successful_payments': "SELECT COUNT(*) as count FROM payments WHERE payment_status = 'completed' AND amount > 0",
-            'failed_payments': "SELECT COUNT(*) as count FROM payments WHERE payment_status = 'failed'",
-            'refunds': "SELECT COUNT(*) as count, SUM(ABS(amount)) as total FROM payments WHERE amount < 0"
-        }
-        
-        stats = {}
-        for key, query in queries.items():
-            cursor.execute(query)
-            result = cursor.fetchone()
-            stats[key] = result
+        cursor.execute(f"""
+        SELECT * FROM payment_discrepancies
+        WHERE {' AND '.join(conditions)}
+        ORDER BY last_seen_at DESC
+        LIMIT %s
+        """, (*params, limit))
+        discrepancies = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
-        return jsonify(stats)
+        return jsonify(discrepancies)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/payments/reconcile', methods=['POST'])
+def start_reconciliation():
+    try:
+        # Runs on the job workers; resumes from the last checkpoint
+        data = request.get_json(silent=True) or {}
+        payload = {key: data[key] for key in ('repair', 'chunk_size', 'max_seconds') if key in data}
+        return accepted(jobs.enqueue('maintenance.reconcile_payments', payload))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = jobs.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/jobs/stats', methods=['GET'])
+def get_job_stats():
+    try:
+        return jsonify(jobs.counts())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    try:
+        if not jobs.retry_dead(job_id):
+            return jsonify({"error": "Job not found in dead letters"}), 404
+        return jsonify({"job_id": job_id, "status": "queued"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=85, debug=True)
\ No newline at end of file
+    run(app, config)
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import time
+
+from common import trips
+from common.events import emit_each
+
+# Booking lifecycle sweeper. Moves bookings whose state is settled out of the
+# live confirmed/pending set: stays that have checked out become completed,
+# pending bookings nobody finished and confirmed bookings never paid for are
+# cancelled. Each transition runs in small batches, one short transaction
+# per batch: lock up to batch_size rows from an index range with SKIP
+# LOCKED, update them by primary key, emit a 'booking' change event per row,
+# commit. charge() locks the booking before it writes the payment and
+# commits both together, so a booking being paid is skipped here, and a
+# charge for one cancelled here first is refused; no booking ends up both
+# paid and cancelled. Runs every few minutes as the
+# maintenance.booking_lifecycle job; `python lifecycle.py --dry-run` reports
+# what a run would change.
+
+PENDING_TTL_MINUTES = int(os.getenv('BOOKING_PENDING_TTL_MINUTES', 60))
+UNPAID_TTL_HOURS = int(os.getenv('BOOKING_UNPAID_TTL_HOURS', 48))
+
+BATCH_SIZE = 500
+MAX_BATCHES = 100
+
+# Pause between batches so replicas and other writers keep up
+BATCH_PAUSE = 0.05
+
+# (name, new status, condition, index order). The conditions lead with the
+# (status, check_out) and (status, payment_status, created_at) indexes.
+TRANSITIONS = (
+    ('complete', 'completed',
+     "status = 'confirmed' AND check_out <= CURDATE()",
+     'check_out'),
+    ('expire_pending', 'cancelled',
+     "status = 'pending' AND created_at < NOW() - INTERVAL {pending_ttl} MINUTE"
+     " AND NOT EXISTS (SELECT 1 FROM room_holds h WHERE h.booking_id = bookings.id AND h.expires_at > NOW(3))",
+     'check_out'),
+    ('expire_unpaid', 'cancelled',
+     "status = 'confirmed' AND payment_status IN ('pending', 'failed')"
+     " AND created_at < NOW() - INTERVAL {unpaid_ttl} HOUR AND check_in > CURDATE()",
+     'payment_status, created_at'),
+)
+
+def conditions(pending_ttl=PENDING_TTL_MINUTES, unpaid_ttl=UNPAID_TTL_HOURS):
+    return [
+        (name, status, condition.format(pending_ttl=int(pending_ttl), unpaid_ttl=int(unpaid_ttl)), order)
+        for name, status, condition, order in TRANSITIONS
+    ]
+
+def sweep_batch(conn, name, status, condition, order, batch_size):
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id, hotel_id, user_id, check_in, check_out FROM bookings
+        WHERE {condition}
+        ORDER BY {order} LIMIT %s FOR UPDATE SKIP LOCKED
+    """, (batch_size,))
+    rows = cursor.fetchall()
+    if not rows:
+        conn.commit()
+        cursor.close()
+        return []
+
+    ids = [row[0] for row in rows]
+    placeholders = ', '.join(['%s'] * len(ids))
+    # check_out bounds let MySQL prune partitions
+    cursor.execute(f"""
+        UPDATE bookings SET status = %s
+        WHERE id IN ({placeholders}) AND check_out BETWEEN %s AND %s
+    """, (status, *ids, min(row[4] for row in rows), max(row[4] for row in rows)))
+    emit_each(cursor, 'booking', name, {
+        row[0]: {'status': status, 'hotel_id': row[1], 'check_in': row[3], 'check_out': row[4]}
+        for row in rows
+    })
+    conn.commit()
+    cursor.close()
+    return rows
+
+def sweep(conn, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES, pause=BATCH_PAUSE, **ttls):
+    # Bounded per run: what is left over is picked up by the next run
+    report = {}
+    for name, status, condition, order in conditions(**ttls):
+        changed, batches, users = 0, 0, set()
+        while batches < max_batches:
+            rows = sweep_batch(conn, name, status, condition, order, batch_size)
+            batches += 1
+            changed += len(rows)
+            if status == 'cancelled':
+                users.update(row[2] for row in rows)
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
+        # Completing a stay leaves trip summaries as they are; cancelling
+        # moves it out of the counts
+        for user_id in users:
+            trips.refresh_quietly(conn, user_id=user_id)
+        report[name] = {"status": status, "changed": changed, "batches": batches, "complete": batches < max_batches}
+    return report
+
+def dry_run(conn, sample=10, **ttls):
+    cursor = conn.cursor()
+    report = {}
+    for name, status, condition, order in conditions(**ttls):
+        cursor.execute(f"SELECT COUNT(*) FROM bookings WHERE {condition}")
+        count = cursor.fetchone()[0]
+        cursor.execute(f"SELECT id FROM bookings WHERE {condition} ORDER BY {order} LIMIT %s", (sample,))
+        report[name] = {"status": status, "would_change": count, "sample_ids": [row[0] for row in cursor.fetchall()]}
+    cursor.close()
+    conn.commit()
+    return report
+
+def main():
+    from app import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Complete and expire bookings in bounded batches")
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-batches', type=int, default=MAX_BATCHES)
+    parser.add_argument('--pending-ttl', type=int, default=PENDING_TTL_MINUTES, help="minutes")
+    parser.add_argument('--unpaid-ttl', type=int, default=UNPAID_TTL_HOURS, help="hours")
+    args = parser.parse_args()
+
+    ttls = {'pending_ttl': args.pending_ttl, 'unpaid_ttl': args.unpaid_ttl}
+    conn = get_db_connection()
+    if args.dry_run:
+        report = dry_run(conn, **ttls)
+    else:
+        report = sweep(conn, args.batch_size, args.max_batches, **ttls)
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import time
+from decimal import Decimal
+
+from common import trips
+from common.events import emit_each
+
+# Payment/booking reconciliation. Refunds never touch the booking and
+# bookings are edited and cancelled after they are paid, so the two tables
+# can drift. This job walks bookings in primary key order, CHUNK_SIZE ids at
+# a time, sums each booking's completed payments minus its refunds (rows
+# with refund_for, counted against the booking of the payment they refund)
+# from payments and payments_archive, and compares the net with the
+# booking's total and status. Findings go to payment_discrepancies, one open row per (booking,
+# kind), resolved once a later pass finds the booking consistent again.
+#
+# Reads go to the replica when DB_REPLICA_HOST is set; report rows, the
+# checkpoint and repairs go to the primary. Bookings or payments touched
+# within SETTLE_MINUTES are left for the next pass, so an in-flight charge
+# (or replica lag) is not reported. Progress is checkpointed per chunk in
+# reconciliation_checkpoints, each run stops after max_seconds and the next
+# resumes where it left off. Between chunks the job sleeps so it is busy at
+# most DUTY_CYCLE of the time. With repair on, the one safe fix is applied:
+# a completed charge whose booking was never marked paid is marked paid,
+# re-checked against the primary in the same statement.
+
+CHUNK_SIZE = 1000
+MAX_SECONDS = 600
+DUTY_CYCLE = 0.2
+MIN_PAUSE = 0.05
+SETTLE_MINUTES = int(os.getenv('RECONCILE_SETTLE_MINUTES', 10))
+AUTO_REPAIR = os.getenv('RECONCILE_AUTO_REPAIR', 'false').lower() == 'true'
+
+CHECKPOINT = 'payments'
+LOCK_NAME = 'payment_reconciliation'
+
+PAYMENT_TABLES = ('payments', 'payments_archive')
+
+# Discrepancies the job may fix by itself
+REPAIRABLE = ('payment_not_recorded',)
+
+ZERO = Decimal('0')
+
+def classify(status, payment_status, total_amount, charged, refunded):
+    net = charged - refunded
+    if status == 'cancelled':
+        return ['cancelled_not_refunded'] if net > 0 else []
+    kinds = []
+    if charged > 0 and payment_status != 'completed':
+        kinds.append('payment_not_recorded')
+    if payment_status == 'completed' and charged == 0:
+        kinds.append('paid_without_payment')
+    if charged > 0:
+        if refunded > 0 and net <= 0:
+            kinds.append('refunded_not_cancelled')
+        elif net < total_amount:
+            kinds.append('underpaid')
+        elif net > total_amount:
+            kinds.append('overpaid')
+    return kinds
+
+def get_checkpoint(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT last_id FROM reconciliation_checkpoints WHERE name = %s", (CHECKPOINT,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.commit()
+    return row[0] if row else 0
+
+def fetch_chunk(conn, after_id, chunk_size, settle_minutes):
+    # A short primary-key range read, plus index range reads on
+    # payments.booking_id for the same ids; refunds are reached through
+    # refund_for from the charge they refund, in either table
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT id, hotel_id, user_id, check_in, check_out, total_amount, status, payment_status,
+               updated_at >= NOW() - INTERVAL %s MINUTE as recent
+        FROM bookings WHERE id > %s ORDER BY id LIMIT %s
+    """, (settle_minutes, after_id, chunk_size))
+    bookings = cursor.fetchall()
+
+    totals = {}
+    if bookings:
+        low, high = bookings[0]['id'], bookings[-1]['id']
+        reads = [f"""
+            SELECT booking_id, SUM(amount) as charged, 0 as refunded,
+                   MAX(created_at) >= NOW() - INTERVAL %s MINUTE as recent
+            FROM {table}
+            WHERE booking_id BETWEEN %s AND %s AND payment_status = 'completed'
+            AND refund_for IS NULL AND amount > 0
+            GROUP BY booking_id
+        """ for table in PAYMENT_TABLES]
+        reads += [f"""
+            SELECT p.booking_id, 0 as charged, SUM(-r.amount) as refunded,
+                   MAX(r.created_at) >= NOW() - INTERVAL %s MINUTE as recent
+            FROM {charges} p JOIN {refunds} r ON r.refund_for = p.id
+            WHERE p.booking_id BETWEEN %s AND %s AND r.payment_status = 'completed'
+            GROUP BY p.booking_id
+        """ for charges in PAYMENT_TABLES for refunds in PAYMENT_TABLES]
+        for query in reads:
+            cursor.execute(query, (settle_minutes, low, high))
+            for row in cursor.fetchall():
+                charged, refunded, recent = totals.get(row['booking_id'], (ZERO, ZERO, False))
+                totals[row['booking_id']] = (
+                    charged + Decimal(row['charged'] or 0),
+                    refunded + Decimal(row['refunded'] or 0),
+                    recent or bool(row['recent'])
+                )
+    cursor.close()
+    conn.commit()  # end the snapshot so the next chunk reads fresh rows
+    return bookings, totals
+
+def compare(bookings, totals):
+    # Returns ({booking id: [(kind, row)]}, ids evaluated); settling
+    # bookings are not evaluated at all
+    found, evaluated = {}, []
+    for booking in bookings:
+        charged, refunded, payment_recent = totals.get(booking['id'], (ZERO, ZERO, False))
+        if booking['recent'] or payment_recent:
+            continue
+        evaluated.append(booking['id'])
+        kinds = classify(booking['status'], booking['payment_status'], booking['total_amount'], charged, refunded)
+        if kinds:
+            row = (booking['id'], booking['status'], booking['payment_status'], booking['total_amount'], charged, refunded)
+            found[booking['id']] = [(kind, row) for kind in kinds]
+    return found, evaluated
+
+def repair(cursor, bookings):
+    # Same writes as charge(): drop the booking's hold, mark it paid and
+    # confirm it if pending. The EXISTS re-checks the charge on the primary.
+    repaired = []
+    for booking in bookings:
+        cursor.execute("DELETE FROM room_holds WHERE booking_id = %s", (booking['id'],))
+        cursor.execute("""
+            UPDATE bookings SET payment_status = 'completed', status = IF(status = 'pending', 'confirmed', status)
+            WHERE id = %s AND check_out = %s AND payment_status <> 'completed' AND status <> 'cancelled'
+              AND (EXISTS (SELECT 1 FROM payments p WHERE p.booking_id = %s AND p.refund_for IS NULL
+                                AND p.amount > 0 AND p.payment_status = 'completed')
+                   OR EXISTS (SELECT 1 FROM payments_archive p WHERE p.booking_id = %s AND p.refund_for IS NULL
+                                   AND p.amount > 0 AND p.payment_status = 'completed'))
+        """, (booking['id'], booking['check_out'], booking['id'], booking['id']))
+        if cursor.rowcount:
+            repaired.append(booking)
+    emit_each(cursor, 'booking', 'reconcile', {
+        booking['id']: {
+            'status': 'confirmed' if booking['status'] == 'pending' else booking['status'],
+            'payment_status': 'completed', 'hotel_id': booking['hotel_id'],
+            'check_in': booking['check_in'], 'check_out': booking['check_out']
+        }
+        for booking in repaired
+    })
+    return repaired
+
+def record_chunk(conn, bookings, found, evaluated, next_id, auto_repair):
+    # One primary transaction per chunk: report rows, resolutions, repairs
+    # and the checkpoint move together
+    cursor = conn.cursor()
+    rows = [(*row, kind) for booking_id in found for kind, row in found[booking_id]]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO payment_discrepancies
+                (booking_id, booking_status, payment_status, total_amount, charged, refunded, kind,
+                 first_seen_at, last_seen_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+            ON DUPLICATE KEY UPDATE booking_status = VALUES(booking_status),
+                payment_status = VALUES(payment_status), total_amount = VALUES(total_amount),
+                charged = VALUES(charged), refunded = VALUES(refunded),
+                last_seen_at = VALUES(last_seen_at), resolved_at = NULL, repaired = FALSE
+        """, rows)
+
+    # Open findings for bookings now consistent are resolved
+    resolved = 0
+    if bookings:
+        cursor.execute("""
+            SELECT id, booking_id, kind FROM payment_discrepancies
+            WHERE booking_id BETWEEN %s AND %s AND resolved_at IS NULL
+        """, (bookings[0]['id'], bookings[-1]['id']))
+        evaluated_ids = set(evaluated)
+        current = {(booking_id, kind) for booking_id in found for kind, _ in found[booking_id]}
+        stale = [row[0] for row in cursor.fetchall() if row[1] in evaluated_ids and (row[1], row[2]) not in current]
+        if stale:
+            placeholders = ', '.join(['%s'] * len(stale))
+            cursor.execute(f"UPDATE payment_discrepancies SET resolved_at = NOW() WHERE id IN ({placeholders})", stale)
+            resolved = len(stale)
+
+    repaired = []
+    if auto_repair:
+        candidates = [
+            booking for booking in bookings
+            if any(kind in REPAIRABLE for kind, _ in found.get(booking['id'], ()))
+        ]
+        repaired = repair(cursor, candidates) if candidates else []
+        if repaired:
+            placeholders = ', '.join(['%s'] * len(repaired))
+            kinds = ', '.join(['%s'] * len(REPAIRABLE))
+            cursor.execute(f"""
+                UPDATE payment_discrepancies SET repaired = TRUE, resolved_at = NOW()
+                WHERE booking_id IN ({placeholders}) AND kind IN ({kinds})
+            """, (*[booking['id'] for booking in repaired], *REPAIRABLE))
+
+    # Past the last booking: start the next pass from the beginning
+    cursor.execute("""
+        INSERT INTO reconciliation_checkpoints (name, last_id, passes, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE last_id = VALUES(last_id), passes = passes + VALUES(passes),
+            updated_at = VALUES(updated_at)
+    """, (CHECKPOINT, next_id or 0, 0 if next_id else 1))
+    conn.commit()
+    cursor.close()
+
+    for booking in repaired:
+        trips.refresh_quietly(conn, user_id=booking['user_id'])
+    return len(rows), resolved, len(repaired)
+
+def reconcile(conn, source=None, auto_repair=AUTO_REPAIR, chunk_size=CHUNK_SIZE, max_seconds=MAX_SECONDS,
+              settle_minutes=SETTLE_MINUTES, duty_cycle=DUTY_CYCLE):
+    # conn: primary; source: where the scan reads (a replica, or conn)
+    source = source or conn
+    cursor = conn.cursor()
+    # One run at a time across workers; a second one just returns
+    cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+    if not cursor.fetchone()[0]:
+        cursor.close()
+        return {"skipped": "another reconciliation is running"}
+
+    report = {"chunks": 0, "bookings": 0, "skipped_settling": 0, "discrepancies": 0,
+              "resolved": 0, "repaired": 0, "pass_complete": False}
+    try:
+        after_id = get_checkpoint(conn)
+        report["started_after_id"] = after_id
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            bookings, totals = fetch_chunk(source, after_id, chunk_size, settle_minutes)
+            found, evaluated = compare(bookings, totals)
+            next_id = bookings[-1]['id'] if len(bookings) == chunk_size else None
+            discrepancies, resolved, repaired = record_chunk(conn, bookings, found, evaluated, next_id, auto_repair)
+
+            report["chunks"] += 1
+            report["bookings"] += len(bookings)
+            report["skipped_settling"] += len(bookings) - len(evaluated)
+            report["discrepancies"] += discrepancies
+            report["resolved"] += resolved
+            report["repaired"] += repaired
+            if next_id is None:
+                report["pass_complete"] = True
+                break
+            after_id = next_id
+            # Sleep in proportion to the work just done
+            elapsed = time.monotonic() - started
+            time.sleep(max(MIN_PAUSE, elapsed * (1 - duty_cycle) / duty_cycle))
+        report["checkpoint"] = 0 if report["pass_complete"] else after_id
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchone()
+        cursor.close()
+    return report
+
+def main():
+    from app import get_db_connection, get_replica_connection
+
+    parser = argparse.ArgumentParser(description="Reconcile booking payment state with payments and refunds")
+    parser.add_argument('--repair', action='store_true', default=AUTO_REPAIR)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--max-seconds', type=int, default=MAX_SECONDS)
+    parser.add_argument('--settle-minutes', type=int, default=SETTLE_MINUTES)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    source = get_replica_connection()
+    try:
+        report = reconcile(conn, source, args.repair, args.chunk_size, args.max_seconds, args.settle_minutes)
+    finally:
+        source.close()
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
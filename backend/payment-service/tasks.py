@@ -0,0 +1,414 @@
+import random
+import string
+from datetime import datetime
+
+import lifecycle
+import reconcile
+from common import events, ranking, trips
+
+# Live tables first, then the cold archives filled by partition maintenance
+BOOKING_TABLES = ('bookings', 'bookings_archive')
+PAYMENT_TABLES = ('payments', 'payments_archive')
+
+def generate_transaction_id():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+
+def card_last_four(data):
+    # Jobs are persisted, so only the last four digits ever leave the request
+    if data.get('card_last_four'):
+        return data['card_last_four']
+    return data.get('card_number', '')[-4:] if data.get('card_number') else ''
+
+# MySQL duplicate-key error
+DUPLICATE_KEY = 1062
+
+class PaymentRefused(ValueError):
+    pass
+
+def claim_transaction(cursor, transaction_id):
+    # Charges and refunds are retried by the job queue, so each carries a
+    # transaction id fixed when it was requested. Claiming it in the write's
+    # transaction makes a retry a no-op: returns None once claimed, or the
+    # payment already recorded under it. A concurrent duplicate waits on the
+    # key until the first commits (and finds it) or rolls back (and claims it).
+    try:
+        cursor.execute("INSERT INTO payment_requests (transaction_id) VALUES (%s)", (transaction_id,))
+        return None
+    except Exception as e:
+        if getattr(e, 'errno', None) != DUPLICATE_KEY:
+            raise
+    cursor.execute("SELECT payment_id FROM payment_requests WHERE transaction_id = %s", (transaction_id,))
+    return cursor.fetchone()[0]
+
+def recorded_payment(conn, payment_id):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT id, transaction_id, amount, currency, payment_status FROM payments WHERE id = %s
+    """, (payment_id,))
+    payment = cursor.fetchone()
+    cursor.close()
+    return payment
+
+def lock_booking(cursor, booking_id):
+    # Locks the booking's hold, then the booking (the order expire_holds
+    # locks them in), and refuses a charge for a booking that can no longer
+    # be confirmed: cancelled, or pending on a hold that has expired (its
+    # rooms may already be someone else's)
+    cursor.execute("SELECT expires_at > NOW(3) FROM room_holds WHERE booking_id = %s FOR UPDATE", (booking_id,))
+    hold = cursor.fetchone()
+    cursor.execute("SELECT status FROM bookings WHERE id = %s FOR UPDATE", (booking_id,))
+    booking = cursor.fetchone()
+    if not booking:
+        raise PaymentRefused("Booking not found")
+    if booking[0] == 'cancelled':
+        raise PaymentRefused("Booking is cancelled")
+    if booking[0] == 'pending' and not (hold and hold[0]):
+        raise PaymentRefused("Room hold has expired")
+
+def charge(conn, data):
+    cursor = conn.cursor()
+
+    # Fixed at enqueue time for queued charges, so a retry finds its payment
+    transaction_id = data.get('transaction_id') or generate_transaction_id()
+
+    # Simulate payment processing (always successful for demo)
+    payment_status = 'completed'
+
+    # One transaction: the booking is locked before the payment is written,
+    # so the sweepers (SKIP LOCKED) leave it alone and it is confirmed in the
+    # same commit as its payment
+    try:
+        existing = claim_transaction(cursor, transaction_id)
+        if existing is not None:
+            conn.rollback()
+            payment = recorded_payment(conn, existing)
+            return {
+                "payment_id": payment['id'],
+                "transaction_id": payment['transaction_id'],
+                "status": payment['payment_status'],
+                "amount": payment['amount'],
+                "currency": payment['currency'],
+                "message": "Payment already processed"
+            }
+
+        if data.get('booking_id'):
+            lock_booking(cursor, data['booking_id'])
+
+        # Store payment record
+        query = """
+        INSERT INTO payments (transaction_id, booking_id, amount, currency,
+                            payment_method, card_last_four, payment_status, gateway_response)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        params = (
+            transaction_id,
+            data.get('booking_id'),
+            data['amount'],
+            data.get('currency', 'USD'),
+            data['payment_method'],
+            card_last_four(data),
+            payment_status,
+            '{"status": "success", "gateway": "fake-gateway"}'
+        )
+
+        cursor.execute(query, params)
+        payment_id = cursor.lastrowid
+        cursor.execute("UPDATE payment_requests SET payment_id = %s WHERE transaction_id = %s", (payment_id, transaction_id))
+
+        # A booking made from a room hold is confirmed and the hold dropped
+        if data.get('booking_id'):
+            cursor.execute("DELETE FROM room_holds WHERE booking_id = %s", (data['booking_id'],))
+            cursor.execute("""
+                UPDATE bookings SET payment_status = %s, status = IF(status = 'pending', 'confirmed', status)
+                WHERE id = %s
+            """, (payment_status, data['booking_id']))
+        events.emit_each(cursor, 'payment', 'charge', {payment_id: {
+            'booking_id': data.get('booking_id'), 'amount': data['amount'], 'status': payment_status
+        }})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    if data.get('booking_id'):
+        trips.refresh_quietly(conn, booking_id=data['booking_id'])
+
+    return {
+        "payment_id": payment_id,
+        "transaction_id": transaction_id,
+        "status": payment_status,
+        "amount": data['amount'],
+        "currency": data.get('currency', 'USD'),
+        "message": "Payment processed successfully"
+    }
+
+def refund(conn, payment_id, amount=None, transaction_id=None):
+    cursor = conn.cursor()
+
+    # Get original payment
+    cursor.execute("""
+        SELECT booking_id, amount, currency, payment_method FROM payments WHERE id = %s
+    """, (payment_id,))
+    payment = cursor.fetchone()
+
+    if not payment:
+        cursor.close()
+        return None
+    booking_id, paid_amount, currency, payment_method = payment
+
+    # Create refund record; like charge(), a retried refund is recorded once
+    refund_amount = amount if amount is not None else paid_amount
+    transaction_id = transaction_id or generate_transaction_id()
+    existing = claim_transaction(cursor, transaction_id)
+    if existing is not None:
+        conn.rollback()
+        cursor.close()
+        recorded = recorded_payment(conn, existing)
+        return {
+            "refund_id": recorded['id'],
+            "transaction_id": recorded['transaction_id'],
+            "amount": -recorded['amount'],
+            "status": recorded['payment_status'],
+            "message": "Refund already processed"
+        }
+
+    query = """
+    INSERT INTO payments (transaction_id, booking_id, amount, currency,
+                        payment_method, payment_status, gateway_response, refund_for)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    params = (
+        transaction_id,
+        booking_id,
+        -refund_amount,  # negative amount for refund
+        currency,
+        payment_method,
+        'completed',
+        '{"status": "refund_success", "gateway": "fake-gateway"}',
+        payment_id
+    )
+
+    cursor.execute(query, params)
+    refund_id = cursor.lastrowid
+    cursor.execute("UPDATE payment_requests SET payment_id = %s WHERE transaction_id = %s", (refund_id, transaction_id))
+    events.emit_each(cursor, 'payment', 'refund', {refund_id: {
+        'booking_id': booking_id, 'amount': -refund_amount, 'refund_for': payment_id
+    }})
+    conn.commit()
+
+    cursor.close()
+
+    if booking_id:
+        trips.refresh_quietly(conn, booking_id=booking_id)
+
+    return {
+        "refund_id": refund_id,
+        "transaction_id": transaction_id,
+        "amount": refund_amount,
+        "status": "completed",
+        "message": "Refund processed successfully"
+    }
+
+def expire_holds(conn, batch_size=1000):
+    # Expired holds no longer count towards availability; this deletes them
+    # and cancels the pending bookings nobody paid for
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, booking_id FROM room_holds WHERE expires_at <= NOW(3)
+        ORDER BY expires_at LIMIT %s FOR UPDATE SKIP LOCKED
+    """, (batch_size,))
+    expired = cursor.fetchall()
+    cancelled = []
+    if expired:
+        booking_ids = [row[1] for row in expired if row[1]]
+        if booking_ids:
+            placeholders = ', '.join(['%s'] * len(booking_ids))
+            cursor.execute(f"""
+                SELECT id, hotel_id, check_in, check_out FROM bookings
+                WHERE id IN ({placeholders}) AND status = 'pending' FOR UPDATE
+            """, booking_ids)
+            cancelled = cursor.fetchall()
+        if cancelled:
+            placeholders = ', '.join(['%s'] * len(cancelled))
+            cursor.execute(f"UPDATE bookings SET status = 'cancelled' WHERE id IN ({placeholders})",
+                           [row[0] for row in cancelled])
+            events.emit_each(cursor, 'booking', 'expire_hold', {
+                row[0]: {'status': 'cancelled', 'hotel_id': row[1], 'check_in': row[2], 'check_out': row[3]}
+                for row in cancelled
+            })
+        placeholders = ', '.join(['%s'] * len(expired))
+        cursor.execute(f"DELETE FROM room_holds WHERE id IN ({placeholders})", [row[0] for row in expired])
+    conn.commit()
+    cursor.close()
+
+    for row in cancelled:
+        trips.refresh_quietly(conn, booking_id=row[0])
+    return {"expired": len(expired), "bookings_cancelled": len(cancelled)}
+
+def build_invoice(conn, booking_id):
+    cursor = conn.cursor(dictionary=True)
+
+    # Get booking details, falling back to the archive for old stays
+    booking = None
+    for table in BOOKING_TABLES:
+        query = f"""
+        SELECT b.*, h.name as hotel_name, h.location as hotel_location,
+               u.username, u.email
+        FROM {table} b
+        JOIN hotels h ON b.hotel_id = h.id
+        JOIN users u ON b.user_id = u.id
+        WHERE b.id = %s
+        """
+        cursor.execute(query, (booking_id,))
+        booking = cursor.fetchone()
+        if booking:
+            break
+
+    if not booking:
+        cursor.close()
+        return None
+
+    # Get payment details
+    payment = None
+    for table in PAYMENT_TABLES:
+        cursor.execute(f"SELECT * FROM {table} WHERE booking_id = %s AND amount > 0", (booking_id,))
+        payment = cursor.fetchone()
+        if payment:
+            break
+
+    cursor.close()
+
+    # Calculate invoice details
+    nights = (datetime.strptime(booking['check_out'], '%Y-%m-%d') -
+             datetime.strptime(booking['check_in'], '%Y-%m-%d')).days
+    subtotal = booking['total_amount']
+    tax_rate = 0.1  # 10% tax
+    tax_amount = subtotal * tax_rate
+    total = subtotal + tax_amount
+
+    return {
+        "invoice_id": f"INV-{booking['id']}-{datetime.now().strftime('%Y%m%d')}",
+        "booking_ref": booking['booking_ref'],
+        "hotel_name": booking['hotel_name'],
+        "hotel_location": booking['hotel_location'],
+        "guest_name": booking['username'],
+        "guest_email": booking['email'],
+        "check_in": booking['check_in'],
+        "check_out": booking['check_out'],
+        "nights": nights,
+        "room_type": booking['room_type'],
+        "guests": booking['guests'],
+        "subtotal": subtotal,
+        "tax_rate": tax_rate,
+        "tax_amount": tax_amount,
+        "total": total,
+        "payment_status": payment['payment_status'] if payment else 'pending',
+        "payment_method": payment['payment_method'] if payment else None,
+        "transaction_id": payment['transaction_id'] if payment else None,
+        "invoice_date": datetime.now().strftime('%Y-%m-%d'),
+        "due_date": booking['check_in']
+    }
+
+def payment_stats(conn):
+    cursor = conn.cursor(dictionary=True)
+
+    # Get payment statistics
+    queries = {
+        'total_payments': "SELECT COUNT(*) as count, SUM(amount) as total FROM payments WHERE amount > 0",
+        'successful_payments': "SELECT COUNT(*) as count FROM payments WHERE payment_status = 'completed' AND amount > 0",
+        'failed_payments': "SELECT COUNT(*) as count FROM payments WHERE payment_status = 'failed'",
+        'refunds': "SELECT COUNT(*) as count, SUM(ABS(amount)) as total FROM payments WHERE amount < 0"
+    }
+
+    stats = {}
+    for key, query in queries.items():
+        cursor.execute(query)
+        result = cursor.fetchone()
+        stats[key] = result
+
+    cursor.close()
+    return stats
+
+def register_tasks(queue, get_connection, get_replica_connection=None):
+    # Each task opens its own connection; a raised exception is retried with
+    # backoff and dead-lettered after max_attempts. Long read-only scans use
+    # get_replica_connection when given.
+
+    def with_connection(work):
+        conn = get_connection()
+        try:
+            return work(conn)
+        finally:
+            conn.close()
+
+    @queue.task('payments.charge', priority=10)
+    def charge_task(payload):
+        # A refusal is final; retrying would not change it
+        try:
+            return with_connection(lambda conn: charge(conn, payload))
+        except PaymentRefused as e:
+            return {"error": str(e)}
+
+    @queue.task('payments.refund', priority=10)
+    def refund_task(payload):
+        result = with_connection(lambda conn: refund(conn, payload['payment_id'], payload.get('amount'), payload.get('transaction_id')))
+        return result or {"error": "Payment not found"}
+
+    @queue.task('payments.invoice', priority=5)
+    def invoice_task(payload):
+        invoice = with_connection(lambda conn: build_invoice(conn, payload['booking_id']))
+        return invoice or {"error": "Booking not found"}
+
+    @queue.task('payments.stats')
+    def stats_task(payload):
+        return with_connection(payment_stats)
+
+    @queue.task('maintenance.prune_change_events', priority=-10, max_attempts=3)
+    def prune_change_events(payload):
+        return {"deleted": with_connection(lambda conn: events.prune(conn, payload.get('older_than_hours', 24)))}
+
+    @queue.task('maintenance.expire_holds', priority=5, max_attempts=3)
+    def expire_holds_task(payload):
+        return with_connection(lambda conn: expire_holds(conn, payload.get('batch_size', 1000)))
+
+    @queue.task('maintenance.booking_lifecycle', priority=-5, max_attempts=3)
+    def booking_lifecycle_task(payload):
+        if payload.get('dry_run'):
+            return with_connection(lifecycle.dry_run)
+        return with_connection(lambda conn: lifecycle.sweep(conn, payload.get('batch_size', lifecycle.BATCH_SIZE)))
+
+    @queue.task('maintenance.reconcile_payments', priority=-10, max_attempts=3)
+    def reconcile_payments_task(payload):
+        def run(conn):
+            source = get_replica_connection() if get_replica_connection else conn
+            try:
+                return reconcile.reconcile(
+                    conn, source,
+                    auto_repair=payload.get('repair', reconcile.AUTO_REPAIR),
+                    chunk_size=payload.get('chunk_size', reconcile.CHUNK_SIZE),
+                    max_seconds=payload.get('max_seconds', reconcile.MAX_SECONDS)
+                )
+            finally:
+                if source is not conn:
+                    source.close()
+        return with_connection(run)
+
+    @queue.task('maintenance.hotel_rankings', priority=-5, max_attempts=3)
+    def hotel_rankings_task(payload):
+        return with_connection(lambda conn: ranking.refresh(conn, payload.get('batch_size', ranking.BATCH_SIZE)))
+
+    @queue.task('maintenance.prune_jobs', priority=-10, max_attempts=3)
+    def prune_jobs(payload):
+        return {"deleted": queue.prune(payload.get('older_than_hours', 72))}
+
+# Recurring jobs registered by the worker on start-up: (name, task, seconds, payload)
+SCHEDULES = (
+    ('prune-change-events', 'maintenance.prune_change_events', 3600, {'older_than_hours': 24}),
+    ('prune-jobs', 'maintenance.prune_jobs', 86400, {'older_than_hours': 72}),
+    ('expire-room-holds', 'maintenance.expire_holds', 60, {'batch_size': 1000}),
+    ('booking-lifecycle', 'maintenance.booking_lifecycle', 300, {'batch_size': 500}),
+    ('hotel-rankings', 'maintenance.hotel_rankings', 900, {'batch_size': 1000}),
+    ('reconcile-payments', 'maintenance.reconcile_payments', 3600, {'chunk_size': 1000, 'max_seconds': 600}),
+)
@@ -0,0 +1,21 @@
+import argparse
+import os
+
+from common.jobs import run_workers
+from app import jobs
+from tasks import SCHEDULES
+
+def main():
+    parser = argparse.ArgumentParser(description="Run payment-service background job workers")
+    parser.add_argument('--queues', default=os.getenv('JOB_QUEUES', 'default'))
+    parser.add_argument('--processes', type=int, default=int(os.getenv('JOB_WORKER_PROCESSES', 2)))
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('JOB_POLL_INTERVAL', 1.0)))
+    args = parser.parse_args()
+
+    for name, task, interval, payload in SCHEDULES:
+        jobs.schedule(name, task, interval, payload)
+
+    run_workers(jobs, args.queues.split(','), args.processes, args.poll_interval)
+
+if __name__ == '__main__':
+    main()
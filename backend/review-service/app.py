@@ -1,29 +1,51 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import mysql.connector
-import os
+from flask import Blueprint, request, jsonify
+from common.admission import Admission
+from common.deadline import Deadlines
+from common.service import create_service, load_config, mysql_pool, run
+from common.responses import FieldSelectionError, select_fields
 from datetime import datetime
 
-app = Flask(__name__)
-CORS(app)
+config = load_config('review-service', port=84)
+bp = Blueprint('reviews', __name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'mysql-db'),
-    'user': os.getenv('DB_USER', 'hotel_user'),
-    'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
-    'database': os.getenv('DB_NAME', 'hotel_booking'),
-    'port': int(os.getenv('DB_PORT', 3306))
+REVIEW_FIELDS = {
+    'id': 'r.id',
+    'hotel_id': 'r.hotel_id',
+    'user_id': 'r.user_id',
+    'booking_id': 'r.booking_id',
+    'rating': 'r.rating',
+    'comment': 'r.comment',
+    'created_at': 'r.created_at',
+    'updated_at': 'r.updated_at',
+    'username': 'u.username',
+    'hotel_name': 'h.name',
 }
 
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+USER_REVIEW_FIELDS = {
+    **{name: expr for name, expr in REVIEW_FIELDS.items() if name != 'username'},
+    'hotel_location': 'h.location',
+}
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/reviews', ('GET',), 'low', None),
+    ('/api/reviews', ('POST', 'PUT', 'DELETE'), 'normal', None),
+)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "service": "review-service"})
+# Request budgets in seconds where the REQUEST_BUDGET_MS default does not fit
+DEADLINE_ROUTES = (
+    ('/api/reviews', ('GET',), 3),
+)
+
+deadlines = Deadlines.from_env(DEADLINE_ROUTES, mysql_pool.connect)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='low')
+
+def get_db_connection():
+    # Statements are bounded by the request deadline; their latency drives
+    # the adaptive concurrency limit
+    return admission.connect(deadlines.connect, **config.db)
 
-@app.route('/api/reviews', methods=['POST'])
+@bp.route('/api/reviews', methods=['POST'])
 def create_review():
     try:
         data = request.json
@@ -56,14 +78,15 @@ def create_review():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews/hotel/<int:hotel_id>', methods=['GET'])
+@bp.route('/api/reviews/hotel/<int:hotel_id>', methods=['GET'])
 def get_hotel_reviews(hotel_id):
     try:
+        columns = select_fields(REVIEW_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT r.*, u.username, h.name as hotel_name
+        query = f"""
+        SELECT {columns}
         FROM reviews r
         JOIN users u ON r.user_id = u.id
         JOIN hotels h ON r.hotel_id = h.id
@@ -77,17 +100,20 @@ def get_hotel_reviews(hotel_id):
         conn.close()
         
         return jsonify(reviews)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews', methods=['GET'])
+@bp.route('/api/reviews', methods=['GET'])
 def get_all_reviews():
     try:
+        columns = select_fields(REVIEW_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT r.*, u.username, h.name as hotel_name
+        query = f"""
+        SELECT {columns}
         FROM reviews r
         JOIN users u ON r.user_id = u.id
         JOIN hotels h ON r.hotel_id = h.id
@@ -100,10 +126,12 @@ def get_all_reviews():
         conn.close()
         
         return jsonify(reviews)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews/<int:review_id>', methods=['PUT'])
+@bp.route('/api/reviews/<int:review_id>', methods=['PUT'])
 def update_review(review_id):
     try:
         data = request.json
@@ -131,7 +159,7 @@ def update_review(review_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews/<int:review_id>', methods=['DELETE'])
+@bp.route('/api/reviews/<int:review_id>', methods=['DELETE'])
 def delete_review(review_id):
     try:
         conn = get_db_connection()
@@ -147,7 +175,7 @@ def delete_review(review_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews/<int:review_id>/like', methods=['POST'])
+@bp.route('/api/reviews/<int:review_id>/like', methods=['POST'])
 def like_review(review_id):
     try:
         data = request.json
@@ -179,14 +207,15 @@ def like_review(review_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews/user/<int:user_id>', methods=['GET'])
+@bp.route('/api/reviews/user/<int:user_id>', methods=['GET'])
 def get_user_reviews(user_id):
     try:
+        columns = select_fields(USER_REVIEW_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT r.*, h.name as hotel_name, h.location as hotel_location
+        query = f"""
+        SELECT {columns}
         FROM reviews r
         JOIN hotels h ON r.hotel_id = h.id
         WHERE r.user_id = %s
@@ -199,10 +228,12 @@ def get_user_reviews(user_id):
         conn.close()
         
         return jsonify(reviews)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reviews/stats/<int:hotel_id>', methods=['GET'])
+@bp.route('/api/reviews/stats/<int:hotel_id>', methods=['GET'])
 def get_review_stats(hotel_id):
     try:
         conn = get_db_connection()
@@ -230,5 +261,10 @@ def get_review_stats(hotel_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=84, debug=True)
\ No newline at end of file
+    run(app, config)
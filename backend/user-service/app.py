@@ -1,28 +1,39 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import mysql.connector
-import os
+from flask import Blueprint, current_app, request, jsonify
 import hashlib
 import jwt
+from common.admission import Admission
+from common.deadline import Deadlines
+from common.events import emit
+from common.query import Statement, fetch_one
+from common.service import create_service, load_config, mysql_pool, run
+from common.responses import FieldSelectionError, select_fields
 from datetime import datetime, timedelta
 
-app = Flask(__name__)
-CORS(app)
+config = load_config('user-service', port=83)
+bp = Blueprint('users', __name__)
 
-# Configuration
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+USER_FIELDS = {name: name for name in ('id', 'username', 'email', 'phone', 'role', 'created_at')}
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'mysql-db'),
-    'user': os.getenv('DB_USER', 'hotel_user'),
-    'password': os.getenv('DB_PASSWORD', 'hotel_pass'),
-    'database': os.getenv('DB_NAME', 'hotel_booking'),
-    'port': int(os.getenv('DB_PORT', 3306))
-}
+# Token check behind every authenticated call, prepared once per pooled connection
+TOKEN_USER = Statement('token_user', "SELECT id, username, email, role FROM users WHERE id = %s",
+                       ('id', 'username', 'email', 'role'))
+
+# Priority classes for admission control: (prefix, methods, class, concurrency cap)
+ADMISSION_ROUTES = (
+    ('/api/auth', None, 'critical', None),
+    ('/api/users', None, 'normal', None),
+)
+
+# Request budgets in seconds where the REQUEST_BUDGET_MS default does not fit
+DEADLINE_ROUTES = ()
+
+deadlines = Deadlines.from_env(DEADLINE_ROUTES, mysql_pool.connect)
+admission = Admission.from_env(ADMISSION_ROUTES, default_class='normal')
 
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    # Statements are bounded by the request deadline; their latency drives
+    # the adaptive concurrency limit
+    return admission.connect(deadlines.connect, **config.db)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -32,13 +43,9 @@ def generate_token(user_id):
         'user_id': user_id,
         'exp': datetime.utcnow() + timedelta(hours=24)
     }
-    return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "service": "user-service"})
+    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
 
-@app.route('/api/auth/register', methods=['POST'])
+@bp.route('/api/auth/register', methods=['POST'])
 def register():
     try:
         data = request.json
@@ -65,8 +72,9 @@ def register():
         )
         
         cursor.execute(query, params)
-        conn.commit()
         user_id = cursor.lastrowid
+        emit(cursor, 'user', [user_id], 'create')
+        conn.commit()
         
         cursor.close()
         conn.close()
@@ -83,7 +91,7 @@ def register():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/auth/login', methods=['POST'])
+@bp.route('/api/auth/login', methods=['POST'])
 def login():
     try:
         data = request.json
@@ -118,7 +126,7 @@ def login():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/users/<int:user_id>', methods=['GET'])
+@bp.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     try:
         conn = get_db_connection()
@@ -137,7 +145,7 @@ def get_user(user_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/users/<int:user_id>', methods=['PUT'])
+@bp.route('/api/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     try:
         data = request.json
@@ -156,6 +164,7 @@ def update_user(user_id):
         )
         
         cursor.execute(query, params)
+        emit(cursor, 'user', [user_id], 'update')
         conn.commit()
         
         cursor.close()
@@ -165,23 +174,26 @@ def update_user(user_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/users', methods=['GET'])
+@bp.route('/api/users', methods=['GET'])
 def get_users():
     try:
+        columns = select_fields(USER_FIELDS)
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("SELECT id, username, email, phone, role, created_at FROM users ORDER BY created_at DESC")
+        cursor.execute(f"SELECT {columns} FROM users ORDER BY created_at DESC")
         users = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
         return jsonify(users)
+    except FieldSelectionError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/auth/verify', methods=['POST'])
+@bp.route('/api/auth/verify', methods=['POST'])
 def verify_token():
     try:
         data = request.json
@@ -190,16 +202,11 @@ def verify_token():
         if not token:
             return jsonify({"error": "Token required"}), 400
         
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
         user_id = payload['user_id']
         
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("SELECT id, username, email, role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        
-        cursor.close()
+        user = fetch_one(conn, TOKEN_USER, (user_id,), as_dict=True)
         conn.close()
         
         if user:
@@ -216,5 +223,10 @@ def verify_token():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def create_app():
+    return create_service(config, [bp], deadlines, admission)
+
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=83, debug=True)
\ No newline at end of file
+    run(app, config)
@@ -0,0 +1,51 @@
+USE hotel_booking;
+
+-- Partition bookings by check_out month and payments by created_at month.
+-- MySQL does not support foreign keys on partitioned tables, and every unique
+-- key must include the partitioning column, so the keys are reshaped first.
+
+-- Drop foreign keys that point at or live on the partitioned tables
+ALTER TABLE reviews DROP FOREIGN KEY reviews_ibfk_3;
+ALTER TABLE payments DROP FOREIGN KEY payments_ibfk_1, DROP FOREIGN KEY payments_ibfk_2;
+ALTER TABLE bookings DROP FOREIGN KEY bookings_ibfk_1, DROP FOREIGN KEY bookings_ibfk_2;
+
+-- Bookings: include check_out in the primary and unique keys. booking_ref
+-- alone is no longer unique here; booking_refs (20261019240000) enforces it
+ALTER TABLE bookings
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, check_out),
+    DROP INDEX booking_ref,
+    ADD UNIQUE KEY uq_bookings_ref (booking_ref, check_out),
+    ADD INDEX idx_bookings_ref (booking_ref);
+
+ALTER TABLE bookings
+PARTITION BY RANGE COLUMNS (check_out) (
+    PARTITION p_history VALUES LESS THAN ('2024-01-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- Payments: include created_at in the primary and unique keys
+ALTER TABLE payments
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at),
+    DROP INDEX transaction_id,
+    ADD UNIQUE KEY uq_payments_transaction (transaction_id, created_at),
+    ADD INDEX idx_payments_refund_for (refund_for);
+
+ALTER TABLE payments
+PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+    PARTITION p_history VALUES LESS THAN (UNIX_TIMESTAMP('2024-01-01 00:00:00')),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- Cold archive tables, same columns and indexes, compressed and unpartitioned
+CREATE TABLE IF NOT EXISTS bookings_archive LIKE bookings;
+ALTER TABLE bookings_archive REMOVE PARTITIONING;
+ALTER TABLE bookings_archive ROW_FORMAT=COMPRESSED;
+
+CREATE TABLE IF NOT EXISTS payments_archive LIKE payments;
+ALTER TABLE payments_archive REMOVE PARTITIONING;
+ALTER TABLE payments_archive ROW_FORMAT=COMPRESSED;
+
+-- Monthly partitions are created ahead of time and closed ones archived by
+-- backend/admin-dashboard/partitions.py (see k8s/partition-maintenance.yaml)
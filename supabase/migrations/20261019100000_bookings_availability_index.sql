@@ -0,0 +1,5 @@
+USE hotel_booking;
+
+-- Serves availability checks, quotes and calendars: equality on hotel and
+-- status, then a range on check_out with check_in read from the index
+CREATE INDEX idx_bookings_hotel_status_dates ON bookings(hotel_id, status, check_out, check_in);
@@ -0,0 +1,14 @@
+USE hotel_booking;
+
+-- Incremental export watermarks, one row per exported table
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    table_name VARCHAR(64) PRIMARY KEY,
+    last_updated_at TIMESTAMP NULL,
+    last_id INT NOT NULL DEFAULT 0,
+    exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Exports walk each table in (updated_at, id) order
+CREATE INDEX idx_bookings_updated ON bookings(updated_at, id);
+CREATE INDEX idx_payments_updated ON payments(updated_at, id);
+CREATE INDEX idx_reviews_updated ON reviews(updated_at, id);
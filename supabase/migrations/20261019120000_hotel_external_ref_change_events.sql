@@ -0,0 +1,18 @@
+USE hotel_booking;
+
+-- Stable key from channel-manager feeds, used by the bulk catalogue import
+ALTER TABLE hotels
+    ADD COLUMN external_ref VARCHAR(100) NULL AFTER id,
+    ADD UNIQUE KEY uq_hotels_external_ref (external_ref);
+
+-- Outbox of data changes; services that cache hotels, bookings, etc. poll it
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(32) NOT NULL,
+    entity_id INT NOT NULL,
+    action VARCHAR(16) NOT NULL,
+    payload JSON NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_change_events_entity (entity, id),
+    INDEX idx_change_events_created (created_at)
+);
@@ -0,0 +1,13 @@
+USE hotel_booking;
+
+-- Per-night overrides of a hotel's allotment and rate. NULL rooms/price fall
+-- back to hotels.rooms/hotels.price; closed nights cannot be sold.
+CREATE TABLE IF NOT EXISTS hotel_inventory (
+    hotel_id INT NOT NULL,
+    night DATE NOT NULL,
+    rooms INT NULL,
+    price DECIMAL(10, 2) NULL,
+    closed TINYINT(1) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (hotel_id, night)
+);
@@ -0,0 +1,43 @@
+USE hotel_booking;
+
+-- Durable background jobs; workers claim due rows with FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    queue VARCHAR(32) NOT NULL DEFAULT 'default',
+    task VARCHAR(64) NOT NULL,
+    payload JSON NULL,
+    status ENUM('queued', 'running', 'succeeded', 'dead') NOT NULL DEFAULT 'queued',
+    priority INT NOT NULL DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at DATETIME(3) NOT NULL,
+    locked_by VARCHAR(64) NULL,
+    locked_at DATETIME(3) NULL,
+    result JSON NULL,
+    last_error TEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_jobs_claim (status, queue, priority, run_at),
+    INDEX idx_jobs_running (status, locked_at)
+);
+
+-- Jobs that exhausted their attempts, kept for inspection and manual retry
+CREATE TABLE IF NOT EXISTS jobs_dead_letter (
+    job_id BIGINT PRIMARY KEY,
+    queue VARCHAR(32) NOT NULL,
+    task VARCHAR(64) NOT NULL,
+    payload JSON NULL,
+    attempts INT NOT NULL,
+    last_error TEXT NULL,
+    failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Recurring jobs; whichever worker locks a due row enqueues the next run
+CREATE TABLE IF NOT EXISTS job_schedules (
+    name VARCHAR(64) PRIMARY KEY,
+    queue VARCHAR(32) NOT NULL DEFAULT 'default',
+    task VARCHAR(64) NOT NULL,
+    payload JSON NULL,
+    interval_seconds INT NOT NULL,
+    next_run_at DATETIME(3) NOT NULL
+);
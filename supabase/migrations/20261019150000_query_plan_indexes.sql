@@ -0,0 +1,19 @@
+USE hotel_booking;
+
+-- Indexes proposed by backend/common/plancheck.py for request paths that
+-- sorted or scanned whole tables
+
+-- Reviews of a hotel or a user, and the review feed, newest first
+ALTER TABLE reviews
+    ADD INDEX idx_reviews_hotel_created (hotel_id, created_at),
+    ADD INDEX idx_reviews_user_created (user_id, created_at),
+    ADD INDEX idx_reviews_created (created_at);
+
+-- User listings, newest first
+CREATE INDEX idx_users_created ON users (created_at);
+
+-- Latest bookings on the admin dashboard
+CREATE INDEX idx_bookings_created ON bookings (created_at);
+
+-- Revenue ranges and sums are answered from the index alone
+CREATE INDEX idx_payments_created_amount ON payments (created_at, amount);
@@ -0,0 +1,8 @@
+USE hotel_booking;
+
+-- Hotel coordinates for map and "near me" search. hotel-service answers
+-- those from a grid index in its catalogue snapshot (backend/hotel-service/
+-- catalogue.py), so the columns themselves need no spatial index
+ALTER TABLE hotels
+    ADD COLUMN latitude DECIMAL(9, 6) NULL AFTER location,
+    ADD COLUMN longitude DECIMAL(9, 6) NULL AFTER latitude;
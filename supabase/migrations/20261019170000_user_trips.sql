@@ -0,0 +1,23 @@
+USE hotel_booking;
+
+-- "My Trips" pages read one user's stays by check-in date, keyset paged
+-- (backend/booking-service/itinerary.py)
+ALTER TABLE bookings ADD INDEX idx_bookings_user_checkin (user_id, check_in, id);
+ALTER TABLE bookings_archive ADD INDEX idx_bookings_user_checkin (user_id, check_in, id);
+
+-- Per-user trip summary, refreshed after booking and payment writes
+-- (backend/common/trips.py)
+CREATE TABLE IF NOT EXISTS user_trip_summary (
+    user_id INT PRIMARY KEY,
+    upcoming INT NOT NULL DEFAULT 0,
+    past INT NOT NULL DEFAULT 0,
+    cancelled INT NOT NULL DEFAULT 0,
+    lifetime_spend DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    next_booking_id INT NULL,
+    next_booking_ref VARCHAR(50) NULL,
+    next_hotel_id INT NULL,
+    next_hotel_name VARCHAR(255) NULL,
+    next_check_in DATE NULL,
+    next_check_out DATE NULL,
+    refreshed_at TIMESTAMP NULL
+);
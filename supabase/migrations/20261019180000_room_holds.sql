@@ -0,0 +1,30 @@
+USE hotel_booking;
+
+-- A booking may take several rooms (one converted from a multi-room hold)
+ALTER TABLE bookings ADD COLUMN rooms INT NOT NULL DEFAULT 1 AFTER guests;
+ALTER TABLE bookings_archive ADD COLUMN rooms INT NOT NULL DEFAULT 1 AFTER guests;
+
+-- Availability reads rooms too; keep the index covering
+ALTER TABLE bookings
+    DROP INDEX idx_bookings_hotel_status_dates,
+    ADD INDEX idx_bookings_hotel_status_dates (hotel_id, status, check_out, check_in, rooms);
+
+-- Short-lived room reservations taken during checkout
+-- (backend/booking-service/holds.py). Rows only live until they expire or
+-- their booking is paid, so the table stays small.
+CREATE TABLE IF NOT EXISTS room_holds (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    hold_token CHAR(32) NOT NULL,
+    hotel_id INT NOT NULL,
+    user_id INT NULL,
+    check_in DATE NOT NULL,
+    check_out DATE NOT NULL,
+    rooms INT NOT NULL DEFAULT 1,
+    booking_id INT NULL,
+    expires_at DATETIME(3) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_room_holds_token (hold_token),
+    INDEX idx_room_holds_hotel_dates (hotel_id, check_out, check_in),
+    INDEX idx_room_holds_expires (expires_at),
+    INDEX idx_room_holds_booking (booking_id)
+);
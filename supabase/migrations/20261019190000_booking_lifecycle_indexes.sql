@@ -0,0 +1,8 @@
+USE hotel_booking;
+
+-- Index ranges walked by the booking lifecycle sweeper
+-- (backend/payment-service/lifecycle.py): stays to complete and pending
+-- bookings to expire, and confirmed bookings still unpaid
+ALTER TABLE bookings
+    ADD INDEX idx_bookings_status_checkout (status, check_out),
+    ADD INDEX idx_bookings_status_payment_created (status, payment_status, created_at);
@@ -0,0 +1,17 @@
+USE hotel_booking;
+
+-- Admin booking search (backend/admin-dashboard/booking_search.py): each
+-- filter leads an index ordered newest first, so keyset pages and the CSV
+-- export read index ranges instead of sorting. booking_ref prefixes use
+-- idx_bookings_ref, unfiltered searches idx_bookings_created.
+ALTER TABLE bookings
+    ADD INDEX idx_bookings_hotel_created (hotel_id, created_at, id),
+    ADD INDEX idx_bookings_user_created (user_id, created_at, id),
+    ADD INDEX idx_bookings_status_created (status, created_at, id);
+
+-- ?archive=true searches the archive too
+ALTER TABLE bookings_archive
+    ADD INDEX idx_bookings_created (created_at),
+    ADD INDEX idx_bookings_hotel_created (hotel_id, created_at, id),
+    ADD INDEX idx_bookings_user_created (user_id, created_at, id),
+    ADD INDEX idx_bookings_status_created (status, created_at, id);
@@ -0,0 +1,29 @@
+USE hotel_booking;
+
+-- Payment/booking reconciliation (backend/payment-service/reconcile.py).
+-- One row per (booking, kind) while the mismatch lasts; resolved_at is set
+-- once a later pass finds the booking consistent or the job repairs it.
+CREATE TABLE IF NOT EXISTS payment_discrepancies (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    booking_id INT NOT NULL,
+    kind VARCHAR(40) NOT NULL,
+    booking_status VARCHAR(20) NOT NULL,
+    payment_status VARCHAR(20) NOT NULL,
+    total_amount DECIMAL(10, 2) NOT NULL,
+    charged DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    refunded DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    repaired BOOLEAN NOT NULL DEFAULT FALSE,
+    first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    resolved_at TIMESTAMP NULL,
+    UNIQUE KEY uq_payment_discrepancies_booking_kind (booking_id, kind),
+    INDEX idx_payment_discrepancies_open (resolved_at, last_seen_at)
+);
+
+-- Where the next run resumes; last_id 0 starts a new pass
+CREATE TABLE IF NOT EXISTS reconciliation_checkpoints (
+    name VARCHAR(50) PRIMARY KEY,
+    last_id INT NOT NULL DEFAULT 0,
+    passes INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
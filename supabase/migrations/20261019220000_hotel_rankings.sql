@@ -0,0 +1,21 @@
+USE hotel_booking;
+
+-- Per-hotel ranking scores (backend/common/ranking.py), refreshed by the
+-- maintenance.hotel_rankings job and folded into hotel-service's catalogue
+-- snapshot for sort=popular|rating
+CREATE TABLE IF NOT EXISTS hotel_rankings (
+    hotel_id INT PRIMARY KEY,
+    bookings_7d INT NOT NULL DEFAULT 0,
+    bookings_30d INT NOT NULL DEFAULT 0,
+    velocity DOUBLE NOT NULL DEFAULT 0,
+    review_count INT NOT NULL DEFAULT 0,
+    rating_avg DOUBLE NULL,
+    bayes_rating DOUBLE NOT NULL DEFAULT 0,
+    review_likes INT NOT NULL DEFAULT 0,
+    conversion DOUBLE NOT NULL DEFAULT 0,
+    popularity DOUBLE NOT NULL DEFAULT 0,
+    computed_at TIMESTAMP NULL
+);
+
+-- The per-hotel review aggregate reads this index alone
+CREATE INDEX idx_reviews_hotel_rating ON reviews (hotel_id, rating);
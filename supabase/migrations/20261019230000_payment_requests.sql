@@ -0,0 +1,12 @@
+USE hotel_booking;
+
+-- Idempotency keys for charges and refunds (backend/payment-service/tasks.py).
+-- payments is partitioned by created_at, so transaction_id can no longer be
+-- unique there; a retried or requeued job claims its transaction id here in
+-- the same transaction as the payment row and finds the earlier payment
+-- instead of writing a second one.
+CREATE TABLE IF NOT EXISTS payment_requests (
+    transaction_id VARCHAR(100) PRIMARY KEY,
+    payment_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,21 @@
+USE hotel_booking;
+
+-- Global uniqueness for booking references. Partitioning bookings by
+-- check_out (20261019090000) leaves uq_bookings_ref on (booking_ref,
+-- check_out), which only rejects a repeated ref for the same check-out date,
+-- and bookings_archive has no key across the two tables at all. Every ref is
+-- claimed here first, in the booking's own transaction; create_booking draws
+-- a fresh ref on a duplicate key. The trade-off is one extra row and primary
+-- key insert per booking, and refs stay reserved after their booking is
+-- archived, which is what keeps them from being reused.
+CREATE TABLE IF NOT EXISTS booking_refs (
+    booking_ref VARCHAR(50) PRIMARY KEY,
+    booking_id INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO booking_refs (booking_ref, booking_id, created_at)
+SELECT booking_ref, id, created_at FROM bookings_archive;
+
+INSERT IGNORE INTO booking_refs (booking_ref, booking_id, created_at)
+SELECT booking_ref, id, created_at FROM bookings;